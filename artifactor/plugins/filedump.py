@@ -13,8 +13,10 @@ artifactor:
 
 from artifactor import ArtifactorBasePlugin
 import base64
+import hashlib
 import os
 import re
+import shutil
 
 from cfme.utils import normalize_text, safe_string
 
@@ -23,6 +25,7 @@ class Filedump(ArtifactorBasePlugin):
 
     def plugin_initialize(self):
         self.register_plugin_hook('filedump', self.filedump)
+        self.register_plugin_hook('filedump_chunk', self.filedump_chunk)
         self.register_plugin_hook('sanitize', self.sanitize)
         self.register_plugin_hook('pre_start_test', self.start_test)
         self.register_plugin_hook('finish_test', self.finish_test)
@@ -43,11 +46,42 @@ class Filedump(ArtifactorBasePlugin):
         if not slaveid:
             slaveid = "Master"
 
+    @staticmethod
+    def _staged_filename(artifact_dir, transfer_id):
+        staging_dir = os.path.join(artifact_dir, '.staging')
+        if not os.path.isdir(staging_dir):
+            os.makedirs(staging_dir)
+        return os.path.join(staging_dir, transfer_id)
+
+    @staticmethod
+    def _sha1(filename):
+        digest = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @ArtifactorBasePlugin.check_configured
+    def filedump_chunk(self, transfer_id, chunk, artifact_dir):
+        """Appends a chunk of streamed filedump contents to its staging file"""
+        with open(self._staged_filename(artifact_dir, transfer_id), 'ab') as f:
+            f.write(base64.b64decode(chunk))
+
     @ArtifactorBasePlugin.check_configured
     def filedump(self, description, contents, slaveid=None, mode="w", contents_base64=False,
                  display_type="primary", display_glyph=None, file_type=None,
                  dont_write=False, os_filename=None, group_id=None, test_name=None,
-                 test_location=None):
+                 test_location=None, contents_path=None, contents_transfer=None,
+                 contents_sha1=None, artifact_dir=None):
+        """Writes an artifact file
+
+        The contents are either passed in ``contents``, or, for large artifacts, already sitting
+        in a staging file: written by the test process at ``contents_path``, or streamed with
+        ``filedump_chunk`` hooks as ``contents_transfer``. Staged files are checked against
+        ``contents_sha1`` and moved into place.
+        """
+        if contents_transfer is not None:
+            contents_path = self._staged_filename(artifact_dir, contents_transfer)
         if not slaveid:
             slaveid = "Master"
         test_ident = "{}/{}".format(self.store[slaveid]['test_location'],
@@ -68,6 +102,22 @@ class Filedump(ArtifactorBasePlugin):
                 os_filename = os_filename + ".ogv"
             else:
                 os_filename = os_filename + ".txt"
+        if contents_path is not None:
+            if self._sha1(contents_path) != contents_sha1:
+                # not linked in the report, the file is never written
+                print("Checksum mismatch for {}, discarding it".format(description))
+                os.remove(contents_path)
+                return None, {'artifacts': {test_ident: {'files': artifacts}}}
+            if os.path.isfile(os_filename):
+                os.remove(os_filename)
+            shutil.move(contents_path, os_filename)
+        elif not dont_write:
+            if os.path.isfile(os_filename):
+                os.remove(os_filename)
+            with open(os_filename, mode) as f:
+                if contents_base64:
+                    contents = base64.b64decode(contents)
+                f.write(contents)
         artifacts.append({
             "file_type": file_type,
             "display_type": display_type,
@@ -76,13 +126,6 @@ class Filedump(ArtifactorBasePlugin):
             "os_filename": os_filename,
             "group_id": group_id,
         })
-        if not dont_write:
-            if os.path.isfile(os_filename):
-                os.remove(os_filename)
-            with open(os_filename, mode) as f:
-                if contents_base64:
-                    contents = base64.b64decode(contents)
-                f.write(contents)
 
         return None, {'artifacts': {test_ident: {'files': artifacts}}}
 
@@ -14,6 +14,7 @@ artifactor:
 import os
 from logging import makeLogRecord
 from artifactor import ArtifactorBasePlugin
+from cfme.utils import safe_string
 from cfme.utils.log import make_file_handler
 
 
@@ -29,6 +30,7 @@ class Logger(ArtifactorBasePlugin):
         self.register_plugin_hook('start_test', self.start_test)
         self.register_plugin_hook('finish_test', self.finish_test)
         self.register_plugin_hook('log_message', self.log_message)
+        self.register_plugin_hook('log_messages', self.log_messages)
 
     def configure(self):
         self.configured = True
@@ -65,15 +67,45 @@ class Logger(ArtifactorBasePlugin):
             slaveid = "Master"
         self.store[slaveid].in_progress = False
 
-    @ArtifactorBasePlugin.check_configured
-    def log_message(self, log_record, slaveid):
+    @staticmethod
+    def _make_record(log_record):
         # json transport fallout: args must be a dict or a tuple, json makes a tuple into a list
         args = log_record['args']
         log_record['args'] = tuple(args) if isinstance(args, list) else args
-        record = makeLogRecord(log_record)
+        return makeLogRecord(log_record)
+
+    @ArtifactorBasePlugin.check_configured
+    def log_message(self, log_record, slaveid):
+        record = self._make_record(log_record)
         if not slaveid:
             slaveid = "Master"
         if slaveid in self.store:
             handler = self.store[slaveid].handler
             if handler and record.levelno >= handler.level:
                 handler.handle(record)
+
+    @ArtifactorBasePlugin.check_configured
+    def log_messages(self, log_records, slaveid, dropped=0):
+        """Writes a batch of log records with a single write to the test's log file"""
+        if not slaveid:
+            slaveid = "Master"
+        if slaveid not in self.store:
+            return
+        handler = self.store[slaveid].handler
+        if not handler:
+            return
+        lines = []
+        for log_record in log_records:
+            record = self._make_record(log_record)
+            if record.levelno >= handler.level and handler.filter(record):
+                lines.append(safe_string(handler.format(record)))
+        if dropped:
+            lines.append('{} log messages were dropped by the test process'.format(dropped))
+        if not lines:
+            return
+        handler.acquire()
+        try:
+            handler.stream.write('\n'.join(lines) + '\n')
+            handler.flush()
+        finally:
+            handler.release()
@@ -11,6 +11,8 @@ artifactor:
             enabled: True
             plugin: reporter
             only_failed: False #Only show faled tests in the report
+            report_interval: 60 #Seconds between partial reports during the session
+            render_workers: 4 #Processes rendering the report pages at the end of the session
 """
 import csv
 import datetime
@@ -18,6 +20,7 @@ import difflib
 import math
 import shutil
 import time
+from concurrent import futures
 from copy import deepcopy
 
 import os
@@ -43,6 +46,14 @@ _tests_tpl = {
     '_duration': 0
 }
 
+_colors = {
+    'passed': 'success',
+    'failed': 'warning',
+    'error': 'danger',
+    'xpassed': 'danger',
+    'xfailed': 'success',
+    'skipped': 'info'}
+
 # Regexp, that finds all URLs in a string
 # Does not cover all the cases, but rather only those we can
 URL = re.compile(r"https?://[^/\s]+(?:/[^/\s?]+)*/?(?:\?(?:[^&\s=]+(?:=[^&\s]+)?&?)*)?")
@@ -64,38 +75,177 @@ def overall_test_status(statuses):
     return "passed"
 
 
+def _render_page(template, report, filename):
+    """Renders a report page; module level, so it can be run in a worker process"""
+    template_env = Environment(
+        loader=FileSystemLoader(template_path.strpath)
+    )
+    data = template_env.get_template(template).render(**report)
+
+    # write next to the page and move it into place, so the page is never seen half written
+    with open(filename + '.tmp', "w") as f:
+        f.write(data)
+    os.rename(filename + '.tmp', filename)
+
+
 class ReporterBase(object):
-    def _run_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
-        template_data = self.process_data(old_artifacts, artifact_dir, version, fw_version)
+    """Builds the html reports from the artifacts
+
+    The processed data of every finished test is cached, so building a report during the session
+    only processes the tests which changed since the last report. At the end of the session, the
+    main and the per provider report pages are rendered by a pool of worker processes.
+
+    """
+    #: number of worker processes rendering report pages at the end of the session
+    render_workers = 4
+
+    @property
+    def _test_cache(self):
+        # test name -> (cache key, processed test data, qa contacts)
+        if not hasattr(self, '_processed_tests'):
+            self._processed_tests = {}
+        return self._processed_tests
 
+    def _filter_failed(self, template_data):
         if hasattr(self, 'only_failed') and self.only_failed:
             template_data['tests'] = [x for x in template_data['tests']
                                   if x['outcomes']['overall'] not in ['passed']]
+        return template_data
 
+    def _run_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
+        template_data = self.process_data(old_artifacts, artifact_dir, version, fw_version)
+        self._filter_failed(template_data)
         self.render_report(template_data, 'report', artifact_dir, 'test_report.html')
 
     def _run_provider_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
+        aggregate = self.aggregate_data(old_artifacts, artifact_dir, version, fw_version)
         for mgmt in cfme_data['management_systems'].keys():
-            template_data = self.process_data(old_artifacts, artifact_dir, version, fw_version,
-                name_filter=mgmt)
+            template_data = self.finalize_data(aggregate, name_filter=mgmt)
 
             self.render_report(template_data, "report_{}".format(mgmt), artifact_dir,
                 'test_report_provider.html')
 
-    def render_report(self, report, filename, log_dir, template):
-        template_env = Environment(
-            loader=FileSystemLoader(template_path.strpath)
-        )
-        data = template_env.get_template(template).render(**report)
-
-        with open(os.path.join(log_dir, '{}.html'.format(filename)), "w") as f:
-            f.write(data)
+    def _run_all_reports(self, old_artifacts, artifact_dir, version=None, fw_version=None):
+        aggregate = self.aggregate_data(old_artifacts, artifact_dir, version, fw_version)
+        pages = [
+            ('report', self._filter_failed(self.finalize_data(aggregate)), 'test_report.html')]
+        for mgmt in cfme_data['management_systems'].keys():
+            pages.append((
+                "report_{}".format(mgmt),
+                self.finalize_data(aggregate, name_filter=mgmt),
+                'test_report_provider.html'))
+        self._copy_dist(artifact_dir)
+        pool = futures.ProcessPoolExecutor(max_workers=self.render_workers)
+        try:
+            rendered = [
+                pool.submit(
+                    _render_page, template, report,
+                    os.path.join(artifact_dir, '{}.html'.format(filename)))
+                for filename, report, template in pages]
+            for future in rendered:
+                future.result()
+        finally:
+            pool.shutdown()
+
+    def _copy_dist(self, log_dir):
         try:
             shutil.copytree(template_path.join('dist').strpath, os.path.join(log_dir, 'dist'))
         except OSError:
             pass
 
+    def render_report(self, report, filename, log_dir, template):
+        _render_page(template, report, os.path.join(log_dir, '{}.html'.format(filename)))
+        self._copy_dist(log_dir)
+
     def process_data(self, artifacts, log_dir, version, fw_version, name_filter=None):
+        return self.finalize_data(
+            self.aggregate_data(artifacts, log_dir, version, fw_version), name_filter)
+
+    def _process_test(self, test_name, test, log_dir):
+        """Turns the artifacts of a test into its report data and the qa contacts it lists"""
+        qa = []
+        overall_status = overall_test_status(test['statuses'])
+        # This was removed previously but is needed as the overall is not generated
+        # until the test finishes. So this is here as a shim.
+        test['statuses']['overall'] = overall_status
+        test_data = {'name': test_name, 'outcomes': test['statuses'],
+                     'slaveid': test.get('slaveid', "Unknown"), 'color': _colors[overall_status]}
+        if 'composite' in test:
+            test_data['composite'] = test['composite']
+
+        if 'skipped' in test:
+            if test['skipped'].get('type') == 'provider':
+                test_data['skip_provider'] = test['skipped'].get('reason')
+            if test['skipped'].get('type') == 'blocker':
+                test_data['skip_blocker'] = test['skipped'].get('reason')
+
+        if 'skip_blocker' in test_data:
+            # Fix the inconveniently long list of repeated blockers until we sort out sets
+            # in riggerlib somehow.
+            test_data['skip_blocker'] = sorted(set(test_data['skip_blocker']))
+
+        if test.get('old', False):
+            test_data['old'] = True
+
+        if test.get('start_time'):
+            if test.get('finish_time'):
+                test_data['in_progress'] = False
+                test_data['duration'] = test['finish_time'] - test['start_time']
+            else:
+                test_data['duration'] = time.time() - test['start_time']
+                test_data['in_progress'] = True
+
+        # Set up destinations for the files
+        test_data["file_groups"] = []
+        test_data['qa_contact'] = []
+        processed_groups = {}
+        order = 0
+        for file_dict in test.get('files', []):
+            group = file_dict["group_id"]
+            if group not in processed_groups:
+                processed_groups[group] = (order, [])
+                order += 1
+            processed_groups[group][-1].append(file_dict)
+        # Current structure:
+        # {groupid: (group_order, [{filedict1}, {filedict2}])}
+        # Sorting by group_order
+        processed_groups = sorted(processed_groups.iteritems(), key=lambda kv: kv[1][0])
+        # And now make it [(groupid, [{filedict1}, {filedict2}, ...])]
+        processed_groups = [(group_name, files) for group_name, (_, files) in processed_groups]
+        for group_name, file_dicts in processed_groups:
+            group_file_list = []
+            for file_dict in file_dicts:
+                if file_dict["file_type"] == "qa_contact":
+                    with open(file_dict["os_filename"], 'rb') as qafile:
+                        qareader = csv.reader(qafile, delimiter=',', quotechar='"')
+                        for qacontact in qareader:
+                            test_data['qa_contact'].append(qacontact)
+                            if qacontact[0] not in qa:
+                                qa.append(qacontact[0])
+                    continue  # Do not store, handled a different way :)
+                elif file_dict["file_type"] == "short_tb":
+                    with open(file_dict["os_filename"], 'r') as short_tb:
+                        test_data["short_tb"] = short_tb.read()
+                    continue
+                file_dict["filename"] = file_dict["os_filename"].replace(log_dir, "")
+                group_file_list.append(file_dict)
+
+            test_data["file_groups"].append((group_name, group_file_list))
+        # Snd remove groups that are left empty because of eg. traceback or qa contact
+        test_data["file_groups"] = filter(
+            lambda group: len(group[1]) > 0, test_data["file_groups"])
+        if "short_tb" in test_data and test_data["short_tb"]:
+            urls = [url for url in URL.findall(test_data["short_tb"])]
+            if urls:
+                test_data["urls"] = urls
+        return test_data, qa
+
+    def aggregate_data(self, artifacts, log_dir, version, fw_version):
+        """Collects the report data of all tests, and the counts over all of them
+
+        Finished tests are only processed again if their artifacts changed.
+
+        """
         tb_errors = []
         blocker_skip_count = 0
         provider_skip_count = 0
@@ -117,103 +267,46 @@ class ReporterBase(object):
             'error': 0,
             'xfailed': 0,
             'xpassed': 0}
-        colors = {
-            'passed': 'success',
-            'failed': 'warning',
-            'error': 'danger',
-            'xpassed': 'danger',
-            'xfailed': 'success',
-            'skipped': 'info'}
         # Iterate through the tests and process the counts and durations
         for test_name, test in artifacts.iteritems():
             if not test.get('statuses'):
                 continue
-            overall_status = overall_test_status(test['statuses'])
+            cache_key = (
+                test.get('finish_time'), len(test['statuses']), len(test.get('files', [])),
+                'skipped' in test, test.get('old', False))
+            try:
+                cached_key, test_data, qa = self._test_cache[test_name]
+            except KeyError:
+                cached_key = None
+            if cached_key != cache_key:
+                test_data, qa = self._process_test(test_name, test, log_dir)
+                if test.get('finish_time'):
+                    # in progress tests change their duration, don't cache them
+                    self._test_cache[test_name] = cache_key, test_data, qa
+            overall_status = test_data['outcomes']['overall']
             counts[overall_status] += 1
             if not test.get('old', False):
                 current_counts[overall_status] += 1
-            color = colors[overall_status]
-            # This was removed previously but is needed as the overall is not generated
-            # until the test finishes. So this is here as a shim.
-            test['statuses']['overall'] = overall_status
-            test_data = {'name': test_name, 'outcomes': test['statuses'],
-                         'slaveid': test.get('slaveid', "Unknown"), 'color': color}
-            if 'composite' in test:
-                test_data['composite'] = test['composite']
-
-            if 'skipped' in test:
-                if test['skipped'].get('type') == 'provider':
-                    provider_skip_count += 1
-                    test_data['skip_provider'] = test['skipped'].get('reason')
-                if test['skipped'].get('type') == 'blocker':
-                    blocker_skip_count += 1
-                    test_data['skip_blocker'] = test['skipped'].get('reason')
-
+            if 'skip_provider' in test_data:
+                provider_skip_count += 1
             if 'skip_blocker' in test_data:
-                # Fix the inconveniently long list of repeated blockers until we sort out sets
-                # in riggerlib somehow.
-                test_data['skip_blocker'] = sorted(set(test_data['skip_blocker']))
-
-            if test.get('old', False):
-                test_data['old'] = True
-
-            if test.get('start_time'):
-                if test.get('finish_time'):
-                    test_data['in_progress'] = False
-                    test_data['duration'] = test['finish_time'] - test['start_time']
-                else:
-                    test_data['duration'] = time.time() - test['start_time']
-                    test_data['in_progress'] = True
-
-            # Set up destinations for the files
-            test_data["file_groups"] = []
-            test_data['qa_contact'] = []
-            processed_groups = {}
-            order = 0
-            for file_dict in test.get('files', []):
-                group = file_dict["group_id"]
-                if group not in processed_groups:
-                    processed_groups[group] = (order, [])
-                    order += 1
-                processed_groups[group][-1].append(file_dict)
-            # Current structure:
-            # {groupid: (group_order, [{filedict1}, {filedict2}])}
-            # Sorting by group_order
-            processed_groups = sorted(processed_groups.iteritems(), key=lambda kv: kv[1][0])
-            # And now make it [(groupid, [{filedict1}, {filedict2}, ...])]
-            processed_groups = [(group_name, files) for group_name, (_, files) in processed_groups]
-            for group_name, file_dicts in processed_groups:
-                group_file_list = []
-                for file_dict in file_dicts:
-                    if file_dict["file_type"] == "qa_contact":
-                        with open(file_dict["os_filename"], 'rb') as qafile:
-                            qareader = csv.reader(qafile, delimiter=',', quotechar='"')
-                            for qacontact in qareader:
-                                test_data['qa_contact'].append(qacontact)
-                                if qacontact[0] not in template_data['qa']:
-                                    template_data['qa'].append(qacontact[0])
-                        continue  # Do not store, handled a different way :)
-                    elif file_dict["file_type"] == "short_tb":
-                        with open(file_dict["os_filename"], 'r') as short_tb:
-                            test_data["short_tb"] = short_tb.read()
-                        continue
-                    file_dict["filename"] = file_dict["os_filename"].replace(log_dir, "")
-                    group_file_list.append(file_dict)
-
-                test_data["file_groups"].append((group_name, group_file_list))
-            # Snd remove groups that are left empty because of eg. traceback or qa contact
-            test_data["file_groups"] = filter(
-                lambda group: len(group[1]) > 0, test_data["file_groups"])
-            if "short_tb" in test_data and test_data["short_tb"]:
-                urls = [url for url in URL.findall(test_data["short_tb"])]
-                if urls:
-                    test_data["urls"] = urls
+                blocker_skip_count += 1
+            for qacontact in qa:
+                if qacontact not in template_data['qa']:
+                    template_data['qa'].append(qacontact)
             template_data['tests'].append(test_data)
         template_data['top10'] = self.top10(tb_errors)
         template_data['counts'] = counts
         template_data['current_counts'] = current_counts
         template_data['blocker_skip_count'] = blocker_skip_count
         template_data['provider_skip_count'] = provider_skip_count
+        return template_data
+
+    def finalize_data(self, aggregate, name_filter=None):
+        """Builds the data for one report page from the aggregated test data"""
+        template_data = dict(aggregate)
+        # the cached test data is kept as is, the page gets copies with formatted durations
+        template_data['tests'] = [dict(test) for test in aggregate['tests']]
 
         if name_filter:
             template_data['tests'] = [x for x in template_data['tests']
@@ -340,9 +433,8 @@ class ReporterBase(object):
 class Reporter(ArtifactorBasePlugin, ReporterBase):
     def plugin_initialize(self):
         self.register_plugin_hook('report_test', self.report_test)
-        self.register_plugin_hook('finish_session', self.run_report)
-        self.register_plugin_hook('finish_session', self.run_provider_report)
-        self.register_plugin_hook('build_report', self.run_report)
+        self.register_plugin_hook('finish_session', self.run_all_reports)
+        self.register_plugin_hook('build_report', self.build_report)
         self.register_plugin_hook('start_test', self.start_test)
         self.register_plugin_hook('skip_test', self.skip_test)
         self.register_plugin_hook('finish_test', self.finish_test)
@@ -352,6 +444,9 @@ class Reporter(ArtifactorBasePlugin, ReporterBase):
 
     def configure(self):
         self.only_failed = self.data.get('only_failed', False)
+        self.report_interval = self.data.get('report_interval', 60)
+        self.render_workers = self.data.get('render_workers', self.render_workers)
+        self.last_report = 0
         self.configured = True
 
     @ArtifactorBasePlugin.check_configured
@@ -421,3 +516,15 @@ class Reporter(ArtifactorBasePlugin, ReporterBase):
     @ArtifactorBasePlugin.check_configured
     def run_provider_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
         self._run_provider_report(old_artifacts, artifact_dir, version, fw_version)
+
+    @ArtifactorBasePlugin.check_configured
+    def run_all_reports(self, old_artifacts, artifact_dir, version=None, fw_version=None):
+        self._run_all_reports(old_artifacts, artifact_dir, version, fw_version)
+
+    @ArtifactorBasePlugin.check_configured
+    def build_report(self, old_artifacts, artifact_dir, version=None, fw_version=None):
+        """Renders the partial report of a running session, at most every report_interval"""
+        if time.time() - self.last_report < self.report_interval:
+            return
+        self._run_report(old_artifacts, artifact_dir, version, fw_version)
+        self.last_report = time.time()
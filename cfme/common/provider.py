@@ -2,6 +2,7 @@ import datetime
 from collections import Iterable
 
 from manageiq_client.api import APIException
+from sqlalchemy import text
 from widgetastic.widget import View, Text
 from widgetastic_patternfly import Button, Input
 
@@ -50,10 +51,73 @@ def provider_db_mapping():
     return {v.db_types[0]: v for k, v in all_types().items()}
 
 
+def ems_count_query(table_str):
+    """ Subquery counting the rows of a table that belong to the provider ``ems``
+
+    Args:
+        table_str: Name of a table with an ``ems_id`` column; e.g. 'vms' or 'hosts'
+    """
+    return "SELECT count(*) FROM {0} WHERE {0}.ems_id = ems.id".format(table_str)
+
+
+def count_db_stats(appliance, provider_names, queries):
+    """ Run count subqueries for several providers in a single query
+
+    Args:
+        appliance: The appliance whose database is queried.
+        provider_names: Names of the providers.
+        queries: Dict of stat name and subquery, the provider row is available as ``ems``,
+            see :py:func:`ems_count_query`.
+
+    Returns:
+        Dict of provider name and a dict of stat name and count, providers that don't exist
+        in the database are left out.
+    """
+    stats = sorted(queries)
+    query = text("SELECT ems.name, {} FROM ext_management_systems ems "
+                 "WHERE ems.name = ANY(:names)".format(
+                     ", ".join("({}) AS {}".format(queries[stat], stat) for stat in stats)))
+    result = appliance.db.client.engine.execute(query, names=list(provider_names))
+    return {row[0]: {stat: int(count) for stat, count in zip(stats, row[1:])} for row in result}
+
+
+def db_stats(providers, *stats):
+    """ Fetch the inventory counts of several providers of one appliance in one round trip
+
+    Args:
+        providers: Providers, their ``DB_STATS`` define the queries.
+        stats: Names of the stats; e.g. ``num_vm``, by default the ``DB_STATS`` of the providers.
+
+    Returns:
+        Dict of provider name and a dict of stat name and count.
+
+    Raises:
+        ProviderHasNoProperty: If a provider has no query for one of the stats.
+        ValueError: If the providers have different queries for a stat.
+    """
+    providers = list(providers)
+    if not providers:
+        return {}
+    queries = {}
+    for provider in providers:
+        for stat in stats or provider.DB_STATS:
+            query = provider._db_stat_query(stat)
+            if queries.setdefault(stat, query) != query:
+                raise ValueError(
+                    "Providers count '{}' differently, query them separately".format(stat))
+    if not queries:
+        return {provider.name: {} for provider in providers}
+    return count_db_stats(providers[0].appliance, [p.name for p in providers], queries)
+
+
 class BaseProvider(Taggable, Updateable, Navigatable):
     # List of constants that every non-abstract subclass must have defined
     _param_name = ParamClassName('name')
     STATS_TO_MATCH = []
+    # Subqueries counting the rows of each stat, fetched together by db_stats, see ems_count_query
+    # for the form. A dict of versions and subqueries is picked by the appliance version. Only for
+    # stats whose default variant is 'db', _do_stats_match takes them from here.
+    DB_STATS = {}
     db_types = ["Providers"]
     ems_events = []
     settings_key = None
@@ -619,12 +683,30 @@ class BaseProvider(Taggable, Updateable, Navigatable):
         Args:
             table_str: Name of the table; e.g. 'vms' or 'hosts'
         """
-        res = self.appliance.db.client.engine.execute(
-            "SELECT count(*) "
-            "FROM ext_management_systems, {0} "
-            "WHERE {0}.ems_id=ext_management_systems.id "
-            "AND ext_management_systems.name='{1}'".format(table_str, self.name))
-        return int(res.first()[0])
+        counts = count_db_stats(self.appliance, [self.name], {'count': ems_count_query(table_str)})
+        return counts[self.name]['count'] if counts else 0
+
+    def _db_stat_query(self, stat):
+        try:
+            query = self.DB_STATS[stat]
+        except KeyError:
+            raise ProviderHasNoProperty(
+                "Provider does not know how to count '{}' in the database".format(stat))
+        if isinstance(query, dict):
+            query = version.pick(query, active_version=self.appliance.version)
+        return query
+
+    def db_stats(self, *stats):
+        """ Fetch the provider's inventory counts in a single query, see :py:func:`db_stats`
+
+        Args:
+            stats: Names of the stats; e.g. ``num_vm``, by default all of ``DB_STATS``.
+
+        Returns:
+            Dict of stat name and count, the counts are 0 if the provider doesn't exist.
+        """
+        return db_stats([self], *stats).get(self.name) or {
+            stat: 0 for stat in stats or self.DB_STATS}
 
     def _do_stats_match(self, client, stats_to_match=None, refresh_timer=None, ui=False):
         """ A private function to match a set of statistics, with a Provider.
@@ -654,9 +736,16 @@ class BaseProvider(Taggable, Updateable, Navigatable):
                 self.refresh_provider_relationships()
                 refresh_timer.reset()
 
+        # the stats known to the database are fetched at once, instead of a query per stat
+        db_stat_names = [] if ui else [stat for stat in stats_to_match if stat in self.DB_STATS]
+        cfme_stats = self.db_stats(*db_stat_names) if db_stat_names else {}
+
         for stat in stats_to_match:
             try:
-                cfme_stat = getattr(self, stat)(method=method)
+                if stat in cfme_stats:
+                    cfme_stat = cfme_stats[stat]
+                else:
+                    cfme_stat = getattr(self, stat)(method=method)
                 success, value = tol_check(host_stats[stat],
                                            cfme_stat,
                                            min_error=0.05,
@@ -994,6 +1083,10 @@ class CloudInfraProvider(BaseProvider, PolicyProfileAssignable, Taggable):
     edit_page_suffix = 'provider_edit'
     refresh_text = "Refresh Relationships and Power States"
     db_types = ["CloudManager", "InfraManager"]
+    DB_STATS = {
+        'num_template': "SELECT count(*) FROM vms WHERE vms.ems_id = ems.id AND vms.template",
+        'num_vm': "SELECT count(*) FROM vms WHERE vms.ems_id = ems.id AND NOT vms.template",
+    }
 
     @property
     def hostname(self):
@@ -1022,13 +1115,7 @@ class CloudInfraProvider(BaseProvider, PolicyProfileAssignable, Taggable):
     @variable(alias="db")
     def num_template(self):
         """ Returns the providers number of templates, as shown on the Details page."""
-        ext_management_systems = self.appliance.db.client["ext_management_systems"]
-        vms = self.appliance.db.client["vms"]
-        temlist = list(self.appliance.db.client.session.query(vms.name)
-                       .join(ext_management_systems, vms.ems_id == ext_management_systems.id)
-                       .filter(ext_management_systems.name == self.name)
-                       .filter(vms.template == True))  # NOQA
-        return len(temlist)
+        return self.db_stats('num_template')['num_template']
 
     @num_template.variant('ui')
     def num_template_ui(self):
@@ -1038,13 +1125,7 @@ class CloudInfraProvider(BaseProvider, PolicyProfileAssignable, Taggable):
     @variable(alias="db")
     def num_vm(self):
         """ Returns the providers number of instances, as shown on the Details page."""
-        ext_management_systems = self.appliance.db.client["ext_management_systems"]
-        vms = self.appliance.db.client["vms"]
-        vmlist = list(self.appliance.db.client.session.query(vms.name)
-                      .join(ext_management_systems, vms.ems_id == ext_management_systems.id)
-                      .filter(ext_management_systems.name == self.name)
-                      .filter(vms.template == False))  # NOQA
-        return len(vmlist)
+        return self.db_stats('num_vm')['num_vm']
 
     @num_vm.variant('ui')
     def num_vm_ui(self):
@@ -15,7 +15,8 @@ from cfme import exceptions
 from cfme.base.credential import TokenCredential
 from cfme.base.login import BaseLoggedInPage
 from cfme.common import TagPageView, PolicyProfileAssignable
-from cfme.common.provider import BaseProvider, DefaultEndpoint, DefaultEndpointForm
+from cfme.common.provider import (
+    BaseProvider, DefaultEndpoint, DefaultEndpointForm, ems_count_query)
 from cfme.common.provider_views import (
     BeforeFillMixin, ContainerProviderAddView, ContainerProvidersView,
     ContainerProviderEditView, ContainerProviderEditViewUpdated, ProvidersView,
@@ -181,6 +182,26 @@ class ContainersProvider(BaseProvider, Pretty, PolicyProfileAssignable):
         'num_image_registry',
         'num_container']
     # TODO add 'num_volume'
+    DB_STATS = {
+        'num_project': ems_count_query('container_projects'),
+        'num_service': ems_count_query('container_services'),
+        'num_replication_controller': ems_count_query('container_replicators'),
+        'num_container_group': ems_count_query('container_groups'),
+        'num_pod': ems_count_query('container_groups'),
+        'num_node': ems_count_query('container_nodes'),
+        'num_image': ems_count_query('container_images'),
+        'num_image_registry': ems_count_query('container_image_registries'),
+        # Containers are linked to providers through container definitions and then through pods
+        'num_container': {
+            version.LOWEST: "SELECT count(*) FROM container_groups, container_definitions, "
+                            "containers "
+                            "WHERE containers.container_definition_id = container_definitions.id "
+                            "AND container_definitions.container_group_id = container_groups.id "
+                            "AND container_groups.ems_id = ems.id",
+            '5.9': "SELECT count(*) FROM container_groups, containers "
+                   "WHERE containers.container_group_id = container_groups.id "
+                   "AND container_groups.ems_id = ems.id"},
+    }
     string_name = "Containers"
     detail_page_suffix = 'provider_detail'
     edit_page_suffix = 'provider_edit_detail'
@@ -222,7 +243,7 @@ class ContainersProvider(BaseProvider, Pretty, PolicyProfileAssignable):
 
     @variable(alias='db')
     def num_project(self):
-        return self._num_db_generic('container_projects')
+        return self.db_stats('num_project')['num_project']
 
     @num_project.variant('ui')
     def num_project_ui(self):
@@ -231,7 +252,7 @@ class ContainersProvider(BaseProvider, Pretty, PolicyProfileAssignable):
 
     @variable(alias='db')
     def num_service(self):
-        return self._num_db_generic('container_services')
+        return self.db_stats('num_service')['num_service']
 
     @num_service.variant('ui')
     def num_service_ui(self):
@@ -244,7 +265,7 @@ class ContainersProvider(BaseProvider, Pretty, PolicyProfileAssignable):
 
     @variable(alias='db')
     def num_replication_controller(self):
-        return self._num_db_generic('container_replicators')
+        return self.db_stats('num_replication_controller')['num_replication_controller']
 
     @num_replication_controller.variant('ui')
     def num_replication_controller_ui(self):
@@ -253,7 +274,7 @@ class ContainersProvider(BaseProvider, Pretty, PolicyProfileAssignable):
 
     @variable(alias='db')
     def num_container_group(self):
-        return self._num_db_generic('container_groups')
+        return self.db_stats('num_container_group')['num_container_group']
 
     @num_container_group.variant('ui')
     def num_container_group_ui(self):
@@ -272,7 +293,7 @@ class ContainersProvider(BaseProvider, Pretty, PolicyProfileAssignable):
 
     @variable(alias='db')
     def num_node(self):
-        return self._num_db_generic('container_nodes')
+        return self.db_stats('num_node')['num_node']
 
     @num_node.variant('ui')
     def num_node_ui(self):
@@ -281,23 +302,7 @@ class ContainersProvider(BaseProvider, Pretty, PolicyProfileAssignable):
 
     @variable(alias='db')
     def num_container(self):
-        # Containers are linked to providers through container definitions and then through pods
-        query = version.pick({
-            version.LOWEST: "SELECT count(*) "
-            "FROM ext_management_systems, container_groups, container_definitions, containers "
-            "WHERE containers.container_definition_id=container_definitions.id "
-            "AND container_definitions.container_group_id=container_groups.id "
-            "AND container_groups.ems_id=ext_management_systems.id "
-            "AND ext_management_systems.name='{}'".format(self.name),
-
-            '5.9': "SELECT count(*) "
-            "FROM ext_management_systems, container_groups, containers "
-            "WHERE containers.container_group_id=container_groups.id "
-            "AND container_groups.ems_id=ext_management_systems.id "
-            "AND ext_management_systems.name='{}'".format(self.name)
-        })
-        res = self.appliance.db.client.engine.execute(query)
-        return int(res.first()[0])
+        return self.db_stats('num_container')['num_container']
 
     @num_container.variant('ui')
     def num_container_ui(self):
@@ -306,7 +311,7 @@ class ContainersProvider(BaseProvider, Pretty, PolicyProfileAssignable):
 
     @variable(alias='db')
     def num_image(self):
-        return self._num_db_generic('container_images')
+        return self.db_stats('num_image')['num_image']
 
     @num_image.variant('ui')
     def num_image_ui(self):
@@ -319,7 +324,7 @@ class ContainersProvider(BaseProvider, Pretty, PolicyProfileAssignable):
 
     @variable(alias='db')
     def num_image_registry(self):
-        return self._num_db_generic('container_image_registries')
+        return self.db_stats('num_image_registry')['num_image_registry']
 
     @num_image_registry.variant('ui')
     def num_image_registry_ui(self):
@@ -3,7 +3,7 @@ from os import path
 from cached_property import cached_property
 from wrapanapi.containers.providers.rhopenshift import Openshift
 
-from cfme.common.provider import DefaultEndpoint
+from cfme.common.provider import DefaultEndpoint, ems_count_query
 from cfme.control.explorer.alert_profiles import ProviderAlertProfile, NodeAlertProfile
 from cfme.utils import ssh
 from cfme.utils.appliance.implementations.ui import navigate_to
@@ -78,6 +78,10 @@ class AlertsEndpoint(ServiceBasedEndpoint):
 class OpenshiftProvider(ContainersProvider):
     num_route = ['num_route']
     STATS_TO_MATCH = ContainersProvider.STATS_TO_MATCH + num_route
+    DB_STATS = dict(
+        ContainersProvider.DB_STATS,
+        num_route=ems_count_query('container_routes'),
+        num_template=ems_count_query('container_templates'))
     type_name = "openshift"
     mgmt_class = Openshift
     db_types = ["Openshift::ContainerManager"]
@@ -190,7 +194,7 @@ class OpenshiftProvider(ContainersProvider):
 
     @variable(alias='db')
     def num_route(self):
-        return self._num_db_generic('container_routes')
+        return self.db_stats('num_route')['num_route']
 
     @num_route.variant('ui')
     def num_route_ui(self):
@@ -199,7 +203,7 @@ class OpenshiftProvider(ContainersProvider):
 
     @variable(alias='db')
     def num_template(self):
-        return self._num_db_generic('container_templates')
+        return self.db_stats('num_template')['num_template']
 
     @num_template.variant('ui')
     def num_template_ui(self):
@@ -390,5 +394,4 @@ class OpenshiftProvider(ContainersProvider):
 
             # restarting evemserverd to apply the new SSL certificate
             self.appliance.restart_evm_service()
-            self.appliance.wait_for_evm_service()
-            self.appliance.wait_for_web_ui()
+            self.appliance.health.wait_for_ready(components=('evm_service', 'web_ui'), timeout=1800)
@@ -67,6 +67,12 @@ class InfraProvider(Pretty, CloudInfraProvider, Fillable):
     category = "infra"
     pretty_attrs = ['name', 'key', 'zone']
     STATS_TO_MATCH = ['num_template', 'num_vm', 'num_datastore', 'num_host', 'num_cluster']
+    DB_STATS = dict(
+        CloudInfraProvider.DB_STATS,
+        num_datastore="SELECT count(DISTINCT st.name) "
+                      "FROM hosts, host_storages hst, storages st "
+                      "WHERE hosts.id = hst.host_id AND st.id = hst.storage_id "
+                      "AND hosts.ems_id = ems.id")
     string_name = "Infrastructure"
     templates_destination_name = "Templates"
     db_types = ["InfraManager"]
@@ -86,15 +92,8 @@ class InfraProvider(Pretty, CloudInfraProvider, Fillable):
 
     @variable(alias='db')
     def num_datastore(self):
-        """ Returns the providers number of templates, as shown on the Details page."""
-        results = list(self.appliance.db.client.engine.execute(
-            'SELECT DISTINCT storages.name, hosts.ems_id '
-            'FROM ext_management_systems ems, hosts, storages st, host_storages hst'
-            'WHERE hosts.id=hst.host_id AND '
-            'st.id=hst.storage_id AND '
-            'hosts.ems_id=ems.id AND '
-            'ems.name=\'{}\''.format(self.name)))
-        return len(results)
+        """ Returns the providers number of datastores, as shown on the Details page."""
+        return self.db_stats('num_datastore')['num_datastore']
 
     @num_datastore.variant('ui')
     def num_datastore_ui(self):
@@ -112,12 +111,7 @@ class InfraProvider(Pretty, CloudInfraProvider, Fillable):
 
     @num_host.variant('db')
     def num_host_db(self):
-        ext_management_systems = self.appliance.db.client["ext_management_systems"]
-        hosts = self.appliance.db.client["hosts"]
-        hostlist = list(self.appliance.db.client.session.query(hosts.name)
-                        .join(ext_management_systems, hosts.ems_id == ext_management_systems.id)
-                        .filter(ext_management_systems.name == self.name))
-        return len(hostlist)
+        return self._num_db_generic('hosts')
 
     @num_host.variant('ui')
     def num_host_ui(self):
@@ -140,14 +134,8 @@ class InfraProvider(Pretty, CloudInfraProvider, Fillable):
 
     @num_cluster.variant('db')
     def num_cluster_db(self):
-        """ Returns the providers number of templates, as shown on the Details page."""
-        ext_management_systems = self.appliance.db.client["ext_management_systems"]
-        clusters = self.appliance.db.client["ems_clusters"]
-        clulist = list(self.appliance.db.client.session.query(clusters.name)
-                       .join(ext_management_systems,
-                             clusters.ems_id == ext_management_systems.id)
-                       .filter(ext_management_systems.name == self.name))
-        return len(clulist)
+        """ Returns the providers number of clusters, as shown on the Details page."""
+        return self._num_db_generic('ems_clusters')
 
     @num_cluster.variant('ui')
     def num_cluster_ui(self):
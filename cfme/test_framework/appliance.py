@@ -91,5 +91,8 @@ class ApplianceHolderPlugin(object):
         if isinstance(self.held_appliance, DummyAppliance):
             return
         if pytest.store.parallelizer_role != 'slave':
+            # drop stale facts up front, the slaves check the identity again on first use
+            for appliance in self.appliances:
+                appliance.facts.validate()
             with log_path.join('appliance_version').open('w') as appliance_version:
                 appliance_version.write(self.held_appliance.version.vstring)
@@ -17,6 +17,7 @@ import pytest
 from cfme.utils.path import log_path
 from cfme.utils.conf import env
 from cfme.utils.log import logger
+from cfme.utils.ssh import SSHFanOut
 
 
 DEFAULT_FILES = ['/var/www/miq/vmdb/log/evm.log',
@@ -59,8 +60,7 @@ def pytest_unconfigure(config):
             logger.warning('No logs collected, appliance holder is empty')
             return
 
-        written_files = []
-        for app in holder.appliances:
+        def collect_logs(app):
             with app.ssh_client as ssh_client:
                 tar_file = 'log-collector-{}.tar.gz'.format(
                     app.hostname)
@@ -75,7 +75,11 @@ def pytest_unconfigure(config):
                 except AssertionError:
                     logger.exception('Tar command non-zero RC when collecting logs on %s: %s',
                                      app, tar_result.output)
-                    continue
-                ssh_client.get_file(tar_file, local_dir.strpath)
-            written_files.append(tar_file)
+                    return None
+                ssh_client.download_file(tar_file, local_dir.strpath)
+            return tar_file
+
+        # collect from all appliances at once, the time it takes doesn't grow with their number
+        results = SSHFanOut(holder.appliances).map(collect_logs)
+        written_files = [result.value for result in results.values() if result.value]
         logger.info('Wrote the following files to local log path: %s', written_files)
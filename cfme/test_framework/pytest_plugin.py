@@ -64,6 +64,7 @@ pytest_plugins = (
     'fixtures.log',
     'fixtures.maximized',
     'fixtures.merkyl',
+    'fixtures.metrics',
     'fixtures.nelson',
     'fixtures.node_annotate',
     'fixtures.page_screenshots',
@@ -3,7 +3,7 @@ import pytest
 import random
 import attr
 from six.moves.urllib.parse import urlparse
-from threading import Timer
+from threading import Event, Thread, Timer
 from cfme.utils import at_exit, conf
 # todo: use own logger after logfix merge
 from cfme.utils.log import logger as log
@@ -50,6 +50,10 @@ def pytest_addoption(parser):
     group._addoption('--sprout-ignore-preconfigured', dest='sprout_template_preconfigured',
                      default=True, action="store_false",
                      help="Allows to use not preconfigured templates")
+    group._addoption('--sprout-elastic', dest='sprout_elastic', action='store_true',
+                     default=False,
+                     help="Start testing as soon as two appliances are ready, "
+                          "and add the rest to the session as Sprout delivers them")
 
 
 def dump_pool_info(log, pool_data):
@@ -65,6 +69,31 @@ def dump_pool_info(log, pool_data):
             log.info("\t\t%s: %s", key, appliance[key])
 
 
+def appliance_args_from_sprout(appliance):
+    """turns the sprout data of an appliance into arguments for ``appliances_from_cli``"""
+    appliance_args = {'hostname': appliance['url']}
+    provider_data = conf.cfme_data['management_systems'].get(appliance['provider'])
+    if provider_data and provider_data['type'] == 'openshift':
+        ocp_creds = conf.credentials[provider_data['credentials']]
+        ssh_creds = conf.credentials[provider_data['ssh_creds']]
+        extra_args = {
+            'container': appliance['container'],
+            'db_host': appliance['db_host'],
+            'project': appliance['project'],
+            'openshift_creds': {
+                'hostname': provider_data['hostname'],
+                'username': ocp_creds['username'],
+                'password': ocp_creds['password'],
+                'ssh': {
+                    'username': ssh_creds['username'],
+                    'password': ssh_creds['password'],
+                }
+            }
+        }
+        appliance_args.update(extra_args)
+    return appliance_args
+
+
 def mangle_in_sprout_appliances(config):
     """
     this helper function resets the appliances option of the config and mangles in
@@ -75,33 +104,17 @@ def mangle_in_sprout_appliances(config):
     provision_request = SproutProvisioningRequest.from_config(config)
 
     mgr = config._sprout_mgr = SproutManager()
-    requested_appliances = mgr.request_appliances(provision_request)
+    if config.option.sprout_elastic:
+        # the rest of the pool gets added to the parallel session once it's ready
+        minimum = min(provision_request.count, 2)
+    else:
+        minimum = None
+    requested_appliances = mgr.request_appliances(provision_request, minimum=minimum)
     config.option.appliances[:] = []
     appliances = config.option.appliances
     log.info("Appliances were provided:")
     for appliance in requested_appliances:
-
-        appliance_args = {'hostname': appliance['url']}
-        provider_data = conf.cfme_data['management_systems'].get(appliance['provider'])
-        if provider_data and provider_data['type'] == 'openshift':
-            ocp_creds = conf.credentials[provider_data['credentials']]
-            ssh_creds = conf.credentials[provider_data['ssh_creds']]
-            extra_args = {
-                'container': appliance['container'],
-                'db_host': appliance['db_host'],
-                'project': appliance['project'],
-                'openshift_creds': {
-                    'hostname': provider_data['hostname'],
-                    'username': ocp_creds['username'],
-                    'password': ocp_creds['password'],
-                    'ssh': {
-                        'username': ssh_creds['username'],
-                        'password': ssh_creds['password'],
-                    }
-                }
-            }
-            appliance_args.update(extra_args)
-        appliances.append(appliance_args)
+        appliances.append(appliance_args_from_sprout(appliance))
         log.info("- %s is %s", appliance['url'], appliance['name'])
 
     mgr.reset_timer()
@@ -113,6 +126,13 @@ def mangle_in_sprout_appliances(config):
     log.info("Sprout setup finished.")
 
     config.pluginmanager.register(ShutdownPlugin())
+    if len(requested_appliances) < provision_request.count:
+        config.pluginmanager.register(
+            ElasticPoolPlugin(
+                manager=mgr,
+                known_urls={appliance['url'] for appliance in requested_appliances},
+                timeout=provision_request.provision_timeout * 60),
+            'sprout-elastic-pool')
 
 
 @attr.s
@@ -160,16 +180,31 @@ class SproutManager(object):
     lease_time = attr.ib(init=False, default=None, repr=False)
     timer = attr.ib(init=False, default=None, repr=False)
 
-    def request_appliances(self, provision_request):
+    def request_appliances(self, provision_request, minimum=None):
+        """requests a pool and waits for its appliances
+
+        Args:
+            provision_request: the :py:class:`SproutProvisioningRequest` to send to sprout
+            minimum: if set, only wait for this many appliances to be ready instead of the
+                whole pool, only the ready appliances are returned
+        """
         self.request_pool(provision_request)
 
         try:
-            result = wait_for(
-                self.check_fullfilled,
-                num_sec=provision_request.provision_timeout * 60,
-                delay=5,
-                message="requesting appliances was fulfilled"
-            )
+            if minimum is None:
+                result = wait_for(
+                    self.check_fullfilled,
+                    num_sec=provision_request.provision_timeout * 60,
+                    delay=5,
+                    message="requesting appliances was fulfilled"
+                )
+            else:
+                result = wait_for(
+                    lambda: len(self.ready_appliances()) >= minimum,
+                    num_sec=provision_request.provision_timeout * 60,
+                    delay=5,
+                    message="{} appliances were ready".format(minimum)
+                )
         except Exception:
             pool = self.request_check()
             dump_pool_info(log, pool)
@@ -182,7 +217,9 @@ class SproutManager(object):
             dump_pool_info(log, pool)
 
         log.info("Provisioning took %.1f seconds", result.duration)
-        return pool["appliances"]
+        if minimum is None:
+            return pool["appliances"]
+        return self.ready_appliances(pool)
 
     def request_pool(self, provision_request):
         log.info("Requesting %s appliances from Sprout at %s",
@@ -224,6 +261,19 @@ class SproutManager(object):
     def request_check(self):
         return self.client.request_check(self.pool)
 
+    def ready_appliances(self, pool=None):
+        """returns the appliances of the pool which are ready to be used"""
+        if pool is None:
+            try:
+                pool = self.request_check()
+            except SproutException as e:
+                self.destroy_pool()
+                log.error("sprout pool could not be fulfilled\n%s", str(e))
+                pytest.exit(1)
+        return [
+            appliance for appliance in pool["appliances"]
+            if appliance["ready"] and appliance["url"]]
+
     def check_fullfilled(self):
         try:
             result = self.request_check()
@@ -325,6 +375,64 @@ class ShutdownPlugin(object):
             log.debug('The IP address was not present - not terminating any appliance')
 
 
+@attr.s(cmp=False)
+class ElasticPoolPlugin(object):
+    """hands appliances of a partially fulfilled pool to the parallel session as they get ready
+
+    the slaves of appliances that leave the pool, e.g. when sprout takes them back, are retired
+    """
+    manager = attr.ib()
+    known_urls = attr.ib(default=attr.Factory(set))
+    timeout = attr.ib(default=3600)
+    delay = attr.ib(default=30)
+    stopped = attr.ib(init=False, default=attr.Factory(Event), repr=False)
+
+    def pytest_parallel_configured(self, parallel_session):
+        if parallel_session is None:
+            return
+        watcher = Thread(target=self.watch_pool, args=(parallel_session,))
+        watcher.daemon = True
+        watcher.start()
+
+    def watch_pool(self, parallel_session):
+        from cfme.test_framework.appliance import appliances_from_cli
+        wait_time = 0
+        growing = True
+        while not self.stopped.wait(self.delay):
+            wait_time += self.delay
+            try:
+                pool = self.manager.request_check()
+            except Exception:
+                log.exception("Could not check the sprout pool %s", self.manager.pool)
+                continue
+            pool_urls = {appliance['url'] for appliance in pool['appliances']}
+            for url in sorted(self.known_urls - pool_urls):
+                log.info("- %s left the sprout pool, retiring its slave", url)
+                self.known_urls.discard(url)
+                parallel_session.retire_appliance(url)
+            if not growing:
+                continue
+            for appliance in self.manager.ready_appliances(pool):
+                if appliance['url'] in self.known_urls:
+                    continue
+                self.known_urls.add(appliance['url'])
+                log.info(
+                    "- %s is %s, adding it to the session", appliance['url'], appliance['name'])
+                new_appliance, = appliances_from_cli([appliance_args_from_sprout(appliance)])
+                parallel_session.add_appliance(new_appliance)
+            if len(self.known_urls) >= len(pool['appliances']) and pool['fulfilled']:
+                log.info("All appliances of the sprout pool %s are in use", self.manager.pool)
+                growing = False
+            elif wait_time >= self.timeout:
+                log.warning(
+                    "Sprout pool %s was not fulfilled in time, continuing with %d appliances",
+                    self.manager.pool, len(self.known_urls))
+                growing = False
+
+    def pytest_sessionfinish(self):
+        self.stopped.set()
+
+
 class NewHooks(object):
     def pytest_miq_node_shutdown(self, config, nodeinfo):
         pass
@@ -308,58 +308,52 @@ def test_appliance_console_external_auth(auth_type, app_creds, ipa_crud, configu
     # TODO this depends on the auth_type options being disabled when the test is run
     # TODO it assumes that first switch is to true, then false.
 
-    evm_tail = LogValidator('/var/www/miq/vmdb/log/evm.log',
-                            matched_patterns=['.*{} to true.*'.format(auth_type.option)],
-                            hostname=configured_appliance.hostname,
-                            username=app_creds['sshlogin'],
-                            password=app_creds['sshpass'])
-    evm_tail.fix_before_start()
-    ext_auth = '12'
-    command_set = ('ap', '', ext_auth, auth_type.index, '4')
-    configured_appliance.appliance_console.run_commands(command_set)
-    evm_tail.validate_logs()
-
-    evm_tail = LogValidator('/var/www/miq/vmdb/log/evm.log',
-                            matched_patterns=['.*{} to false.*'.format(auth_type.option)],
-                            hostname=configured_appliance.hostname,
-                            username=app_creds['sshlogin'],
-                            password=app_creds['sshpass'])
-
-    evm_tail.fix_before_start()
-    command_set = ('ap', '', '12', auth_type.index, '4')
-    configured_appliance.appliance_console.run_commands(command_set)
-    evm_tail.validate_logs()
+    with LogValidator('/var/www/miq/vmdb/log/evm.log',
+                      matched_patterns=['.*{} to true.*'.format(auth_type.option)],
+                      hostname=configured_appliance.hostname,
+                      username=app_creds['sshlogin'],
+                      password=app_creds['sshpass']) as evm_tail:
+        ext_auth = '12'
+        command_set = ('ap', '', ext_auth, auth_type.index, '4')
+        configured_appliance.appliance_console.run_commands(command_set)
+        evm_tail.validate_logs()
+
+    with LogValidator('/var/www/miq/vmdb/log/evm.log',
+                      matched_patterns=['.*{} to false.*'.format(auth_type.option)],
+                      hostname=configured_appliance.hostname,
+                      username=app_creds['sshlogin'],
+                      password=app_creds['sshpass']) as evm_tail:
+        command_set = ('ap', '', '12', auth_type.index, '4')
+        configured_appliance.appliance_console.run_commands(command_set)
+        evm_tail.validate_logs()
 
 
 def test_appliance_console_external_auth_all(app_creds, ipa_crud, configured_appliance):
     """'ap' launches appliance_console, '' clears info screen, '12/15' change ext auth options,
     'auth_type' auth type to change, '4' apply changes."""
 
-    evm_tail = LogValidator('/var/www/miq/vmdb/log/evm.log',
-                            matched_patterns=['.*sso_enabled to true.*',
-                                              '.*saml_enabled to true.*',
-                                              '.*local_login_disabled to true.*'],
-                            hostname=configured_appliance.hostname,
-                            username=app_creds['sshlogin'],
-                            password=app_creds['password'])
-    evm_tail.fix_before_start()
-    ext_auth = '12'
-    command_set = ('ap', '', ext_auth, '1', '2', '3', '4')
-    configured_appliance.appliance_console.run_commands(command_set)
-    evm_tail.validate_logs()
-
-    evm_tail = LogValidator('/var/www/miq/vmdb/log/evm.log',
-                            matched_patterns=['.*sso_enabled to false.*',
-                                              '.*saml_enabled to false.*',
-                                              '.*local_login_disabled to false.*'],
-                            hostname=configured_appliance.hostname,
-                            username=app_creds['sshlogin'],
-                            password=app_creds['password'])
-
-    evm_tail.fix_before_start()
-    command_set = ('ap', '', ext_auth, '1', '2', '3', '4')
-    configured_appliance.appliance_console.run_commands(command_set)
-    evm_tail.validate_logs()
+    with LogValidator('/var/www/miq/vmdb/log/evm.log',
+                      matched_patterns=['.*sso_enabled to true.*',
+                                        '.*saml_enabled to true.*',
+                                        '.*local_login_disabled to true.*'],
+                      hostname=configured_appliance.hostname,
+                      username=app_creds['sshlogin'],
+                      password=app_creds['password']) as evm_tail:
+        ext_auth = '12'
+        command_set = ('ap', '', ext_auth, '1', '2', '3', '4')
+        configured_appliance.appliance_console.run_commands(command_set)
+        evm_tail.validate_logs()
+
+    with LogValidator('/var/www/miq/vmdb/log/evm.log',
+                      matched_patterns=['.*sso_enabled to false.*',
+                                        '.*saml_enabled to false.*',
+                                        '.*local_login_disabled to false.*'],
+                      hostname=configured_appliance.hostname,
+                      username=app_creds['sshlogin'],
+                      password=app_creds['password']) as evm_tail:
+        command_set = ('ap', '', ext_auth, '1', '2', '3', '4')
+        configured_appliance.appliance_console.run_commands(command_set)
+        evm_tail.validate_logs()
 
 
 def test_appliance_console_scap(temp_appliance_preconfig, soft_assert):
@@ -38,12 +38,11 @@ def test_configuration_database_garbage_collection(appliance):
         Navigate to Settings -> Configuration -> Diagnostics -> CFME Region -> Database
         Submit Run database Garbage Collection Now a check UI/logs for errors.
     """
-    evm_tail = LogValidator('/var/www/miq/vmdb/log/evm.log',
-                            matched_patterns=[
-                                '.*Queued the action: \[Database GC\] being run for user:.*'],
-                            failure_patterns=['.*ERROR.*'])
-    evm_tail.fix_before_start()
-    view = navigate_to(appliance.server.zone.region, 'Database')
-    view.submit_db_garbage_collection_button.click()
-    view.flash.assert_message('Database Garbage Collection successfully initiated')
-    evm_tail.validate_logs()
+    with LogValidator('/var/www/miq/vmdb/log/evm.log',
+                      matched_patterns=[
+                          '.*Queued the action: \[Database GC\] being run for user:.*'],
+                      failure_patterns=['.*ERROR.*']) as evm_tail:
+        view = navigate_to(appliance.server.zone.region, 'Database')
+        view.submit_db_garbage_collection_button.click()
+        view.flash.assert_message('Database Garbage Collection successfully initiated')
+        evm_tail.validate_logs()
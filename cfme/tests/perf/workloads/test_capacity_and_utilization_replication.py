@@ -5,7 +5,7 @@ from cfme.utils.grafana import get_scenario_dashboard_urls
 from cfme.utils.log import logger
 from cfme.utils.providers import get_crud
 from cfme.utils.smem_memory_monitor import add_workload_quantifiers, SmemMemoryMonitor
-from cfme.utils.ssh import SSHClient, SSHTail
+from cfme.utils.ssh import SSHClient, SSHLogFollower
 from cfme.utils.workloads import get_capacity_and_utilization_replication_scenarios
 import time
 import pytest
@@ -38,10 +38,11 @@ def test_workload_capacity_and_utilization_rep(appliance, request, scenario, set
 
     # Turn off master pglogical replication incase rubyrep scenario follows a pglogical scenario
     appliance.set_pglogical_replication(replication_type=':none')
-    # Spawn tail before hand to prevent unncessary waiting on MiqServer starting since applinace
+    # Follow evm.log before hand to prevent unncessary waiting on MiqServer starting since applinace
     # under test is cleaned first, followed by master appliance
-    sshtail_evm = SSHTail('/var/www/miq/vmdb/log/evm.log')
-    sshtail_evm.set_initial_file_end()
+    sshtail_evm = SSHLogFollower('/var/www/miq/vmdb/log/evm.log',
+                                 grep_pattern='MiqServer#wait_for_started_workers')
+    sshtail_evm.start()
     logger.info('Clean appliance under test ({})'.format(ssh_client))
     appliance.clean_appliance()
     logger.info('Clean master appliance ({})'.format(ssh_client_master))
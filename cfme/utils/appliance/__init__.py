@@ -27,15 +27,17 @@ from werkzeug.local import LocalStack, LocalProxy
 from cfme.utils import clear_property_cache
 from cfme.utils import conf, ssh, ports
 from cfme.utils.datafile import load_data_file
-from cfme.utils.log import logger, create_sublogger, logger_wrap
+from cfme.utils.log import logger, create_sublogger, logger_wrap, perflog
 from cfme.utils.net import net_check
 from cfme.utils.path import data_path, patches_path, scripts_path, conf_path
-from cfme.utils.ssh import SSHTail
+from cfme.utils.ssh import SSHLogFollower
 from cfme.utils.version import Version, get_stream, pick
 from cfme.utils.wait import wait_for, TimedOutError
 from fixtures import ui_coverage
 from fixtures.pytest_store import store
 from .db import ApplianceDB
+from .facts import ApplianceFacts, fact_property
+from .health import ApplianceHealth
 from .implementations.rest import ViaREST
 from .implementations.ssui import ViaSSUI
 from .implementations.ui import ViaUI
@@ -67,6 +69,12 @@ current_miqqe_version = _current_miqqe_version()
 
 
 class MiqApi(VanillaMiqApi):
+    def _sending_request(self, func, retries=2):
+        # every request goes through here, timed as e.g. ``rest get``
+        method = getattr(getattr(func, 'func', None), '__name__', 'request')
+        with perflog.timer('rest {}'.format(method)):
+            return super(MiqApi, self)._sending_request(func, retries=retries)
+
     def get_entity_by_href(self, href):
         """Parses the collections"""
         parsed = urlparse(href)
@@ -238,6 +246,8 @@ class IPAppliance(object):
     httpd = SystemdService.declare(unit_name='httpd')
     sssd = SystemdService.declare(unit_name='sssd')
     db = ApplianceDB.declare()
+    facts = ApplianceFacts.declare()
+    health = ApplianceHealth.declare()
 
     CONFIG_MAPPING = {
         'hostname': 'hostname',
@@ -525,7 +535,8 @@ class IPAppliance(object):
                 restart_evm = True
             if restart_evm:
                 self.restart_evm_service(log_callback=log_callback)
-            self.wait_for_web_ui(timeout=1800, log_callback=log_callback)
+            log_callback('Waiting for the evm service and the web UI')
+            self.health.wait_for_ready(components=('evm_service', 'web_ui'), timeout=1800)
 
     def configure_rhos_db_disk(self):
         loopback_script_path = "/usr/local/sbin/loopbacks"
@@ -802,7 +813,7 @@ class IPAppliance(object):
                 unpartitioned_disks.add(disk)
         return sorted('/dev/{}'.format(disk) for disk in unpartitioned_disks)
 
-    @cached_property
+    @fact_property
     def product_name(self):
         try:
             return self.rest_api.product_info['name']
@@ -836,7 +847,7 @@ class IPAppliance(object):
     def is_downstream(self):
         return self.product_name == 'CFME'
 
-    @cached_property
+    @fact_property
     def version(self):
         try:
             return Version(self.rest_api.server_info['version'])
@@ -844,7 +855,7 @@ class IPAppliance(object):
             self.log.exception('appliance.version could not be retrieved from REST, falling back')
             return self.ssh_client.vmdb_version
 
-    @cached_property
+    @fact_property
     def build(self):
         if not self.is_downstream:
             return 'master'
@@ -857,7 +868,7 @@ class IPAppliance(object):
                 raise RuntimeError('Unable to retrieve appliance VMDB version')
             return res.output.strip("\n")
 
-    @cached_property
+    @fact_property
     def os_version(self):
         # Currently parses the os version out of redhat release file to allow for
         # rhel and centos appliances
@@ -1114,11 +1125,7 @@ class IPAppliance(object):
         self.precompile_assets()
         self.restart_evm_service()
         logger.info("Waiting for Web UI to start")
-        wait_for(
-            func=self.is_web_ui_running,
-            message='appliance.is_web_ui_running',
-            delay=20,
-            timeout=300)
+        self.health.wait_for_ready(components=('evm_service', 'web_ui'), timeout=300)
         logger.info("Web UI is up and running")
         self.ssh_client.run_command(
             "echo '{}' > /var/www/miq/vmdb/.miqqe_version".format(current_miqqe_version))
@@ -1419,6 +1426,7 @@ class IPAppliance(object):
             msg = 'Appliance {} failed to update RHEL, error in logs'.format(self.hostname)
             log_callback(msg)
             raise ApplianceException(msg)
+        self.facts.invalidate()
 
         if reboot:
             self.reboot(wait_for_web_ui=False, log_callback=log_callback)
@@ -1462,9 +1470,13 @@ class IPAppliance(object):
         num_of_tries = 3
         was_running_count = 0
         for try_num in range(num_of_tries):
+            if try_num:
+                sleep(3)
             if self._check_appliance_ui_wait_fn():
                 was_running_count += 1
-            sleep(3)
+            if 0 < was_running_count <= try_num:
+                # it was both up and down already, more tries can't change the answer
+                return unsure
 
         if was_running_count == 0:
             return False
@@ -1561,7 +1573,7 @@ class IPAppliance(object):
             num_sec=600, message='appliance to reboot', delay=10)
 
         if wait_for_web_ui:
-            self.wait_for_web_ui()
+            self.health.wait_for_ready(components=('evm_service', 'web_ui'))
 
     @logger_wrap("Waiting for web_ui: {}")
     def wait_for_web_ui(self, timeout=900, running=True, log_callback=None):
@@ -1718,10 +1730,7 @@ class IPAppliance(object):
             result = ssh.run_command(guid_gen)
             assert result.success, 'Failed to generate UUID'
         log_callback('Updated UUID: {}'.format(str(result)))
-        try:
-            del self.__dict__['guid']  # invalidate cached_property
-        except KeyError:
-            logger.exception('Exception clearing cached_property "guid"')
+        self.facts.invalidate()
         return str(result).rstrip('\n')  # should return UUID from stdout
 
     def wait_for_ssh(self, timeout=600):
@@ -1853,7 +1862,7 @@ class IPAppliance(object):
     def has_netapp(self):
         return self.ssh_client.appliance_has_netapp()
 
-    @cached_property
+    @fact_property
     def guid(self):
         try:
             server = self.rest_api.get_entity_by_href(self.rest_api.server_info['server_href'])
@@ -1863,7 +1872,7 @@ class IPAppliance(object):
             result = self.ssh_client.run_command('cat /var/www/miq/vmdb/GUID')
             return result.output
 
-    @cached_property
+    @fact_property
     def evm_id(self):
         try:
             server = self.rest_api.get_entity_by_href(self.rest_api.server_info['server_href'])
@@ -2208,31 +2217,30 @@ class IPAppliance(object):
         self.update_advanced_settings(yaml_data)
 
     def wait_for_miq_server_workers_started(self, evm_tail=None, poll_interval=5):
-        """Waits for the CFME's workers to be started by tailing evm.log for:
+        """Waits for the CFME's workers to be started by following evm.log for:
         'INFO -- : MIQ(MiqServer#wait_for_started_workers) All workers have been started'
+
+        Args:
+            evm_tail: A started :py:class:`cfme.utils.ssh.SSHLogFollower` of evm.log, to catch
+                the message of workers started by something done before this is called
+            poll_interval: The timeout is 60 times that, kept from the polling days
         """
         if evm_tail is None:
-            logger.info('Opening /var/www/miq/vmdb/log/evm.log for tail')
-            evm_tail = SSHTail('/var/www/miq/vmdb/log/evm.log')
-            evm_tail.set_initial_file_end()
-
-        attempts = 0
-        detected = False
-        max_attempts = 60
-        while (not detected and attempts < max_attempts):
-            logger.debug('Attempting to detect MIQ Server workers started: {}'.format(attempts))
-            for line in evm_tail:
-                if 'MiqServer#wait_for_started_workers' in line:
-                    if ('All workers have been started' in line):
-                        logger.info('Detected MIQ Server is ready.')
-                        detected = True
-                        break
-            sleep(poll_interval)  # Allow more log lines to accumulate
-            attempts += 1
-        if not (attempts < max_attempts):
-            logger.error('Could not detect MIQ Server workers started in {}s.'.format(
-                poll_interval * max_attempts))
-        evm_tail.close()
+            logger.info('Following /var/www/miq/vmdb/log/evm.log')
+            evm_tail = SSHLogFollower(
+                '/var/www/miq/vmdb/log/evm.log', grep_pattern='MiqServer#wait_for_started_workers')
+            evm_tail.start()
+
+        timeout = poll_interval * 60
+        try:
+            evm_tail.wait_for_line(
+                'MiqServer#wait_for_started_workers.*All workers have been started',
+                timeout=timeout)
+            logger.info('Detected MIQ Server is ready.')
+        except TimedOutError:
+            logger.error('Could not detect MIQ Server workers started in {}s.'.format(timeout))
+        finally:
+            evm_tail.close()
 
     @logger_wrap("Setting dev branch: {}")
     def use_dev_branch(self, repo, branch, log_callback=None):
@@ -2254,9 +2262,9 @@ class IPAppliance(object):
             ssh_client.run_command(
                 'cd /var/www/miq/vmdb; git checkout dev_branch/{}'.format(branch))
             ssh_client.run_command('cd /var/www/miq/vmdb; bin/update')
+            self.facts.invalidate()
             self.start_evm_service()
-            self.wait_for_evm_service()
-            self.wait_for_web_ui()
+            self.health.wait_for_ready(components=('evm_service', 'web_ui'), timeout=1800)
 
     def check_domain_enabled(self, domain):
         namespaces = self.db.client["miq_ae_namespaces"]
@@ -2501,7 +2509,8 @@ class Appliance(IPAppliance):
             else:
                 self.db.enable_external(
                     db_address, region, db_name, db_username, db_password)
-        self.wait_for_web_ui(timeout=1800, log_callback=log_callback)
+        log_callback('Waiting for the evm service and the web UI')
+        self.health.wait_for_ready(components=('evm_service', 'web_ui'), timeout=1800)
         if kwargs.get('loosen_pgssl', True) is True:
             self.db.loosen_pgssl()
 
@@ -2509,7 +2518,8 @@ class Appliance(IPAppliance):
         if name_to_set is not None and name_to_set != self.name:
             self.rename(name_to_set)
             self.restart_evm_service(log_callback=log_callback)
-            self.wait_for_web_ui(log_callback=log_callback)
+            log_callback('Waiting for the evm service and the web UI')
+            self.health.wait_for_ready(components=('evm_service', 'web_ui'))
 
         # Set fqdn for openstack appliance
         # If hostname is IP or resolvable, try hostname lookup and set it
@@ -185,6 +185,7 @@ class ApplianceDB(AppliancePlugin):
                 result.output)
             self.logger.error(msg)
             raise ApplianceException(msg)
+        self.appliance.facts.invalidate()
         if self.appliance.version > '5.8':
             result = self.ssh_client.run_command("fix_auth --databaseyml -i {}".format(
                 conf.credentials['database'].password), timeout=45)
@@ -218,6 +219,8 @@ class ApplianceDB(AppliancePlugin):
         # Make sure the database is ready
         wait_for(func=lambda: self.is_ready,
             message='appliance db ready', delay=20, num_sec=1200)
+        # the new database has a server record of its own
+        self.appliance.facts.invalidate()
 
         self.logger.info('DB setup complete')
 
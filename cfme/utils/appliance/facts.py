@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Local cache of appliance facts that only change with an upgrade, restore or reconfigure
+
+Facts like the version or the GUID of an appliance are looked up over REST, SSH or the database.
+Every pytest slave and every script used to do that again, this keeps them in a json file per
+appliance under ``.cache/appliance_facts/`` instead. The cached facts belong to the appliance
+identity (GUID and ``VERSION`` file) they were looked up for. Every process checks the identity
+with one SSH command before it uses the cached facts of an appliance the first time, and again
+when the entry gets older than ``max_age`` seconds, so a redeployed appliance with the same
+hostname doesn't inherit stale facts. If the identity can't be checked, the cache isn't used.
+
+Properties of :py:class:`cfme.utils.appliance.IPAppliance` use the cache with
+:py:func:`fact_property`. Code that upgrades, restores or reconfigures the appliance calls
+:py:meth:`ApplianceFacts.invalidate`.
+
+It can be tuned in env.yaml:
+
+.. code-block:: yaml
+
+    appliance_facts:
+        cache: True
+        # seconds after which the appliance identity is checked again
+        max_age: 3600
+"""
+import json
+import os
+from functools import wraps
+from time import time
+
+import attr
+import diaper
+from cached_property import cached_property
+
+from cfme.utils import conf
+from cfme.utils.path import cache_path
+from cfme.utils.version import Version
+
+from .plugin import AppliancePlugin
+
+#: Names of the appliance properties made with :py:func:`fact_property`
+FACT_PROPERTIES = set()
+#: Facts stored as strings that are turned back into Versions
+VERSION_FACTS = {'version', 'os_version'}
+#: Appliance properties that are derived from facts and cleared with them
+DERIVED_PROPERTIES = ('is_downstream', 'build_datetime', 'build_date')
+# Prints the appliance identity, a new GUID means a new database, a new VERSION an upgrade
+IDENTITY_COMMAND = 'cat /var/www/miq/vmdb/GUID; echo; cat /var/www/miq/vmdb/VERSION'
+
+
+def fact_property(func):
+    """:py:class:`cached_property` of the appliance, kept in its :py:class:`ApplianceFacts`
+
+    The decorated function is only called if the fact isn't cached yet.
+    """
+    name = func.__name__
+    FACT_PROPERTIES.add(name)
+
+    @wraps(func)
+    def getter(appliance):
+        return appliance.facts.get(name, lambda: func(appliance))
+    return cached_property(getter)
+
+
+@attr.s
+class ApplianceFacts(AppliancePlugin):
+    """Cached facts of an appliance, see the module docs"""
+    # whether this process checked the identity of the appliance already
+    _identity_checked = attr.ib(default=False, init=False, repr=False)
+
+    @cached_property
+    def settings(self):
+        return conf.env.get('appliance_facts', {})
+
+    @property
+    def enabled(self):
+        return self.settings.get('cache', True)
+
+    @property
+    def cache_file(self):
+        return cache_path.join('appliance_facts', '{}.json'.format(
+            self.appliance.hostname.replace(os.sep, '_')))
+
+    def _load(self):
+        try:
+            with self.cache_file.open() as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {'identity': None, 'checked': 0, 'facts': {}}
+
+    def _save(self, entry):
+        # written to a temporary file and renamed, pytest slaves share the file
+        self.cache_file.dirpath().ensure(dir=True)
+        tmp_file = self.cache_file.new(
+            basename='{}.{}'.format(self.cache_file.basename, os.getpid()))
+        with tmp_file.open('w') as f:
+            json.dump(entry, f, indent=2, sort_keys=True)
+        os.rename(tmp_file.strpath, self.cache_file.strpath)
+
+    def _identity(self):
+        try:
+            result = self.appliance.ssh_client.run_command(IDENTITY_COMMAND)
+        except Exception:
+            self.logger.warning('Could not check the identity of appliance %s',
+                                self.appliance.hostname)
+            return None
+        if result.failed:
+            return None
+        return ' '.join(result.output.split())
+
+    def validate(self):
+        """Check the appliance identity and drop the cached facts if it changed
+
+        Returns:
+            Whether the identity could be checked
+        """
+        if not self.enabled:
+            return False
+        entry = self._load()
+        identity = self._identity()
+        if identity is None:
+            return False
+        if entry['identity'] != identity:
+            if entry['identity'] is not None:
+                self.logger.info('Appliance %s changed, dropping its cached facts',
+                                 self.appliance.hostname)
+            entry = {'identity': identity, 'checked': time(), 'facts': {}}
+        else:
+            entry['checked'] = time()
+        self._save(entry)
+        self._identity_checked = True
+        return True
+
+    def _entry(self):
+        entry = self._load()
+        if (not self._identity_checked or
+                time() - entry['checked'] > self.settings.get('max_age', 3600)):
+            if not self.validate():
+                return None
+            entry = self._load()
+        return entry
+
+    def get(self, name, fetch):
+        """Get the cached fact ``name``, look it up with ``fetch`` if it isn't cached"""
+        if not self.enabled:
+            return fetch()
+        entry = self._entry()
+        if entry is None:
+            # the appliance is unreachable, its cached facts may be another one's
+            return fetch()
+        if name in entry['facts']:
+            value = entry['facts'][name]
+            return Version(value) if name in VERSION_FACTS else value
+        identity = entry['identity']
+        value = fetch()
+        # reloaded, another process may have added facts or found another appliance meanwhile
+        entry = self._load()
+        if entry['identity'] == identity:
+            entry['facts'][name] = value.vstring if name in VERSION_FACTS else value
+            self._save(entry)
+        return value
+
+    def invalidate(self):
+        """Drop the cached facts, on disk and in the appliance's properties"""
+        self.logger.info('Invalidating the cached facts of appliance %s', self.appliance.hostname)
+        with diaper:
+            self.cache_file.remove()
+        # self.appliance is a weak proxy, its __class__ is the one of the appliance
+        appliance_class = self.appliance.__class__
+        for name in FACT_PROPERTIES | set(DERIVED_PROPERTIES):
+            if isinstance(getattr(appliance_class, name, None), cached_property):
+                self.appliance.__dict__.pop(name, None)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Concurrent readiness probe of the appliance components
+
+Usage:
+
+.. code-block:: python
+
+    status = appliance.health.probe()
+    if not status.ready:
+        print(status.failed)  # e.g. ['web_ui', 'rest_api']
+
+    # after a restart, takes as long as the slowest component
+    appliance.health.wait_for_ready(timeout=900)
+"""
+from time import sleep, time
+
+import attr
+import requests
+from concurrent import futures
+
+from cfme.utils import conf
+from cfme.utils.wait import TimedOutError
+
+from .plugin import AppliancePlugin
+
+
+@attr.s
+class ComponentStatus(object):
+    """Result of checking one component, ``detail`` explains why it isn't up"""
+    name = attr.ib()
+    up = attr.ib()
+    detail = attr.ib(default=None)
+    duration = attr.ib(default=None, repr=False)
+
+
+@attr.s
+class HealthStatus(object):
+    """Snapshot of the component statuses taken by :py:meth:`ApplianceHealth.probe`"""
+    components = attr.ib()
+    taken_at = attr.ib(default=attr.Factory(time))
+
+    def __getitem__(self, name):
+        return self.components[name]
+
+    @property
+    def up(self):
+        return sorted(name for name, status in self.components.items() if status.up)
+
+    @property
+    def failed(self):
+        return sorted(name for name, status in self.components.items() if not status.up)
+
+    @property
+    def ready(self):
+        return not self.failed
+
+    @property
+    def down(self):
+        return not self.up
+
+    def __str__(self):
+        return ', '.join(
+            '{}: {}'.format(name, 'up' if status.up else status.detail or 'down')
+            for name, status in sorted(self.components.items()))
+
+
+@attr.s
+class ApplianceHealth(AppliancePlugin):
+    """Checks the evm service, web UI, REST API and Postgres of the appliance concurrently
+
+    Every component has a ``check_<name>`` method returning ``(up, detail)``.
+    """
+    COMPONENTS = ('evm_service', 'web_ui', 'rest_api', 'postgres')
+    #: Timeout of the single HTTP requests, in seconds
+    http_timeout = attr.ib(default=15)
+
+    def check_evm_service(self):
+        result = self.appliance.ssh_client.run_command('systemctl is-active evmserverd')
+        return result.success, result.output.strip()
+
+    def check_web_ui(self):
+        response = requests.get(self.appliance.url, timeout=self.http_timeout, verify=False)
+        return response.status_code == 200, 'status code {}'.format(response.status_code)
+
+    def check_rest_api(self):
+        response = requests.get(
+            self.appliance.url_path('/api'), timeout=self.http_timeout, verify=False,
+            auth=(conf.credentials['default']['username'],
+                  conf.credentials['default']['password']))
+        return response.status_code == 200, 'status code {}'.format(response.status_code)
+
+    def check_postgres(self):
+        return self.appliance.db.is_online, 'not accepting connections'
+
+    def _check(self, name):
+        started = time()
+        try:
+            up, detail = getattr(self, 'check_{}'.format(name))()
+        except ValueError:
+            # requests exposes invalid URLs as ValueErrors, don't hide them
+            raise
+        except Exception as e:
+            up, detail = False, '{}: {}'.format(type(e).__name__, e)
+        return ComponentStatus(name, up, None if up else detail, duration=time() - started)
+
+    def probe(self, components=COMPONENTS):
+        """Check the components at once
+
+        Returns:
+            A :py:class:`HealthStatus`, it takes as long as the slowest check
+        """
+        executor = futures.ThreadPoolExecutor(max_workers=len(components))
+        try:
+            checks = {name: executor.submit(self._check, name) for name in components}
+            status = HealthStatus({name: check.result() for name, check in checks.items()})
+        finally:
+            executor.shutdown(wait=True)
+        self.logger.debug('Health of %s: %s', self.appliance.hostname, status)
+        return status
+
+    def wait_for(self, condition, components=COMPONENTS, timeout=900, delay=2, max_delay=30,
+                 callback=None, message='appliance health'):
+        """Probe the components until ``condition`` holds for the :py:class:`HealthStatus`
+
+        The delay between the probes doubles from ``delay`` up to ``max_delay`` seconds.
+
+        Args:
+            callback: Called with every :py:class:`HealthStatus`, e.g. to report the progress.
+
+        Returns:
+            The :py:class:`HealthStatus` that met the condition.
+
+        Raises:
+            :py:class:`cfme.utils.wait.TimedOutError` with the last status if the timeout passed
+        """
+        deadline = time() + timeout
+        while True:
+            status = self.probe(components)
+            if callback is not None:
+                callback(status)
+            if condition(status):
+                return status
+            left = deadline - time()
+            if left <= 0:
+                raise TimedOutError('Timed out waiting for {} after {}s, last status: {}'.format(
+                    message, timeout, status))
+            sleep(min(delay, left))
+            delay = min(delay * 2, max_delay)
+
+    def wait_for_ready(self, components=COMPONENTS, **kwargs):
+        """Wait until all the components are up, see :py:meth:`wait_for`"""
+        kwargs.setdefault('message', '{} to be up'.format(', '.join(components)))
+        return self.wait_for(lambda status: status.ready, components, **kwargs)
+
+    def wait_for_down(self, components=COMPONENTS, **kwargs):
+        """Wait until all the components are down, see :py:meth:`wait_for`"""
+        kwargs.setdefault('message', '{} to be down'.format(', '.join(components)))
+        return self.wait_for(lambda status: status.down, components, **kwargs)
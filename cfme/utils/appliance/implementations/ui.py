@@ -18,7 +18,7 @@ from widgetastic.widget import Text, View
 
 from cfme import exceptions
 from cfme.utils.browser import manager
-from cfme.utils.log import logger, create_sublogger
+from cfme.utils.log import logger, create_sublogger, perflog
 from cfme.utils.version import Version
 from cfme.utils.wait import wait_for
 from fixtures.pytest_store import store
@@ -501,7 +501,10 @@ class CFMENavigateStep(NavigateStep):
             self.check_for_badness(self.resetter, _tries, nav_args, *args, **kwargs)
         self.check_for_badness(self.post_navigate, _tries, nav_args, *args, **kwargs)
         view = self.view if self.VIEW is not None else None
-        duration = int((time.time() - start_time) * 1000)
+        elapsed = time.time() - start_time
+        duration = int(elapsed * 1000)
+        class_name = self.obj.__name__ if isclass(self.obj) else self.obj.__class__.__name__
+        perflog.metrics.record_time('navigate {}:{}'.format(class_name, self._name), elapsed)
         if view and nav_args['wait_for_view'] and not os.environ.get(
                 'DISABLE_NAVIGATE_ASSERT', False):
             waited = True
@@ -1,20 +1,62 @@
+import os
+import threading
 from collections import Mapping
 from contextlib import contextmanager
 from itertools import izip
+from time import time
 
+import sqlalchemy
 from cached_property import cached_property
+from six.moves import cPickle as pickle
 from sqlalchemy import MetaData, create_engine, event, inspect
-from sqlalchemy.exc import ArgumentError, DisconnectionError, InvalidRequestError
+from sqlalchemy.exc import (
+    ArgumentError, DisconnectionError, InvalidRequestError, SQLAlchemyError)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import Pool
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
 
 from fixtures.pytest_store import store
 from cfme.utils import conf
-from cfme.utils.log import logger
+from cfme.utils.log import logger, perflog
+from cfme.utils.path import cache_path
+
+#: Reflected schemas are kept here, one file per schema migration level
+schema_cache_path = cache_path.join('db_schema')
+
+#: Connection pool settings, overridden by ``db_pool`` in env.yaml
+POOL_DEFAULTS = {
+    # connections kept open, and opened on top of them when all are checked out
+    'pool_size': 5,
+    'max_overflow': 10,
+    # seconds to wait for a connection when the pool is exhausted
+    'pool_timeout': 30,
+    # seconds after which connections are replaced, postgres or a firewall may drop idle ones
+    'pool_recycle': 3600,
+    # check connections with a ``SELECT 1`` when they're checked out of the pool
+    'pre_ping': True,
+    'echo_pool': False,
+}
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection as ``db pool wait``"""
+    def _do_get(self):
+        started = time()
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        finally:
+            perflog.metrics.record_time('db pool wait', time() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # kept on the statement's context, after_cursor_execute isn't called for failed statements
+    context._query_started = time()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    perflog.metrics.record_time('db query', time() - context._query_started)
 
 
-@event.listens_for(Pool, "checkout")
 def ping_connection(dbapi_connection, connection_record, connection_proxy):
     """ping_connection event hook, used to reconnect db sessions that time out
 
@@ -68,9 +110,17 @@ class Db(Mapping):
         a latent connection, this can be extremely slow, which will affect methods that return
         tables, like the mapping interface or :py:meth:`values`.
 
+        Therefore the reflected tables are kept in a file under :py:data:`schema_cache_path`,
+        that's shared by all databases with the same :py:attr:`schema_version`. Tables found
+        there aren't reflected again, by any process or session.
+
     """
     def __init__(self, hostname=None, credentials=None, port=None):
         self._table_cache = {}
+        # mtime of the schema cache file when it was last read or written by this instance
+        self._schema_cache_mtime = None
+        # guards reflecting into the metadata and writing it to the schema cache
+        self._reflect_lock = threading.Lock()
         self.hostname = hostname or store.current_appliance.db.address
         self.port = port or store.current_appliance.db_port
 
@@ -114,6 +164,8 @@ class Db(Mapping):
 
     def values(self):
         """Iterator of tables in this db"""
+        # reflect the missing tables in one go, so the schema cache is only written once
+        self.reflect_tables(self.table_names)
         return (self[table_name] for table_name in self.table_names)
 
     def get(self, table_name, default=None):
@@ -146,15 +198,47 @@ class Db(Mapping):
         """Check if this db is not equal to another db"""
         return not self == other
 
+    @cached_property
+    def pool_settings(self):
+        """Connection pool settings, :py:data:`POOL_DEFAULTS` updated by ``db_pool`` in env.yaml"""
+        settings = dict(POOL_DEFAULTS)
+        settings.update(conf.env.get('db_pool', {}))
+        return settings
+
+    def _create_engine(self, **kwargs):
+        settings = dict(self.pool_settings)
+        pre_ping = settings.pop('pre_ping')
+        settings.update(kwargs)
+        engine = create_engine(self.db_url, poolclass=TimedQueuePool, **settings)
+        if pre_ping:
+            event.listen(engine, 'checkout', ping_connection)
+        # query latency, recorded as ``db query``
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        return engine
+
     @cached_property
     def engine(self):
         """The :py:class:`Engine <sqlalchemy:sqlalchemy.engine.Engine>` for this database
 
         It uses pessimistic disconnection handling, checking that the database is still
-        connected before executing commands.
+        connected before executing commands. The pool is set up by :py:attr:`pool_settings`.
+
+        """
+        return self._create_engine()
+
+    @cached_property
+    def readonly_engine(self):
+        """Engine for :py:attr:`readonly_session`
+
+        Its connections are in autocommit mode, so queries don't need the extra round trips
+        to begin and end a transaction, and postgres refuses any writes through them.
+        It has a pool of its own, the connection settings don't leak into the other sessions.
 
         """
-        return create_engine(self.db_url, echo_pool=True)
+        return self._create_engine(
+            isolation_level='AUTOCOMMIT',
+            connect_args={'options': '-c default_transaction_read_only=on'})
 
     @cached_property
     def sessionmaker(self):
@@ -165,6 +249,16 @@ class Db(Mapping):
         """
         return sessionmaker(bind=self.engine)
 
+    @cached_property
+    def scoped_session(self):
+        """Thread-local registry of :py:attr:`session`"""
+        return scoped_session(sessionmaker(bind=self.engine, autocommit=True))
+
+    @cached_property
+    def scoped_readonly_session(self):
+        """Thread-local registry of :py:attr:`readonly_session`"""
+        return scoped_session(sessionmaker(bind=self.readonly_engine, autocommit=True))
+
     @cached_property
     def table_base(self):
         """Base class for all tables returned by this database
@@ -186,7 +280,68 @@ class Db(Mapping):
             use :py:meth:`reflect_table`.
 
         """
-        return MetaData(bind=self.engine)
+        metadata = self._load_schema_cache() or MetaData()
+        metadata.bind = self.engine
+        return metadata
+
+    @cached_property
+    def schema_version(self):
+        """Migration level of the database schema, ``None`` if it can't be determined
+
+        It's made of the latest and the number of applied rails migrations, so it's cheap to get
+        and changes whenever the schema does.
+        """
+        try:
+            count, latest = self.engine.execute(
+                'SELECT count(*), max(version) FROM schema_migrations').first()
+        except SQLAlchemyError:
+            logger.exception('[DB] Unable to determine the schema version')
+            return None
+        return '{}-{}'.format(latest, count)
+
+    @property
+    def schema_cache_file(self):
+        """File the reflected tables are kept in, ``None`` if the schema version is unknown"""
+        if self.schema_version is None:
+            return None
+        # pickles of one sqlalchemy version can't always be loaded by another one
+        return schema_cache_path.join('{}-sqlalchemy-{}.pickle'.format(
+            self.schema_version, sqlalchemy.__version__))
+
+    def _load_schema_cache(self):
+        cache_file = self.schema_cache_file
+        if cache_file is None or not cache_file.check():
+            return None
+        try:
+            mtime = cache_file.mtime()
+            with cache_file.open('rb') as f:
+                metadata = pickle.load(f)
+            self._schema_cache_mtime = mtime
+            return metadata
+        except Exception:
+            logger.warning('[DB] Unable to load the schema cache %s', cache_file.strpath)
+            return None
+
+    def _save_schema_cache(self):
+        cache_file = self.schema_cache_file
+        if cache_file is None:
+            return
+        # add the tables other processes reflected in the meantime, so they're not dropped
+        if cache_file.check() and cache_file.mtime() != self._schema_cache_mtime:
+            cached = self._load_schema_cache()
+            if cached is not None:
+                for table in cached.sorted_tables:
+                    if table.name not in self.metadata.tables:
+                        table.tometadata(self.metadata)
+        cache_file.dirpath().ensure(dir=True)
+        # written to a temporary file and renamed, the file is shared by parallel processes
+        # and by the threads of other Db instances
+        tmp_file = cache_file.new(basename='{}.{}.{}'.format(
+            cache_file.basename, os.getpid(), threading.current_thread().ident))
+        with tmp_file.open('wb') as f:
+            pickle.dump(self.metadata, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_file.strpath, cache_file.strpath)
+        self._schema_cache_mtime = cache_file.mtime()
 
     @cached_property
     def db_url(self):
@@ -202,7 +357,7 @@ class Db(Mapping):
         # rails table names follow similar rules as pep8 identifiers; expose them as such
         return sorted(inspect(self.engine).get_table_names())
 
-    @cached_property
+    @property
     def session(self):
         """Returns a :py:class:`Session <sqlalchemy:sqlalchemy.orm.session.Session>`
 
@@ -211,11 +366,27 @@ class Db(Mapping):
 
         Note:
 
-            This attribute is cached. In cases where a new session needs to be explicitly created,
+            Every thread gets a session of its own, which is kept until :py:meth:`remove_sessions`
+            is called in that thread. In cases where a new session needs to be explicitly created,
             use :py:meth:`sessionmaker`.
 
         """
-        return self.sessionmaker(autocommit=True)
+        return self.scoped_session()
+
+    @property
+    def readonly_session(self):
+        """Returns a thread-local session for frequent read only queries
+
+        See :py:attr:`readonly_engine`, writes through it fail.
+
+        """
+        return self.scoped_readonly_session()
+
+    def remove_sessions(self):
+        """Close the sessions of the current thread, e.g. before a thread finishes"""
+        self.scoped_session.remove()
+        if 'scoped_readonly_session' in self.__dict__:
+            self.scoped_readonly_session.remove()
 
     @property
     @contextmanager
@@ -245,8 +416,27 @@ class Db(Mapping):
         Args:
             table_name: The name of a table to reflect
 
+        Tables that are already known, e.g. from the schema cache, aren't reflected again.
+
+        """
+        self.reflect_tables([table_name])
+
+    def reflect_tables(self, table_names):
+        """Populate :py:attr:`metadata` with information on several tables
+
+        Args:
+            table_names: The names of the tables to reflect
+
+        Like :py:meth:`reflect_table`, but the missing tables are reflected together and the
+        schema cache is written once for all of them.
+
         """
-        self.metadata.reflect(only=[table_name])
+        with self._reflect_lock:
+            missing = [name for name in table_names if name not in self.metadata.tables]
+            if not missing:
+                return
+            self.metadata.reflect(only=missing)
+            self._save_schema_cache()
 
     def _table(self, table_name):
         """Retrieves, reflects, and caches table objects
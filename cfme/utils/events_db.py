@@ -1,21 +1,64 @@
 # -*- coding: utf-8 -*-
 
 """Library for event testing.
+
+:py:class:`DbEventListener` polls ``event_streams`` for new events by default. In push mode it
+installs a trigger notifying :py:data:`NOTIFY_CHANNEL` with the id of every new event and waits
+for the notifications instead, polling only every ``push_poll_interval`` seconds in case one was
+missed. It falls back to polling if the trigger can't be installed or the connection breaks.
+The listener that stops last drops the trigger again, so the appliance database is left as it
+was. Push mode is turned on in env.yaml:
+
+.. code-block:: yaml
+
+    event_listener:
+        push: True
+        push_poll_interval: 10
 """
 
 from cached_property import cached_property
 from contextlib import contextmanager
-from collections import Iterable
+from collections import Iterable, defaultdict
 from datetime import datetime
 from numbers import Number
+from select import select
 from sqlalchemy.sql.expression import func
-from time import sleep
+from time import sleep, time
 from threading import Thread, Event as ThreadEvent
 
+from cfme.utils import conf
 from cfme.utils.log import create_sublogger
 
 logger = create_sublogger('events')
 
+#: Channel notified with the ids of new events by :py:data:`NOTIFY_TRIGGER`
+NOTIFY_CHANNEL = 'cfme_event_streams'
+#: Trigger on ``event_streams`` installed by :py:class:`DbEventListener` in push mode
+NOTIFY_TRIGGER = 'cfme_notify_event_streams'
+NOTIFY_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION {trigger}() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{channel}', NEW.id::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS {trigger} ON event_streams;
+CREATE TRIGGER {trigger} AFTER INSERT ON event_streams
+    FOR EACH ROW EXECUTE PROCEDURE {trigger}();
+""".format(trigger=NOTIFY_TRIGGER, channel=NOTIFY_CHANNEL)
+# dropped unless another session still listens, an idle listening session's last query is LISTEN
+NOTIFY_TRIGGER_DROP_SQL = """
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_stat_activity
+                   WHERE pid <> pg_backend_pid() AND query = 'LISTEN {channel}') THEN
+        DROP TRIGGER IF EXISTS {trigger} ON event_streams;
+        DROP FUNCTION IF EXISTS {trigger}();
+    END IF;
+END;
+$$;
+""".format(trigger=NOTIFY_TRIGGER, channel=NOTIFY_CHANNEL)
+
 
 class EventTool(object):
     """EventTool serves as a wrapper to getting the events from the database.
@@ -285,13 +328,25 @@ class DbEventListener(Thread):
     """
      accepts "expected" events, listens to db events and compares showed up events with expected
      events. Runs callback function if expected events have it.
+
+     Args:
+         push: Wait for notifications of new events instead of polling, see the module docs.
+               Defaults to ``push`` of ``event_listener`` in env.yaml.
     """
-    def __init__(self, appliance):
+    def __init__(self, appliance, push=None):
         super(DbEventListener, self).__init__()
         self._appliance = appliance
         self._tool = EventTool(self._appliance)
+        settings = conf.env.get('event_listener', {})
+        self.push = settings.get('push', False) if push is None else push
+        self.push_poll_interval = settings.get('push_poll_interval', 10)
+        # the connection listening to NOTIFY_CHANNEL in push mode
+        self._notify_conn = None
 
         self._events_to_listen = []
+        # expected events by their _index_key, so an event is only compared with expected events
+        # of its event type and target type
+        self._events_index = defaultdict(list)
         # last_id is used to ignore already arrived messages the database
         # When database is "cleared" the id of the last event is placed here. That is then used
         # in queries to prevent events of this id and earlier to get in.
@@ -356,10 +411,12 @@ class DbEventListener(Thread):
             for evt in evts:
                 if isinstance(evt, Event):
                     logger.info("event {} is added to listening queue".format(evt))
-                    self._events_to_listen.append({'event': evt,
-                                                   'callback': callback,
-                                                   'matched_events': [],
-                                                   'first_event': first_event})
+                    exp_event = {'event': evt,
+                                 'callback': callback,
+                                 'matched_events': [],
+                                 'first_event': first_event}
+                    self._events_to_listen.append(exp_event)
+                    self._events_index[self._index_key(evt)].append(exp_event)
                 else:
                     raise ValueError("one of events doesn't belong to Event class")
         else:
@@ -376,7 +433,14 @@ class DbEventListener(Thread):
         self._stop_event.set()
 
     def run(self):
-        self.process_events()
+        try:
+            self.process_events()
+        finally:
+            self._stop_notifications()
+            if self.push:
+                self.remove_notify_trigger()
+            # the sessions of this thread
+            self._appliance.db.client.remove_sessions()
 
     @property
     def started(self):
@@ -387,26 +451,121 @@ class DbEventListener(Thread):
         processes all new db events and compares them with expected events.
         processed events are ignored next time
         """
+        if self.push:
+            self._start_notifications()
         while not self._stop_event.is_set():
             events = self.get_next_portion()
             if len(events) == 0:
-                sleep(0.2)
+                self._wait_for_events()
                 continue
             for got_event in events:
                 logger.debug("processing event id {}".format(got_event.id))
                 got_event = Event(event_tool=self._tool).build_from_raw_event(got_event)
-                for exp_event in self._events_to_listen:
-                    if exp_event['first_event'] and len(exp_event['matched_events']) > 0:
-                        continue
-
-                    if exp_event['event'].matches(got_event):
-                        if exp_event['callback']:
-                            exp_event['callback'](exp_event=exp_event['event'], got_event=got_event)
-                        exp_event['matched_events'].append(got_event)
-                self.set_last_record(got_event)
-
+                self.process_event(got_event)
                 if self._stop_event.is_set():
                     break
+            self.set_last_record(got_event)
+
+    def process_event(self, got_event):
+        """
+        compares an event with the expected events of its event type and target type
+        """
+        for exp_event in self._expected_events_for(got_event):
+            if exp_event['first_event'] and len(exp_event['matched_events']) > 0:
+                continue
+
+            if exp_event['event'].matches(got_event):
+                if exp_event['callback']:
+                    exp_event['callback'](exp_event=exp_event['event'], got_event=got_event)
+                exp_event['matched_events'].append(got_event)
+
+    @staticmethod
+    def _index_key(evt):
+        """
+        (event_type, target_type) of an event. None stands for any value, e.g. when an expected
+        event doesn't define it or compares it with a cmp_func.
+        """
+        key = []
+        for name in ('event_type', 'target_type'):
+            attr = evt.event_attrs.get(name)
+            key.append(None if attr is None or attr.cmp_func or not attr.value else attr.value)
+        return tuple(key)
+
+    def _expected_events_for(self, got_event):
+        event_type, target_type = self._index_key(got_event)
+        keys = [(event_type, target_type), (event_type, None), (None, target_type), (None, None)]
+        # a key is there twice when the got event lacks one of the attributes
+        return [exp_event for key in sorted(set(keys), key=keys.index)
+                for exp_event in self._events_index.get(key, [])]
+
+    def _start_notifications(self):
+        """
+        installs the trigger notifying about new events, unless it's there already,
+        and listens to its notifications. polling is used if that fails.
+        """
+        try:
+            self._notify_conn = self._appliance.db.client.engine.raw_connection()
+            # closed when the listener stops, instead of going back to the pool still listening
+            self._notify_conn.detach()
+            conn = self._notify_conn.connection
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1 FROM pg_trigger WHERE tgname = %s', (NOTIFY_TRIGGER,))
+            if cursor.fetchone() is None:
+                logger.info("installing trigger {} on event_streams".format(NOTIFY_TRIGGER))
+                cursor.execute(NOTIFY_TRIGGER_SQL)
+            cursor.execute('LISTEN {}'.format(NOTIFY_CHANNEL))
+            cursor.close()
+            logger.info("listening to new events on channel {}".format(NOTIFY_CHANNEL))
+        except Exception as e:
+            logger.warning("can't listen to new events, polling for them: {}".format(e))
+            self._stop_notifications()
+
+    def _stop_notifications(self):
+        if self._notify_conn is not None:
+            try:
+                self._notify_conn.close()
+            except Exception:
+                pass
+            self._notify_conn = None
+
+    def remove_notify_trigger(self):
+        """
+        drops the trigger notifying about new events unless another listener is still using it.
+        called when the listener stops, a trigger left behind by a killed session is dropped
+        with the next listener in push mode.
+        """
+        try:
+            with self._appliance.db.client.engine.begin() as conn:
+                conn.execute(NOTIFY_TRIGGER_DROP_SQL)
+        except Exception as e:
+            logger.warning("can't remove trigger {}: {}".format(NOTIFY_TRIGGER, e))
+
+    def _wait_for_events(self):
+        """
+        waits until new events may have arrived: a notification came, the listener is stopped
+        or push_poll_interval passed. sleeps for a moment in polling mode.
+        """
+        if self._notify_conn is None:
+            sleep(0.2)
+            return
+        conn = self._notify_conn.connection
+        deadline = time() + self.push_poll_interval
+        try:
+            # in short steps, so stopping the listener doesn't wait for the whole interval
+            while not self._stop_event.is_set() and time() < deadline:
+                if not select([conn], [], [], 0.5)[0]:
+                    continue
+                conn.poll()
+                if conn.notifies:
+                    logger.debug("notified about events {}".format(
+                        ", ".join(notify.payload for notify in conn.notifies)))
+                    del conn.notifies[:]
+                    return
+        except Exception as e:
+            logger.warning("lost the notifications about new events, polling for them: {}"
+                           .format(e))
+            self._stop_notifications()
 
     @property
     def got_events(self):
@@ -423,12 +582,14 @@ class DbEventListener(Thread):
 
     def reset_events(self):
         self._events_to_listen = []
+        self._events_index = defaultdict(list)
 
     def get_next_portion(self):
         logger.debug("obtaining next portion of events")
-        return self._tool.query(self._tool.event_streams)\
-            .filter(self._tool.event_streams.id > self._last_processed_id)\
-            .order_by(self._tool.event_streams.id).yield_per(100).all()
+        event_streams = self._tool.event_streams
+        return self._appliance.db.client.readonly_session.query(event_streams)\
+            .filter(event_streams.id > self._last_processed_id)\
+            .order_by(event_streams.id).yield_per(100).all()
 
     def check_expected_events(self):
         return all([len(event['matched_events']) for event in self.got_events])
@@ -71,6 +71,14 @@ Configuration
         file_format: "%(asctime)-15s [%(levelname).1s] %(message)s (%(source)s)"
         # Default format to console if errors_to_console is True
         stream_format: "[%(levelname)s] %(message)s (%(source)s)"
+        # If True, callers only enqueue records, a writer thread does the formatting,
+        # filtering and writing (see AsyncLogHandler)
+        async: False
+        # Maximum number of records waiting for the writer thread
+        async_queue_size: 10000
+        # What to do with records when the queue is full, "drop" them or "block" the caller
+        # until the writer thread catches up
+        async_overflow: drop
 
 Additionally, individual logger configurations can be overridden by defining nested configuration
 values using the logger name as the configuration key. Note that the name of the logger objects
@@ -130,14 +138,22 @@ Members
 ^^^^^^^
 
 """
+import atexit
 import inspect
 import logging
 import sys
+import threading
 import warnings
+from collections import deque
+from numbers import Number
 from time import time
 from traceback import extract_tb, format_tb
 
+import six
+from six.moves import queue
+
 from cfme.utils import conf, safe_string
+from cfme.utils.metrics import Metrics
 from cfme.utils.path import get_rel_path, log_path, project_path
 
 import os
@@ -149,8 +165,14 @@ _default_conf = {
     'level': 'INFO',
     'errors_to_console': False,
     'to_console': False,
+    'async': False,
+    'async_queue_size': 10000,
+    'async_overflow': 'drop',
 }
 
+#: Every AsyncLogHandler, so :py:func:`flush_logs` can drain them
+_async_handlers = []
+
 # let logging know we made a TRACE level
 logging.TRACE = 5
 logging.addLevelName(logging.TRACE, 'TRACE')
@@ -294,11 +316,30 @@ class Perflog(object):
         seconds_taken = perflog.stop('event_name')
         # seconds_taken is also written to perf.log for later analysis
 
+    Events are also recorded in :py:attr:`metrics`, next to the nested timers, counters and
+    histograms of :py:mod:`cfme.utils.metrics`::
+
+        with perflog.timer('event_name'):
+            # do stuff
+            perflog.count('retries')
+
     """
     tracking_events = {}
 
     def __init__(self, perflog_name='perf'):
         self.logger = setup_logger(logging.getLogger(perflog_name))
+        self.metrics = Metrics()
+
+    def timer(self, name):
+        """Get a nested timer, usable as a context manager or decorator"""
+        return self.metrics.timer(name)
+
+    def count(self, name, value=1):
+        self.metrics.count(name, value)
+
+    def observe(self, name, value):
+        """Add a value to the named histogram"""
+        self.metrics.observe(name, value)
 
     def start(self, event_name):
         """Start tracking the named event
@@ -322,6 +363,7 @@ class Perflog(object):
         """
         if event_name in self.tracking_events:
             seconds_taken = time() - self.tracking_events.pop(event_name)
+            self.metrics.record_time(event_name, seconds_taken)
             self.logger.info('"%s" event took %f seconds', event_name, seconds_taken)
             return seconds_taken
         else:
@@ -348,6 +390,137 @@ def console_handler(level):
     return handler
 
 
+class AsyncLogHandler(logging.Handler):
+    """Handler that hands records off to a writer thread
+
+    Callers only put records on a bounded queue, the writer thread runs ``filters`` and
+    ``handlers`` for them, so formatting, relpath resolution and file output happen off the
+    caller's thread.
+
+    When the queue already holds ``queue_size`` records, new records are dropped if
+    ``overflow`` is ``'drop'``, and the number of dropped records is logged once the writer
+    catches up. With ``'block'``, callers wait until there is room on the queue instead.
+
+    :py:meth:`flush` waits for the queue to be drained, it's called for every instance by
+    :py:func:`flush_logs` on unhandled exceptions and on interpreter exit.
+
+    """
+    flush_timeout = 30
+
+    def __init__(self, handlers=(), filters=(), queue_size=10000, overflow='drop'):
+        if overflow not in ('drop', 'block'):
+            raise ValueError('overflow has to be "drop" or "block", not {!r}'.format(overflow))
+        logging.Handler.__init__(self)
+        self.handlers = list(handlers)
+        self.writer_filters = list(filters)
+        self.overflow = overflow
+        self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        _async_handlers.append(self)
+
+    def createLock(self):
+        # The queue does the locking. Handler.handle would hold a lock of ours while a caller
+        # blocks on the full queue, so a handler logging back from the writer would deadlock.
+        self.lock = None
+
+    def addHandler(self, handler):  # NOQA: mirrors logging.Logger
+        if handler not in self.handlers:
+            self.handlers.append(handler)
+
+    def removeHandler(self, handler):  # NOQA: mirrors logging.Logger
+        if handler in self.handlers:
+            self.handlers.remove(handler)
+
+    def emit(self, record):
+        if threading.current_thread() is self._writer:
+            # a handler logged to its own logger, waiting on the queue would deadlock
+            self._dispatch(record)
+            return
+        try:
+            # merge the args now, they could change before the writer gets to the record
+            record.msg = record.getMessage()
+            record.args = None
+        except Exception:
+            self.handleError(record)
+            return
+        self._ensure_writer()
+        if self.overflow == 'block':
+            self._queue.put(record)
+            return
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_writer(self):
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name='log-writer')
+                self._writer.daemon = True
+                self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            record = self._queue.get()
+            try:
+                if record is None:
+                    return
+                self._dispatch(record)
+                # report drops once the records queued before them are written
+                if self.dropped and self._queue.empty():
+                    dropped, self.dropped = self.dropped, 0
+                    self._dispatch(logging.makeLogRecord({
+                        'name': record.name,
+                        'levelno': logging.WARNING,
+                        'levelname': logging.getLevelName(logging.WARNING),
+                        'msg': '{} log records dropped, the log queue was full'.format(dropped),
+                        'pathname': __file__,
+                    }))
+            except Exception:
+                self.handleError(record)
+            finally:
+                self._queue.task_done()
+
+    def _dispatch(self, record):
+        for record_filter in self.writer_filters:
+            if not record_filter.filter(record):
+                return
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def flush(self):
+        """Wait for the queued records to be written, then flush the handlers"""
+        writer = self._writer
+        if writer is not None and threading.current_thread() is not writer:
+            deadline = time() + self.flush_timeout
+            # Queue.join doesn't take a timeout, a stuck handler mustn't hang the exit
+            with self._queue.all_tasks_done:
+                while self._queue.unfinished_tasks and writer.is_alive():
+                    remaining = deadline - time()
+                    if remaining <= 0:
+                        break
+                    self._queue.all_tasks_done.wait(remaining)
+        for handler in self.handlers:
+            handler.flush()
+
+    def close(self):
+        if self._writer is not None and self._writer.is_alive():
+            try:
+                self._queue.put(None, timeout=self.flush_timeout)
+            except queue.Full:
+                pass
+            else:
+                self._writer.join(self.flush_timeout)
+        for handler in self.handlers:
+            handler.close()
+        logging.Handler.close(self)
+
+
 def setup_logger(logger):
     # prevent the root logger effective level from affecting us
     # this is a hack
@@ -361,17 +534,57 @@ def setup_logger(logger):
     # a custom RotatingFileHandler class. At some point, we should do that, and move the
     # entire logging config into env.yaml
 
-    logger.addHandler(make_file_handler(logger.name + '.log', level=conf['level']))
+    handlers = [make_file_handler(logger.name + '.log', level=conf['level'])]
 
     if conf['errors_to_console']:
-        logger.addHandler(console_handler(logging.ERROR))
+        handlers.append(console_handler(logging.ERROR))
     if conf['to_console']:
-        logger.addHandler(console_handler(conf['to_console']))
-
-    logger.addFilter(_RelpathFilter())
+        handlers.append(console_handler(conf['to_console']))
+
+    if conf['async']:
+        # created after its handlers, so logging.shutdown flushes it before closing them
+        logger.addHandler(AsyncLogHandler(
+            handlers,
+            filters=[_RelpathFilter()],
+            queue_size=conf['async_queue_size'],
+            overflow=conf['async_overflow']))
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+        logger.addFilter(_RelpathFilter())
     return logger
 
 
+def iter_handlers(logger):
+    """Iterate over the handlers of a logger, including the ones behind an AsyncLogHandler"""
+    for handler in logger.handlers:
+        if isinstance(handler, AsyncLogHandler):
+            for async_handler in handler.handlers:
+                yield async_handler
+        else:
+            yield handler
+
+
+def add_handler(logger, handler):
+    """Add a handler to a logger, behind its AsyncLogHandler if it has one"""
+    for async_handler in logger.handlers:
+        if isinstance(async_handler, AsyncLogHandler):
+            async_handler.addHandler(handler)
+            break
+    else:
+        logger.addHandler(handler)
+
+
+def flush_logs():
+    """Write out everything that's still queued or buffered by the cfme loggers"""
+    for handler in _async_handlers:
+        try:
+            handler.flush()
+        except Exception:
+            pass
+    artifactor_handler.flush()
+
+
 def create_sublogger(logger_sub_name):
     return NamedLoggerAdapter(logger, logger_sub_name)
 
@@ -406,6 +619,7 @@ def _custom_excepthook(type, value, traceback):
     text = ''.join(format_tb(traceback)).strip()
     logger.error('Unhandled %s', type.__name__)
     logger.error(text, extra={'source_file': file, 'source_lineno': lineno})
+    flush_logs()
     _original_excepthook(type, value, traceback)
 
 
@@ -432,26 +646,116 @@ def nth_frame_info(n):
 
 
 class ArtifactorHandler(logging.Handler):
-    """Logger handler that hands messages off to the artifactor"""
+    """Logger handler that hands messages off to the artifactor
+
+    Records are buffered and sent to the artifactor in batches with the ``log_messages`` hook,
+    by a background thread once :py:attr:`batch_size` records are buffered or every
+    :py:attr:`flush_interval` seconds. At most :py:attr:`max_buffered` records are buffered,
+    any further records are dropped and the number of dropped records is sent with the next
+    batch.
+
+    :py:meth:`flush` sends the buffered records right away, it must be called before
+    the artifactor is told a test started or finished so records end up in the right test log.
+
+    """
 
     slaveid = artifactor = None
+    batch_size = 100
+    flush_interval = 1
+    max_buffered = 10000
+    _exception_formatter = logging.Formatter()
+
+    def __init__(self, *args, **kwargs):
+        logging.Handler.__init__(self, *args, **kwargs)
+        self._buffer = deque()
+        self._dropped = 0
+        self._send_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher = None
 
     def createLock(self):  # NOQA: false positive, base class override
-        # opt out of locking since artifactor hook calling is threadsave
+        # opt out of locking, buffering is threadsafe and sending is serialized by its own lock
         self.lock = None
 
     def emit(self, record):
-        if self.artifactor:
-            self.artifactor.fire_hook(
-                'log_message',
-                log_record=record.__dict__,
-                slaveid=self.slaveid,
-            )
+        if not self.artifactor:
+            return
+        if len(self._buffer) >= self.max_buffered:
+            self._dropped += 1
+            return
+        try:
+            self._buffer.append(self._plain_record(record))
+        except Exception:
+            self.handleError(record)
+            return
+        if self._flusher is None:
+            self._start_flusher()
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    @staticmethod
+    def _plain_value(value):
+        if isinstance(value, bytes):
+            return value.decode('utf-8', 'replace')
+        if value is None or isinstance(value, (six.text_type, Number)):
+            return value
+        return repr(value)
+
+    def _plain_record(self, record):
+        """Copy of the record that survives the json transport to the artifactor
+
+        The message is formatted and the exception rendered right away, so a record with
+        arguments that can't be serialized doesn't break the whole batch it's sent with.
+        The copy also isn't affected by other handlers changing the record later on.
+        """
+        data = {key: self._plain_value(value) for key, value in record.__dict__.items()}
+        data['msg'] = self._plain_value(record.getMessage())
+        data['args'] = ()
+        if record.exc_info:
+            data['exc_text'] = self._plain_value(
+                record.exc_text or self._exception_formatter.formatException(record.exc_info))
+        data['exc_info'] = None
+        return data
+
+    def _start_flusher(self):
+        self._flusher = threading.Thread(target=self._flush_loop, name='artifactor-log-flusher')
+        self._flusher.daemon = True
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # nowhere left to log this to, the records are counted as dropped by flush
+                pass
+
+    def flush(self):
+        """Send all buffered records to the artifactor"""
+        with self._send_lock:
+            if not self.artifactor or not (self._buffer or self._dropped):
+                return
+            records = []
+            while self._buffer:
+                records.append(self._buffer.popleft())
+            dropped, self._dropped = self._dropped, 0
+            try:
+                self.artifactor.fire_hook(
+                    'log_messages',
+                    log_records=records,
+                    slaveid=self.slaveid,
+                    dropped=dropped,
+                )
+            except Exception:
+                # reported as dropped with the next batch
+                self._dropped += dropped + len(records)
 
 
 logger = setup_logger(logging.getLogger('cfme'))
 artifactor_handler = ArtifactorHandler()
-logger.addHandler(artifactor_handler)
+add_handler(logger, artifactor_handler)
 
 add_prefix = PrefixAddingLoggerFilter()
 logger.addFilter(add_prefix)
@@ -496,8 +800,10 @@ def setup_for_worker(workername, loggers=('cfme', 'py.warnings')):
     # this function is a bad hack, at some point we want a more ballanced setup
     for logger in loggers:
         log = logging.getLogger(logger)
-        handler = next(x for x in log.handlers
+        handler = next(x for x in iter_handlers(log)
                        if isinstance(x, logging.FileHandler))
+        # queued records still belong to the old file
+        flush_logs()
         handler.close()
         base, name = os.path.split(handler.baseFilename)
         add_prefix.prefix = "({})".format(workername)
@@ -508,15 +814,17 @@ def setup_for_worker(workername, loggers=('cfme', 'py.warnings')):
 
 def add_stdout_handler(logger):
     """Look for a stdout handler in the logger, add one if not present"""
-    for handle in logger.handlers:
+    for handle in iter_handlers(logger):
         if isinstance(handle, logging.StreamHandler) and 'stdout' in handle.stream.name:
             break
     else:
         # Never found a stdout StreamHandler
-        logger.addHandler(logging.StreamHandler(sys.stdout))
+        add_handler(logger, logging.StreamHandler(sys.stdout))
 
 
 _configure_warnings()
 
 # Register a custom excepthook to log unhandled exceptions
 sys.excepthook = _custom_excepthook
+# Runs before logging.shutdown, which was registered when logging got imported
+atexit.register(flush_logs)
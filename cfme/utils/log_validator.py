@@ -1,7 +1,7 @@
 import re
 import pytest
 
-from ssh import SSHTail
+from cfme.utils.ssh import SSHLogFollower
 from cfme.utils.log import logger
 
 
@@ -27,52 +27,78 @@ class LogValidator(object):
         skip_patterns: array of skip regex patterns
         failure_patterns: array of failure regex patterns
         matched_patterns: array of expected regex patterns to be matched
+        timeout: seconds :py:meth:`validate_logs` waits for the lines written before it was
+            called at most
+
+    Following the log keeps a channel open on the appliance, use it as a context manager, which
+    calls :py:meth:`fix_before_start` and :py:meth:`close`, or call :py:meth:`close` yourself.
 
     Usage:
         .. code-block:: python
-          evm_tail = LogValidator('/var/www/miq/vmdb/log/evm.log',
-                                  skip_patterns=['PARTICULAR_ERROR'],
-                                  failure_patterns=['.*ERROR.*'],
-                                  matched_patterns=['PARTICULAR_INFO'])
-          evm_tail.fix_before_start()
-          evm_tail.validate_logs()
+          with LogValidator('/var/www/miq/vmdb/log/evm.log',
+                            skip_patterns=['PARTICULAR_ERROR'],
+                            failure_patterns=['.*ERROR.*'],
+                            matched_patterns=['PARTICULAR_INFO']) as evm_tail:
+              do_something()
+              evm_tail.validate_logs()
     """
 
     def __init__(self, remote_filename, **kwargs):
         self.skip_patterns = kwargs.pop('skip_patterns', [])
         self.failure_patterns = kwargs.pop('failure_patterns', [])
         self.matched_patterns = kwargs.pop('matched_patterns', [])
+        self.timeout = kwargs.pop('timeout', 30)
 
-        self._remote_file_tail = SSHTail(remote_filename, **kwargs)
+        self._skip_regexes = [(pattern, re.compile(pattern)) for pattern in self.skip_patterns]
+        self._failure_regexes = [
+            (pattern, re.compile(pattern)) for pattern in self.failure_patterns]
+        self._matched_regexes = [
+            (pattern, re.compile(pattern)) for pattern in self.matched_patterns]
+        self._remote_file_tail = SSHLogFollower(remote_filename, **kwargs)
         self.matches = {}
 
     def fix_before_start(self):
-        self._remote_file_tail.set_initial_file_end()
+        self._remote_file_tail.start()
+
+    def close(self):
+        """Stop following the log"""
+        self._remote_file_tail.close()
+
+    def __enter__(self):
+        self.fix_before_start()
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
 
     def validate_logs(self):
-        for line in self._remote_file_tail:
-            if self._check_skip_logs(line):
-                continue
-            self._check_fail_logs(line)
-            self._check_match_logs(line)
+        # lines are pushed by the appliance, wait for the ones written up to now
+        try:
+            for _, line in self._remote_file_tail.iter_lines_to_end(timeout=self.timeout):
+                if self._check_skip_logs(line):
+                    continue
+                self._check_fail_logs(line)
+                self._check_match_logs(line)
+        finally:
+            self.close()
         self._verify_match_logs()
 
     def _check_skip_logs(self, line):
-        for pattern in self.skip_patterns:
-            if re.match(pattern, line):
+        for pattern, regex in self._skip_regexes:
+            if regex.match(line):
                 logger.info('Skip pattern {} was matched on line {},\
                             so skipping this line'.format(pattern, line))
                 return True
         return False
 
     def _check_fail_logs(self, line):
-        for pattern in self.failure_patterns:
-            if re.match(pattern, line):
+        for pattern, regex in self._failure_regexes:
+            if regex.match(line):
                 pytest.fail('Failure pattern {} was matched on line {}'.format(pattern, line))
 
     def _check_match_logs(self, line):
-        for pattern in self.matched_patterns:
-            if re.match(pattern, line):
+        for pattern, regex in self._matched_regexes:
+            if regex.match(line):
                 logger.info('Expected pattern {} was matched on line {}'.format(pattern, line))
                 self.matches[pattern] = True
 
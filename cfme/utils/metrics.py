@@ -0,0 +1,200 @@
+"""Hierarchical timers, counters and histograms
+
+Timers nest per thread: a timer started while another one is running is recorded under the
+running timer's name, e.g. ``navigate Vm:Details/ssh run_command``. Counters and histograms
+are filed under the running timers the same way.
+
+The metrics of the test session are collected by :py:attr:`cfme.utils.log.perflog`:
+
+.. code-block:: python
+
+    from cfme.utils.log import perflog
+
+    with perflog.timer('provider refresh'):
+        # do stuff
+        perflog.count('refresh retries')
+
+    @perflog.timer('rest query')
+    def query():
+        ...
+
+    perflog.observe('vms found', len(vms))
+
+A :py:meth:`Metrics.snapshot` is a json serializable dict, snapshots of several processes are
+combined with :py:meth:`Metrics.merge`.
+
+"""
+import math
+import threading
+from collections import defaultdict
+from functools import wraps
+from time import time
+
+#: Separates the names of nested metrics in their path
+SEPARATOR = '/'
+
+# values are counted in power of two buckets, everything below 2**-30 ends up in the first one
+_MIN_EXPONENT = -30
+
+
+def _bucket(value):
+    if value <= 0:
+        return _MIN_EXPONENT
+    return max(_MIN_EXPONENT, int(math.ceil(math.log(value, 2))))
+
+
+class Histogram(object):
+    """Summary of observed values
+
+    Keeps the count, total and extremes, and counts the values in power of two buckets
+    to approximate percentiles, so histograms of different processes can be merged.
+
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = defaultdict(int)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.buckets[_bucket(value)] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, pct):
+        """Approximate percentile, the upper bound of the bucket it falls into"""
+        if not self.count:
+            return None
+        threshold = self.count * pct / 100.0
+        seen = 0
+        for exponent in sorted(self.buckets):
+            seen += self.buckets[exponent]
+            if seen >= threshold:
+                return min(2.0 ** exponent, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean,
+            'p95': self.percentile(95),
+            # json keys have to be strings
+            'buckets': {str(exponent): n for exponent, n in self.buckets.items()},
+        }
+
+    def merge(self, data):
+        """Add the values of a histogram dict made by :py:meth:`to_dict`"""
+        if not data['count']:
+            return
+        self.count += data['count']
+        self.total += data['total']
+        self.min = data['min'] if self.min is None else min(self.min, data['min'])
+        self.max = data['max'] if self.max is None else max(self.max, data['max'])
+        for exponent, n in data['buckets'].items():
+            self.buckets[int(exponent)] += n
+
+
+class Timer(object):
+    """Times a block of code, as a context manager or as a function decorator
+
+    The start times are kept on the thread's stack of running timers, not on the instance,
+    so the same timer can be used by several threads and recursive functions.
+
+    """
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.metrics._stack().append((self.name, time()))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        stack = self.metrics._stack()
+        name, started = stack.pop()
+        path = SEPARATOR.join([running for running, _ in stack] + [name])
+        self.metrics._add(self.metrics.timers, path, time() - started)
+
+    def __call__(self, func):
+        @wraps(func)
+        def timed(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return timed
+
+
+class Metrics(object):
+    """Threadsafe collection of timers, counters and histograms, see the module docs"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.timers = defaultdict(Histogram)
+        self.histograms = defaultdict(Histogram)
+        self.counters = defaultdict(int)
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def _path(self, name):
+        return SEPARATOR.join([running for running, _ in self._stack()] + [name])
+
+    def _add(self, histograms, path, value):
+        with self._lock:
+            histograms[path].add(value)
+
+    def timer(self, name):
+        """Get a :py:class:`Timer` recording under ``name``"""
+        return Timer(self, name)
+
+    def record_time(self, name, seconds):
+        """Record a duration measured elsewhere, under the running timers"""
+        self._add(self.timers, self._path(name), seconds)
+
+    def count(self, name, value=1):
+        path = self._path(name)
+        with self._lock:
+            self.counters[path] += value
+
+    def observe(self, name, value):
+        """Add a value to the named histogram"""
+        self._add(self.histograms, self._path(name), value)
+
+    def snapshot(self):
+        """Get all metrics as a json serializable dict"""
+        with self._lock:
+            return {
+                'timers': {path: hist.to_dict() for path, hist in self.timers.items()},
+                'histograms': {path: hist.to_dict() for path, hist in self.histograms.items()},
+                'counters': dict(self.counters),
+            }
+
+    def merge(self, snapshot):
+        """Add the metrics of a snapshot, e.g. one sent by a slave"""
+        with self._lock:
+            for path, data in snapshot.get('timers', {}).items():
+                self.timers[path].merge(data)
+            for path, data in snapshot.get('histograms', {}).items():
+                self.histograms[path].merge(data)
+            for path, value in snapshot.get('counters', {}).items():
+                self.counters[path] += value
+
+    def top_timers(self, n):
+        """Get the ``n`` timers with the highest total time as ``(path, histogram)`` pairs"""
+        with self._lock:
+            timers = list(self.timers.items())
+        timers.sort(key=lambda timer: timer[1].total, reverse=True)
+        return timers[:n]
@@ -1,10 +1,11 @@
 """Functions that performance tests use."""
-import time
+import re
 
 import numpy
 
 from cfme.utils.log import logger
-from cfme.utils.ssh import SSHClient, SSHTail
+from cfme.utils.ssh import SSHClient, SSHLogFollower
+from cfme.utils.wait import TimedOutError
 from fixtures.pytest_store import store
 
 
@@ -40,7 +41,7 @@ def collect_log(ssh_client, log_prefix, local_file_name, strip_whitespace=False)
     ssh_client.run_command('rm {}-2'.format(log_file))
     ssh_client.run_command('gzip {}{}.perf.log'.format(log_dir, log_prefix))
 
-    ssh_client.get_file(dest_file_gz, local_file_name)
+    ssh_client.download_file(dest_file_gz, local_file_name)
     ssh_client.run_command('rm -f {}'.format(dest_file_gz))
 
 
@@ -101,31 +102,25 @@ def set_rails_loglevel(level, validate_against_worker='MiqUiWorker'):
     logger.info('Setting log level_rails on appliance to {}'.format(level))
     yaml = store.current_appliance.advanced_settings
     if not str(yaml['log']['level_rails']).lower() == level.lower():
-        logger.info('Opening /var/www/miq/vmdb/log/evm.log for tail')
-        evm_tail = SSHTail('/var/www/miq/vmdb/log/evm.log')
-        evm_tail.set_initial_file_end()
-
-        log_yaml = yaml.get('log', {})
-        log_yaml['level_rails'] = level
-        store.current_appliance.update_advanced_settings({'log': log_yaml})
-
-        attempts = 0
-        detected = False
-        while (not detected and attempts < 60):
-            logger.debug('Attempting to detect log level_rails change: {}'.format(attempts))
-            for line in evm_tail:
-                if ui_worker_pid in line:
-                    if 'Log level for production.log has been changed to' in line:
-                        # Detects a log level change but does not validate the log level
-                        logger.info('Detected change to log level for production.log')
-                        detected = True
-                        break
-            time.sleep(1)  # Allow more log lines to accumulate
-            attempts += 1
-        if not (attempts < 60):
-            # Note the error in the logger but continue as the appliance could be slow at logging
-            # that the log level changed
-            logger.error('Could not detect log level_rails change.')
-        evm_tail.close()
+        logger.info('Following /var/www/miq/vmdb/log/evm.log')
+        change_message = 'Log level for production.log has been changed to'
+        evm_tail = SSHLogFollower('/var/www/miq/vmdb/log/evm.log', grep_pattern=change_message)
+        evm_tail.start()
+        try:
+            log_yaml = yaml.get('log', {})
+            log_yaml['level_rails'] = level
+            store.current_appliance.update_advanced_settings({'log': log_yaml})
+
+            try:
+                # Detects a log level change but does not validate the log level
+                evm_tail.wait_for_line(
+                    '{}.*{}'.format(re.escape(ui_worker_pid), change_message), timeout=60)
+                logger.info('Detected change to log level for production.log')
+            except TimedOutError:
+                # Note the error in the logger but continue as the appliance could be slow at
+                # logging that the log level changed
+                logger.error('Could not detect log level_rails change.')
+        finally:
+            evm_tail.close()
     else:
         logger.info('Log level_rails already set to {}'.format(level))
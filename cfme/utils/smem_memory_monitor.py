@@ -138,6 +138,9 @@ test_ts = time.strftime('%Y%m%d%H%M%S')
 # 10s sample interval (occasionally sampling can take almost 4s on an appliance doing a lot of work)
 SAMPLE_INTERVAL = 10
 
+MEMINFO_COMMAND = 'cat /proc/meminfo'
+SMEM_COMMAND = 'smem -c \'pid rss pss uss vss swap name command\' | sed 1d'
+
 
 class SmemMemoryMonitor(Thread):
     def __init__(self, ssh_client, scenario_data):
@@ -172,7 +175,7 @@ class SmemMemoryMonitor(Thread):
         else:
             logger.warn('Process {} PID, not found: {}'.format(process_name, process_pid))
 
-    def get_appliance_memory(self, appliance_results, plottime):
+    def get_appliance_memory(self, appliance_results, plottime, result=None):
         # 5.5/5.6 - RHEL 7 / Centos 7
         # Application Memory Used : MemTotal - (MemFree + Slab + Cached)
         # 5.4 - RHEL 6 / Centos 6
@@ -180,7 +183,8 @@ class SmemMemoryMonitor(Thread):
         # Available memory could potentially be better metric
         appliance_results[plottime] = {}
 
-        result = self.ssh_client.run_command('cat /proc/meminfo')
+        if result is None:
+            result = self.ssh_client.run_command(MEMINFO_COMMAND)
         if result.failed:
             logger.error('Exit_status nonzero in get_appliance_memory: {}, {}'
                          .format(result.rc, result.output))
@@ -205,11 +209,16 @@ class SmemMemoryMonitor(Thread):
             appliance_results[plottime]['swap_total'] = float(meminfo['SwapTotal']) / 1024
             appliance_results[plottime]['swap_free'] = float(meminfo['SwapFree']) / 1024
 
-    def get_evm_workers(self):
-        result = self.ssh_client.run_command(
+    @property
+    def evm_workers_command(self):
+        return (
             'psql -t -q -d vmdb_production -c '
             '\"select pid,type from miq_workers where miq_server_id = \'{}\'\"'.format(
                 self.miq_server_id))
+
+    def get_evm_workers(self, result=None):
+        if result is None:
+            result = self.ssh_client.run_command(self.evm_workers_command)
         if result.output.strip():
             workers = {}
             for worker in result.output.strip().split('\n'):
@@ -249,9 +258,9 @@ class SmemMemoryMonitor(Thread):
         logger.info('Obtained miq_server_id: {}'.format(result.output.strip()))
         self.miq_server_id = result.output.strip()
 
-    def get_pids_memory(self):
-        result = self.ssh_client.run_command(
-            'smem -c \'pid rss pss uss vss swap name command\' | sed 1d')
+    def get_pids_memory(self, result=None):
+        if result is None:
+            result = self.ssh_client.run_command(SMEM_COMMAND)
         pids_memory = result.output.strip().split('\n')
         memory_by_pid = {}
         for line in pids_memory:
@@ -302,9 +311,12 @@ class SmemMemoryMonitor(Thread):
             starttime = time.time()
             plottime = datetime.now()
 
-            self.get_appliance_memory(appliance_results, plottime)
-            workers = self.get_evm_workers()
-            memory_by_pid = self.get_pids_memory()
+            # one round trip for all of the sample's commands
+            meminfo, evm_workers, smem = self.ssh_client.run_commands(
+                [MEMINFO_COMMAND, self.evm_workers_command, SMEM_COMMAND])
+            self.get_appliance_memory(appliance_results, plottime, meminfo)
+            workers = self.get_evm_workers(evm_workers)
+            memory_by_pid = self.get_pids_memory(smem)
 
             for worker_pid in workers:
                 self.create_process_result(process_results, plottime, worker_pid,
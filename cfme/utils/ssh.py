@@ -1,7 +1,15 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import select
 import socket
 import sys
+import threading
+import zlib
+from collections import OrderedDict, defaultdict
 from subprocess import check_call
+from time import time
 
 import attr
 import diaper
@@ -10,21 +18,28 @@ import iso8601
 import paramiko
 import re
 from cached_property import cached_property
+from concurrent import futures
 from os import path as os_path
 from scp import SCPClient
+from six.moves import queue
 
 from cfme.utils import conf, ports, version
-from cfme.utils.log import logger
+from cfme.utils.log import logger, perflog
 from cfme.utils.net import net_check
-from cfme.utils.path import project_path
+from cfme.utils.path import data_path, project_path
 from cfme.utils.quote import quote
 from cfme.utils.timeutil import parsetime
 from cfme.utils.version import Version
+from cfme.utils.wait import wait_for, TimedOutError
 from fixtures.pytest_store import store
 
 # Default blocking time before giving up on an ssh command execution,
 # in seconds (float)
 RUNCMD_TIMEOUT = 1200.0
+# Maximum number of bytes read from a command's stdout or stderr at once
+RUNCMD_CHUNK_SIZE = 65536
+# Size of the chunks files are split into by SSHTransfer
+TRANSFER_CHUNK_SIZE = 8 * 1024 * 1024
 
 
 @attr.s(frozen=True)
@@ -53,6 +68,8 @@ class SSHResult(object):
     command = attr.ib()
     rc = attr.ib()
     output = attr.ib(repr=False)
+    #: How long the command ran in seconds, only known for :py:meth:`SSHClient.run_commands`
+    duration = attr.ib(default=None, cmp=False, repr=False)
 
     def __str__(self):
         return self.output
@@ -89,12 +106,518 @@ class SSHResult(object):
         return self.rc != 0
 
 
+class _CommandOutput(object):
+    """Collects the output of a command from the chunks of its stdout and stderr
+
+    Chunks are split at line ends, so lines of stdout and stderr are interleaved in the combined
+    output like they were when the output was read line by line.
+    """
+    def __init__(self, streams, callbacks, max_output=None):
+        self.streams = streams
+        self.callbacks = callbacks
+        self.max_output = max_output
+        self.truncated = 0
+        self._size = 0
+        self._chunks = []
+        self._partial = {name: '' for name in streams}
+
+    def feed(self, name, chunk):
+        data = self._partial[name] + chunk
+        lines_end = data.rfind('\n') + 1
+        self._partial[name] = data[lines_end:]
+        if lines_end:
+            self._write(name, data[:lines_end])
+
+    def finish(self):
+        for name, data in self._partial.items():
+            if data:
+                self._partial[name] = ''
+                self._write(name, data)
+
+    def _write(self, name, data):
+        if self.max_output is not None and self._size + len(data) > self.max_output:
+            kept = max(self.max_output - self._size, 0)
+            self.truncated += len(data) - kept
+            self._chunks.append(data[:kept])
+            self._size += kept
+        else:
+            self._chunks.append(data)
+            self._size += len(data)
+        if self.streams[name] is not None:
+            self.streams[name].write(data)
+        if self.callbacks[name] is not None:
+            self.callbacks[name](data)
+
+    @property
+    def text(self):
+        return ''.join(self._chunks)
+
+
 _ssh_key_file = project_path.join('.generated_ssh_key')
 _ssh_pubkey_file = project_path.join('.generated_ssh_key.pub')
 
 _client_session = []
 
 
+@attr.s
+class _PooledTransport(object):
+    key = attr.ib()
+    client = attr.ib(repr=False)
+    leases = attr.ib(default=0)
+    capacity = attr.ib(default=None)
+    last_used = attr.ib(default=attr.Factory(time))
+    last_checked = attr.ib(default=attr.Factory(time))
+
+    @property
+    def transport(self):
+        return self.client.get_transport()
+
+
+@attr.s
+class SSHTransportPool(object):
+    """Process-wide pool of authenticated SSH transports, shared by :py:class:`SSHClient`
+
+    A transport carries several channels at once, so clients of the same host, port and
+    credentials lease the same transport and open their channels over it. Containers and pods
+    are reached by wrapping the commands, so they don't need transports of their own.
+
+    A lease stands for one open channel, sshd limits the sessions of a connection
+    (``MaxSessions`` defaults to 10). Whoever keeps several channels open at once takes a lease
+    for each of them, see :py:class:`SSHTransfer` and :py:class:`SSHLogFollower`. Another
+    transport is only opened once all of them are leased :py:attr:`max_leases` times. If the
+    server refuses a channel anyway, :py:meth:`refused` stops leasing that transport beyond
+    the channels it's carrying.
+
+    Transports that haven't been used for :py:attr:`check_interval` seconds are probed before
+    being leased, dead ones are dropped. Transports nobody leased for :py:attr:`idle_timeout`
+    seconds are closed.
+    """
+    max_leases = attr.ib(default=8)
+    check_interval = attr.ib(default=30)
+    idle_timeout = attr.ib(default=300)
+    keepalive = attr.ib(default=30)
+    _entries = attr.ib(default=attr.Factory(lambda: defaultdict(list)), repr=False)
+    _lock = attr.ib(default=attr.Factory(threading.Lock), repr=False)
+
+    @staticmethod
+    def _key(connect_kwargs):
+        pkey = connect_kwargs.get('pkey')
+        key_filename = connect_kwargs.get('key_filename')
+        if isinstance(key_filename, list):
+            key_filename = tuple(key_filename)
+        return (
+            connect_kwargs['hostname'], connect_kwargs.get('port', ports.SSH),
+            connect_kwargs.get('username'), connect_kwargs.get('password'), key_filename,
+            pkey.get_fingerprint() if pkey is not None else None)
+
+    def acquire(self, connect_kwargs):
+        """Lease a live transport for the given :py:meth:`paramiko.SSHClient.connect` kwargs"""
+        key = self._key(connect_kwargs)
+        while True:
+            with self._lock:
+                self._evict_idle()
+                entries = [
+                    entry for entry in self._entries[key] if entry.leases < entry.capacity]
+                entry = min(entries, key=lambda entry: entry.leases) if entries else None
+                if entry is not None:
+                    entry.leases += 1
+            if entry is None:
+                break
+            try:
+                healthy = self._healthy(entry)
+            except paramiko.ChannelException:
+                # alive, but the server won't open more channels over it
+                self.refused(entry)
+                self.release(entry)
+                continue
+            if healthy:
+                entry.last_used = time()
+                return entry
+            logger.info('Dropping dead ssh transport to %s', key[0])
+            self._discard(entry)
+
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(**connect_kwargs)
+        client.get_transport().set_keepalive(self.keepalive)
+        entry = _PooledTransport(key, client, leases=1, capacity=self.max_leases)
+        with self._lock:
+            self._entries[key].append(entry)
+        return entry
+
+    def release(self, entry):
+        """Give back a transport leased by :py:meth:`acquire`"""
+        with self._lock:
+            entry.leases -= 1
+            entry.last_used = time()
+
+    def refused(self, entry):
+        """Note that the server refused to open a channel over a leased transport
+
+        It's not leased again until fewer channels than the ones open now are left, give back
+        the lease and acquire another one to get a channel.
+        """
+        with self._lock:
+            entry.capacity = entry.leases - 1
+
+    def _healthy(self, entry):
+        transport = entry.transport
+        if transport is None or not transport.is_active():
+            return False
+        if time() - max(entry.last_used, entry.last_checked) < self.check_interval:
+            return True
+        # is_active only notices a dead peer once the socket fails, ask the server something,
+        # the session uses the channel of the lease being acquired
+        try:
+            transport.open_session(timeout=10).close()
+        except paramiko.ChannelException:
+            raise
+        except Exception:
+            return False
+        entry.last_checked = time()
+        return True
+
+    def _discard(self, entry):
+        with self._lock:
+            if entry in self._entries[entry.key]:
+                self._entries[entry.key].remove(entry)
+        with diaper:
+            entry.client.close()
+
+    def _evict_idle(self):
+        # called with the lock held
+        now = time()
+        for key, entries in list(self._entries.items()):
+            for entry in list(entries):
+                if not entry.leases and now - entry.last_used > self.idle_timeout:
+                    entries.remove(entry)
+                    with diaper:
+                        entry.client.close()
+            if not entries:
+                del self._entries[key]
+
+    def close(self):
+        """Close all pooled transports, leased ones included"""
+        with self._lock:
+            entries = [entry for key in self._entries for entry in self._entries[key]]
+            self._entries.clear()
+        for entry in entries:
+            with diaper:
+                entry.client.close()
+
+
+transport_pool = SSHTransportPool()
+
+
+def _gzip(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _gunzip(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+@attr.s
+class TransferProgress(object):
+    """Progress of a file transfer made by :py:class:`SSHTransfer`
+
+    Handed to the ``progress`` callback after every chunk and returned once the transfer is
+    done. ``transferred`` only counts the bytes moved by this run, ``resumed`` the ones an
+    earlier, failed run already moved.
+    """
+    source = attr.ib()
+    destination = attr.ib()
+    size = attr.ib(default=None)
+    transferred = attr.ib(default=0)
+    resumed = attr.ib(default=0)
+    skipped = attr.ib(default=False)
+    started = attr.ib(default=attr.Factory(time), repr=False)
+    finished = attr.ib(default=None, repr=False)
+    _lock = attr.ib(default=attr.Factory(threading.Lock), repr=False, cmp=False)
+
+    @property
+    def done(self):
+        return self.resumed + self.transferred
+
+    @property
+    def duration(self):
+        return (self.finished or time()) - self.started
+
+    @property
+    def throughput(self):
+        """Bytes per second moved by this run"""
+        duration = self.duration
+        return self.transferred / duration if duration > 0 else None
+
+    def add(self, size):
+        with self._lock:
+            self.transferred += size
+
+
+@attr.s
+class SSHTransfer(object):
+    """Moves a file in chunks over several SFTP channels
+
+    The file is split in chunks of ``chunk_size`` bytes, ``workers`` SFTP channels transfer
+    them in parallel. Every channel is leased from :py:data:`transport_pool` on its own, so
+    they share connections only as far as the server allows. The data goes to a ``.cfme-part``
+    file next to the destination that's renamed once all chunks are there. The chunks that are
+    done are recorded in a ``.cfme-transfer`` file next to the local file, a transfer that
+    failed is resumed from there when it's retried with the same file. A destination with the
+    same md5 checksum as the source is not transferred at all.
+
+    With ``compress``, chunks are gzipped on the fly and moved through ``dd`` over exec channels
+    instead, that pays off for logs and other text.
+
+    Use it through :py:meth:`SSHClient.upload_file` and :py:meth:`SSHClient.download_file`.
+    """
+    client = attr.ib(repr=False)
+    local_file = attr.ib()
+    remote_file = attr.ib()
+    workers = attr.ib(default=4)
+    chunk_size = attr.ib(default=TRANSFER_CHUNK_SIZE)
+    compress = attr.ib(default=False)
+    resume = attr.ib(default=True)
+    skip_identical = attr.ib(default=True)
+    retries = attr.ib(default=2)
+    progress_callback = attr.ib(default=None, repr=False)
+
+    @property
+    def state_file(self):
+        return '{}.cfme-transfer'.format(self.local_file)
+
+    def _state(self, direction, source_stat):
+        return {
+            'direction': direction,
+            'remote_file': self.remote_file,
+            'size': source_stat.st_size,
+            'mtime': int(source_stat.st_mtime),
+            'chunk_size': self.chunk_size,
+            'compress': self.compress,
+        }
+
+    def _load_done_chunks(self, state):
+        """Get the chunks an earlier run of the same transfer finished"""
+        if not self.resume or not os_path.exists(self.state_file):
+            return set()
+        try:
+            with open(self.state_file) as f:
+                saved = json.load(f)
+        except ValueError:
+            return set()
+        if saved.get('state') != state:
+            return set()
+        return set(saved['done'])
+
+    def _save_done_chunks(self, state, done):
+        with open(self.state_file, 'w') as f:
+            json.dump({'state': state, 'done': sorted(done)}, f)
+
+    def _md5(self, path):
+        digest = hashlib.md5()
+        with open(path, 'rb') as f:
+            for data in iter(lambda: f.read(RUNCMD_CHUNK_SIZE), b''):
+                digest.update(data)
+        return digest.hexdigest()
+
+    def _remote_md5(self, path):
+        result = self.client.run_command('md5sum {}'.format(quote(path)))
+        return result.output.split()[0] if result.success and result.output else None
+
+    def _exec(self, client, command, data=None):
+        """Run a command on a channel of its own, feed it data and return its binary output"""
+        channel = client.open_session()
+        try:
+            channel.settimeout(RUNCMD_TIMEOUT)
+            channel.exec_command(command)
+            if data is not None:
+                channel.sendall(data)
+            channel.shutdown_write()
+            output = b''.join(iter(lambda: channel.recv(RUNCMD_CHUNK_SIZE), b''))
+            rc = channel.recv_exit_status()
+        finally:
+            channel.close()
+        if rc != 0:
+            raise IOError('{!r} failed with exit status {}'.format(command, rc))
+        return output
+
+    def _chunks(self, size):
+        return [
+            (index, offset, min(self.chunk_size, size - offset))
+            for index, offset in enumerate(range(0, size, self.chunk_size))]
+
+    def _run(self, state, chunks, transfer_chunks, progress):
+        """Transfer the chunks that aren't done yet with ``workers`` parallel workers
+
+        ``transfer_chunks`` is called in every worker with a client of its own, so every worker's
+        channel is leased from the pool, its share of the chunks and a function to call for every
+        finished chunk.
+        """
+        done = self._load_done_chunks(state)
+        progress.resumed = sum(length for index, _, length in chunks if index in done)
+        if done:
+            logger.info('Resuming the transfer of %r, %d of %d chunks are done',
+                        progress.source, len(done), len(chunks))
+        lock = threading.Lock()
+
+        def chunk_done(index, length):
+            progress.add(length)
+            with lock:
+                done.add(index)
+                self._save_done_chunks(state, done)
+            if self.progress_callback is not None:
+                self.progress_callback(progress)
+
+        def worker(chunks):
+            client = self.client()
+            try:
+                transfer_chunks(client, chunks, chunk_done)
+            finally:
+                client.close()
+
+        for attempt in range(self.retries + 1):
+            todo = [chunk for chunk in chunks if chunk[0] not in done]
+            if not todo:
+                break
+            executor = futures.ThreadPoolExecutor(max_workers=self.workers)
+            try:
+                jobs = [
+                    executor.submit(worker, todo[i::self.workers])
+                    for i in range(min(self.workers, len(todo)))]
+                errors = [job.exception() for job in jobs if job.exception() is not None]
+            finally:
+                executor.shutdown(wait=True)
+            if errors:
+                logger.warning('Transfer of %r failed (attempt %d): %s',
+                               progress.source, attempt + 1, errors[0])
+                if attempt == self.retries:
+                    raise errors[0]
+
+    def _finish(self, progress):
+        progress.finished = time()
+        with diaper:
+            os.remove(self.state_file)
+        perflog.count('ssh transfer bytes', progress.transferred)
+        if progress.transferred:
+            perflog.observe('ssh transfer throughput', progress.throughput)
+        if not progress.skipped:
+            logger.info('Transferred %r to %r: %d bytes in %.1fs (%.0f kB/s)',
+                        progress.source, progress.destination, progress.transferred,
+                        progress.duration, (progress.throughput or 0) / 1024.0)
+        return progress
+
+    def upload(self):
+        local_stat = os.stat(self.local_file)
+        progress = TransferProgress(self.local_file, self.remote_file, size=local_stat.st_size)
+        if self.skip_identical and self._remote_md5(self.remote_file) == self._md5(
+                self.local_file):
+            logger.info('Remote %r is identical to %r, skipping the upload',
+                        self.remote_file, self.local_file)
+            progress.skipped = True
+            return self._finish(progress)
+        part_file = '{}.cfme-part'.format(self.remote_file)
+        state = self._state('upload', local_stat)
+        if not (self._load_done_chunks(state) and
+                self.client.run_command('test -f {}'.format(quote(part_file))).success):
+            with diaper:
+                os.remove(self.state_file)
+            self.client.run_command('rm -f {0}; touch {0}'.format(quote(part_file)))
+
+        def upload_chunks(client, chunks, chunk_done):
+            with open(self.local_file, 'rb') as local:
+                if self.compress:
+                    for index, offset, length in chunks:
+                        local.seek(offset)
+                        self._exec(
+                            client,
+                            'gzip -dc | dd of={} bs=1M seek={} oflag=seek_bytes conv=notrunc '
+                            'status=none'.format(quote(part_file), offset),
+                            _gzip(local.read(length)))
+                        chunk_done(index, length)
+                    return
+                sftp = client.open_sftp()
+                try:
+                    with sftp.open(part_file, 'r+') as remote:
+                        remote.set_pipelined(True)
+                        for index, offset, length in chunks:
+                            local.seek(offset)
+                            remote.seek(offset)
+                            remote.write(local.read(length))
+                            remote.flush()
+                            chunk_done(index, length)
+                finally:
+                    sftp.close()
+
+        with perflog.timer('ssh upload_file'):
+            self._run(state, self._chunks(local_stat.st_size), upload_chunks, progress)
+        if progress.resumed and self._remote_md5(part_file) != self._md5(self.local_file):
+            os.remove(self.state_file)
+            raise IOError('Resumed upload of {} is corrupted, retry it'.format(self.local_file))
+        result = self.client.run_command(
+            'mv -f {} {}'.format(quote(part_file), quote(self.remote_file)))
+        if result.failed:
+            raise IOError('Could not move {} into place: {}'.format(part_file, result.output))
+        return self._finish(progress)
+
+    def download(self):
+        sftp = self.client.open_sftp()
+        try:
+            remote_stat = sftp.stat(self.remote_file)
+        finally:
+            sftp.close()
+        progress = TransferProgress(self.remote_file, self.local_file, size=remote_stat.st_size)
+        if (self.skip_identical and os_path.exists(self.local_file) and
+                self._md5(self.local_file) == self._remote_md5(self.remote_file)):
+            logger.info('Local %r is identical to %r, skipping the download',
+                        self.local_file, self.remote_file)
+            progress.skipped = True
+            return self._finish(progress)
+        part_file = '{}.cfme-part'.format(self.local_file)
+        state = self._state('download', remote_stat)
+        if not (self._load_done_chunks(state) and os_path.exists(part_file)):
+            with diaper:
+                os.remove(self.state_file)
+            open(part_file, 'wb').close()
+
+        def download_chunks(client, chunks, chunk_done):
+            with open(part_file, 'r+b') as local:
+                if self.compress:
+                    for index, offset, length in chunks:
+                        data = _gunzip(self._exec(
+                            client,
+                            'dd if={} bs=1M skip={} count={} iflag=skip_bytes,count_bytes '
+                            'status=none | gzip -1c'.format(
+                                quote(self.remote_file), offset, length)))
+                        local.seek(offset)
+                        local.write(data)
+                        local.flush()
+                        chunk_done(index, length)
+                    return
+                sftp = client.open_sftp()
+                try:
+                    with sftp.open(self.remote_file, 'rb') as remote:
+                        for index, offset, length in chunks:
+                            local.seek(offset)
+                            # readv prefetches the requests of the chunk in parallel
+                            for data in remote.readv([(offset, length)]):
+                                local.write(data)
+                            local.flush()
+                            chunk_done(index, length)
+                finally:
+                    sftp.close()
+
+        with perflog.timer('ssh download_file'):
+            self._run(state, self._chunks(remote_stat.st_size), download_chunks, progress)
+        if progress.resumed and self._md5(part_file) != self._remote_md5(self.remote_file):
+            os.remove(self.state_file)
+            raise IOError('Resumed download of {} is corrupted, retry it'.format(self.remote_file))
+        if os_path.exists(self.local_file):
+            os.remove(self.local_file)
+        os.rename(part_file, self.local_file)
+        return self._finish(progress)
+
+
 class SSHClient(paramiko.SSHClient):
     """paramiko.SSHClient wrapper
 
@@ -109,10 +632,14 @@ class SSHClient(paramiko.SSHClient):
             app and ``container`` then specifies the name of the pod to interact with.
         stdout: If specified, overrides the system stdout file for streaming output.
         stderr: If specified, overrides the system stderr file for streaming output.
+        pooled: If True (default), the transport is leased from :py:data:`transport_pool`
+            instead of opening a connection of its own.
     """
     def __init__(self, stream_output=False, **connect_kwargs):
         super(SSHClient, self).__init__()
         self._streaming = stream_output
+        self._pooled = connect_kwargs.pop('pooled', True)
+        self._lease = None
         # deprecated/useless karg, included for backward-compat
         self._keystate = connect_kwargs.pop('keystate', None)
         # Container is used to store both docker VM's container name and Openshift pod name.
@@ -174,6 +701,7 @@ class SSHClient(paramiko.SSHClient):
         new_connect_kwargs.update(connect_kwargs)
         # pass the key state if the hostname is the same, under the assumption that the same
         # host will still have keys installed if they have already been
+        new_connect_kwargs.setdefault('pooled', self._pooled)
         new_client = SSHClient(**new_connect_kwargs)
         return new_client
 
@@ -202,8 +730,17 @@ class SSHClient(paramiko.SSHClient):
     def close(self):
         with diaper:
             _client_session.remove(self)
+        self._release_transport()
         super(SSHClient, self).close()
 
+    def _release_transport(self):
+        # a leased transport is shared, it must not be closed by paramiko.SSHClient.close
+        if self._lease is not None:
+            lease, self._lease = self._lease, None
+            self._transport = None
+            with diaper:
+                transport_pool.release(lease)
+
     @property
     def connected(self):
         return self._transport and self._transport.active
@@ -219,8 +756,13 @@ class SSHClient(paramiko.SSHClient):
         if not self.connected:
             self._connect_kwargs.update(kwargs)
             self._check_port()
-            # Only install ssh keys if they aren't installed (or currently being installed)
-            conn = super(SSHClient, self).connect(**self._connect_kwargs)
+            if self._pooled:
+                self._release_transport()
+                self._lease = transport_pool.acquire(self._connect_kwargs)
+                self._transport = self._lease.transport
+                conn = None
+            else:
+                conn = super(SSHClient, self).connect(**self._connect_kwargs)
         else:
             conn = None
 
@@ -251,27 +793,51 @@ class SSHClient(paramiko.SSHClient):
             logger.warning(
                 'You are about to use sftp on a containerized appliance. It may not work.')
         self.connect()
-        return super(SSHClient, self).open_sftp(*args, **kwargs)
+        return self._open_channel(
+            lambda: super(SSHClient, self).open_sftp(*args, **kwargs))
+
+    def open_session(self):
+        """Open a session channel over the transport of the client"""
+        return self._open_channel(lambda: self.get_transport().open_session())
+
+    def _open_channel(self, open_channel):
+        try:
+            return open_channel()
+        except paramiko.ChannelException:
+            if self._lease is None:
+                raise
+            # the shared transport carries as many channels as the server allows, lease another
+            logger.info('%r was refused another channel, leasing another transport', self)
+            transport_pool.refused(self._lease)
+            self._release_transport()
+            self.connect()
+            return open_channel()
 
     def get_transport(self, *args, **kwargs):
         if not self.connected:
             self.connect()
         return super(SSHClient, self).get_transport(*args, **kwargs)
 
+    @perflog.timer('ssh run_command')
     def run_command(
             self, command, timeout=RUNCMD_TIMEOUT, reraise=False, ensure_host=False,
-            ensure_user=False, container=None):
+            ensure_user=False, container=None, stdout_callback=None, stderr_callback=None,
+            max_output=None):
         """Run a command over SSH.
 
         Args:
             command: The command. Supports taking dicts as version picking.
-            timeout: Timeout after which the command execution fails.
+            timeout: Seconds without any output after which the command execution fails.
             reraise: Does not muffle the paramiko exceptions in the log.
             ensure_host: Ensure that the command is run on the machine with the IP given, not any
                 container or such that we might be using by default.
             ensure_user: Ensure that the command is run as the user we logged in, so in case we are
                 not root, setting this to True will prevent from running sudo.
             container: allows to temporarily override default container
+            stdout_callback: Called with every complete line(s) of stdout as they arrive.
+            stderr_callback: Called with every complete line(s) of stderr as they arrive.
+            max_output: Maximum number of output bytes kept in the result, the rest is discarded
+                (but still passed to the callbacks).
         Returns:
             A :py:class:`SSHResult` instance.
         """
@@ -301,9 +867,14 @@ class SSHClient(paramiko.SSHClient):
             logger.info("> Actually running command %r", command)
         command += '\n'
 
-        output = []
+        output = _CommandOutput(
+            streams={
+                'stdout': self.f_stdout if self._streaming else None,
+                'stderr': self.f_stderr if self._streaming else None},
+            callbacks={'stdout': stdout_callback, 'stderr': stderr_callback},
+            max_output=max_output)
         try:
-            session = self.get_transport().open_session()
+            session = self.open_session()
             if uses_sudo:
                 # We need a pseudo-tty for sudo
                 session.get_pty()
@@ -311,53 +882,13 @@ class SSHClient(paramiko.SSHClient):
                 session.settimeout(float(timeout))
 
             session.exec_command(command)
-            stdout = session.makefile()
-            stderr = session.makefile_stderr()
-
-            def write_output(line, file):
-                output.append(line)
-                if self._streaming:
-                    file.write(line)
-
-            while True:
-                if session.exit_status_ready():
-                    break
-
-                # While the program is running loop through collecting line by line so that we don't
-                # fill the buffers up without a newline.
-                # Also, note that for long running programs if we try to read output when there
-                # is none (and in the case of stderr may never be any)
-                # we risk blocking so long that the write buffer on the remote side will fill
-                # and the remote program will block on a write.
-                # The blocking on our side occurs in paramiko's buffered_pipe.py's read() call,
-                # which will block if its internal buffer is empty.
-                if session.recv_ready():
-                    try:
-                        line = stdout.next()
-                        write_output(line, self.f_stdout)
-                    except StopIteration:
-                        pass
-
-                if session.recv_stderr_ready():
-                    try:
-                        line = stderr.next()
-                        write_output(line, self.f_stderr)
-                    except StopIteration:
-                        pass
-
-            # When the program finishes, we need to grab the rest of the output that is left.
-            # Also, we don't have the issue of blocking reads because since the command is
-            # finished, any pending reads of SSH encrypted data will finish shortly and put in
-            # the buffer or for an empty file EOF will be reached as it will be closed.
-            for line in stdout:
-                write_output(line, self.f_stdout)
-            for line in stderr:
-                write_output(line, self.f_stderr)
-
-            exit_status = session.recv_exit_status()
+            exit_status = self._read_channel(session, output, timeout)
+            if output.truncated:
+                logger.warning('Output of %r exceeded %d bytes, %d bytes were discarded',
+                    original_command, max_output, output.truncated)
             if exit_status != 0:
                 logger.warning('Exit code %d!', exit_status)
-            return SSHResult(rc=exit_status, output=''.join(output), command=command)
+            return SSHResult(rc=exit_status, output=output.text, command=command)
         except paramiko.SSHException:
             if reraise:
                 raise
@@ -367,12 +898,122 @@ class SSHClient(paramiko.SSHClient):
             logger.exception(
                 "Command %r timed out. Output before it failed was:\n%r",
                 command,
-                ''.join(output))
+                output.text)
             raise
 
         # Returning two things so tuple unpacking the return works even if the ssh client fails
         # Return whatever we have in the output
-        return SSHResult(rc=1, output=''.join(output), command=command)
+        return SSHResult(rc=1, output=output.text, command=command)
+
+    @staticmethod
+    def _read_channel(session, output, timeout):
+        """Read a command's output as it arrives and return its exit status
+
+        Waits in select on the channel instead of polling it, the channel's file descriptor
+        becomes readable whenever stdout or stderr data is buffered, or the channel reached EOF.
+        The exit status isn't signalled that way, so it's waited for once EOF was received.
+
+        The timeout applies to every wait, like a read timeout: a command fails if it doesn't
+        produce any output for ``timeout`` seconds, however long it runs in total.
+        The channel is closed in any case, it would count against the sessions of the
+        (shared) transport otherwise.
+        """
+        state = {'deadline': None}
+
+        def received():
+            if timeout:
+                state['deadline'] = time() + float(timeout)
+
+        def remaining():
+            if state['deadline'] is None:
+                return None
+            left = state['deadline'] - time()
+            if left <= 0:
+                raise socket.timeout('Command produced no output for {}s'.format(timeout))
+            return left
+
+        def read_ready():
+            while session.recv_ready():
+                output.feed('stdout', session.recv(RUNCMD_CHUNK_SIZE))
+                received()
+            while session.recv_stderr_ready():
+                output.feed('stderr', session.recv_stderr(RUNCMD_CHUNK_SIZE))
+                received()
+
+        try:
+            received()
+            while True:
+                read_ready()
+                if session.eof_received or session.closed:
+                    break
+                select.select([session], [], [], remaining())
+            # EOF keeps the descriptor readable, so the rest isn't waited for in select
+            if not session.status_event.wait(remaining()):
+                raise socket.timeout('Command did not finish in {}s after its output'.format(
+                    timeout))
+            # anything that arrived between the last read and EOF
+            read_ready()
+            output.finish()
+            return session.recv_exit_status()
+        finally:
+            session.close()
+
+    def run_commands(self, commands, timeout=RUNCMD_TIMEOUT, **kwargs):
+        """Run several commands one after another over a single channel
+
+        Every command runs in a subshell of its own with stderr redirected to stdout, the
+        remote shell prints marker lines around it with its exit status and a timestamp,
+        so the output and status of the commands can be told apart again.
+
+        Args:
+            commands: The commands, each of them supports taking dicts as version picking.
+            timeout: Seconds without any output after which the batch fails.
+            **kwargs: Passed to :py:meth:`run_command`, e.g. ``ensure_host`` or ``container``.
+        Returns:
+            A list of :py:class:`SSHResult` instances, one per command, with their ``duration``
+            as measured on the remote host. Commands which didn't get to finish, because the
+            batch failed, get ``rc`` 1 and whatever output they produced.
+        """
+        commands = [
+            version.pick(command, active_version=self.vmdb_version)
+            if isinstance(command, dict) else command
+            for command in commands]
+        if not commands:
+            return []
+        marker = 'cfme-batch-{}'.format(fauxfactory.gen_alphanumeric(12).lower())
+        script = []
+        for command in commands:
+            # the newline before the closing paren keeps a trailing comment from eating it
+            script.append(
+                'printf "{m} start %s\\n" "$(date +%s.%N)"\n'
+                '( {command}\n) 2>&1\n'
+                '__cfme_rc=$?; printf "{m} end %d %s\\n" $__cfme_rc "$(date +%s.%N)"'.format(
+                    m=marker, command=command))
+        logger.info('Running %d commands in a batch', len(commands))
+        batch = self.run_command('\n'.join(script), timeout=timeout, **kwargs)
+
+        results = []
+        finished = re.compile(
+            r'{m} start (\S+)\r?\n(.*?){m} end (\d+) (\S+)\r?\n'.format(m=re.escape(marker)),
+            re.DOTALL)
+        end = 0
+        for command, match in zip(commands, finished.finditer(batch.output)):
+            started, output, rc, ended = match.groups()
+            results.append(SSHResult(
+                command=command, rc=int(rc), output=output,
+                duration=float(ended) - float(started)))
+            end = match.end()
+        unfinished = commands[len(results):]
+        if unfinished:
+            logger.warning('%d of %d batched commands did not finish', len(unfinished),
+                len(commands))
+            # the output of the command the batch stopped in, if it got to start
+            partial = re.sub(
+                r'^{m} start \S+\r?\n'.format(m=re.escape(marker)), '', batch.output[end:])
+            for command in unfinished:
+                results.append(SSHResult(command=command, rc=1, output=partial))
+                partial = ''
+        return results
 
     def cpu_spike(self, seconds=60, cpus=2, **kwargs):
         """Creates a CPU spike of specific length and processes.
@@ -389,8 +1030,18 @@ class SSHClient(paramiko.SSHClient):
             "for ((i=0; i<instances; i++)) do while (($(date +%s) < $endtime)); "
             "do :; done & done".format(seconds, cpus), **kwargs)
 
+    @property
+    def rails_runner_daemon(self):
+        """The :py:class:`RailsRunnerDaemon` of this client's host, ``None`` unless enabled"""
+        return RailsRunnerDaemon.from_conf(self)
+
     def run_rails_command(self, command, timeout=RUNCMD_TIMEOUT, **kwargs):
         logger.info("Running rails command %r", command)
+        if self.rails_runner_daemon and not (
+                kwargs.get('ensure_host') or kwargs.get('container')):
+            result = self.rails_runner_daemon.run(command, timeout=timeout, **kwargs)
+            if result is not None:
+                return result
         return self.run_command('cd /var/www/miq/vmdb; bin/rails runner {command}'.format(
             command=command), timeout=timeout, **kwargs)
 
@@ -398,7 +1049,14 @@ class SSHClient(paramiko.SSHClient):
         """Runs Ruby inside of rails console. stderr is thrown away right now but could prove useful
         for future performance analysis of the queries rails runs.  The command is encapsulated by
         double quotes. Sandbox rolls back all changes made to the database if used.
+
+        Without sandbox, the command goes to the :py:attr:`rails_runner_daemon` if it's enabled,
+        its output then doesn't contain the console's echo of every statement.
         """
+        if self.rails_runner_daemon and not sandbox:
+            result = self.rails_runner_daemon.run('"{}"'.format(command), timeout=timeout)
+            if result is not None:
+                return result
         if sandbox:
             return self.run_command('cd /var/www/miq/vmdb; echo \"{}\" '
                 '| bundle exec bin/rails c -s 2> /dev/null'.format(command), timeout=timeout)
@@ -501,6 +1159,71 @@ class SSHClient(paramiko.SSHClient):
             return SCPClient(self.get_transport(), progress=self._progress_callback).get(
                 remote_file, local_path, **kwargs)
 
+    def _can_transfer_chunked(self):
+        # SFTP runs as the connected user and can't reach into containers and pods
+        return not (self.is_container or self.is_pod) and self.username == 'root'
+
+    def upload_file(self, local_file, remote_file, progress=None, **kwargs):
+        """Upload a large file in parallel chunks, see :py:class:`SSHTransfer`
+
+        Falls back to :py:meth:`put_file` for containers, pods and non-root users.
+
+        Args:
+            local_file: Path of the local file
+            remote_file: Path of the remote file, or the remote directory ending with ``/``
+            progress: Called with the :py:class:`TransferProgress` after every chunk
+            **kwargs: Options of :py:class:`SSHTransfer`, e.g. ``workers`` or ``compress``
+
+        Returns:
+            The final :py:class:`TransferProgress`
+        """
+        if remote_file.endswith('/'):
+            remote_file += os_path.basename(local_file)
+        logger.info("Uploading local file %r to remote %r", local_file, remote_file)
+        if not self._can_transfer_chunked():
+            started = time()
+            self.put_file(local_file, remote_file)
+            size = os_path.getsize(local_file)
+            return TransferProgress(
+                local_file, remote_file, size=size, transferred=size, started=started,
+                finished=time())
+        self.connect()
+        return SSHTransfer(
+            self, local_file, remote_file, progress_callback=progress, **kwargs).upload()
+
+    def download_file(self, remote_file, local_path, progress=None, **kwargs):
+        """Download a large file in parallel chunks, see :py:class:`SSHTransfer`
+
+        Falls back to :py:meth:`get_file` for containers, pods and non-root users.
+
+        Args:
+            remote_file: Path of the remote file
+            local_path: Path of the local file, or an existing local directory
+            progress: Called with the :py:class:`TransferProgress` after every chunk
+            **kwargs: Options of :py:class:`SSHTransfer`, e.g. ``workers`` or ``compress``
+
+        Returns:
+            The final :py:class:`TransferProgress`
+        """
+        if os_path.isdir(local_path):
+            local_path = os_path.join(local_path, os_path.basename(remote_file))
+        logger.info("Downloading remote file %r to local %r", remote_file, local_path)
+        if not self._can_transfer_chunked():
+            started = time()
+            # get_file of containers and pods only takes a directory, the file keeps its name
+            local_dir = os_path.dirname(local_path) or '.'
+            self.get_file(remote_file, local_dir)
+            downloaded = os_path.join(local_dir, os_path.basename(remote_file))
+            if os_path.abspath(downloaded) != os_path.abspath(local_path):
+                os.rename(downloaded, local_path)
+            size = os_path.getsize(local_path)
+            return TransferProgress(
+                remote_file, local_path, size=size, transferred=size, started=started,
+                finished=time())
+        self.connect()
+        return SSHTransfer(
+            self, local_path, remote_file, progress_callback=progress, **kwargs).download()
+
     def patch_file(self, local_path, remote_path, md5=None):
         """ Patches a single file on the appliance
 
@@ -666,6 +1389,134 @@ class SSHClient(paramiko.SSHClient):
         return {"servers": servers, "workers": workers}
 
 
+#: Printed by the rails runner daemon client when there's no daemon listening
+RAILS_RUNNER_UNAVAILABLE = 'cfme-rails-runner-unavailable'
+# Runs on the appliance with the daemon's socket path and the rails runner arguments as ARGV,
+# see data/utils/rails_runner_daemon.rb for the other end
+_RAILS_RUNNER_CLIENT = (
+    'require "json"; require "socket"; '
+    'begin; s = UNIXSocket.new(ARGV.shift); '
+    'rescue SystemCallError; puts "{unavailable}"; exit 254; end; '
+    's.write(JSON.dump(ARGV)); s.close_write; out = s.read; '
+    'body, marker, status = out.rpartition("\\0cfme-rails-runner-status:"); '
+    'if marker.empty? then print out; exit 1; end; '
+    'print body; exit status.to_i'.format(unavailable=RAILS_RUNNER_UNAVAILABLE))
+
+# the daemons by hostname, every client of a host uses the same one
+_rails_runner_daemons = {}
+_rails_runner_daemons_lock = threading.Lock()
+
+
+@attr.s
+class RailsRunnerDaemon(object):
+    """Long lived ``bin/rails runner`` on the appliance
+
+    Booting the rails environment takes half a minute on a busy appliance. The daemon boots it
+    once and forks a child with the loaded environment for every command, so rails commands
+    start right away. It's started on first use and exits by itself after :py:attr:`idle_timeout`
+    seconds without commands, or when :py:meth:`stop` is called at the end of the session.
+    If it can't be started, commands fall back to a plain ``bin/rails runner``.
+
+    There is one daemon per appliance. The clients of a host share it through
+    :py:meth:`from_conf`, and the test processes share it through a lock file on the appliance,
+    which the running daemon holds.
+
+    It's opt-in, in env.yaml:
+
+    .. code-block:: yaml
+
+        rails_runner:
+            daemon: True
+            # seconds without commands before the daemon exits
+            idle_timeout: 1800
+
+    Containerized and podified appliances always use the plain rails runner.
+    """
+    client = attr.ib(repr=False)
+    idle_timeout = attr.ib(default=1800)
+    boot_timeout = attr.ib(default=600)
+    started = attr.ib(default=False)
+    _lock = attr.ib(default=attr.Factory(threading.Lock), repr=False)
+
+    script = data_path.join('utils', 'rails_runner_daemon.rb')
+    remote_script = '/var/www/miq/vmdb/tmp/cfme_rails_runner_daemon.rb'
+    socket_path = '/var/www/miq/vmdb/tmp/cfme_rails_runner.sock'
+    lock_file = '/var/www/miq/vmdb/tmp/cfme_rails_runner.lock'
+    log_file = '/var/www/miq/vmdb/log/cfme_rails_runner_daemon.log'
+
+    @classmethod
+    def from_conf(cls, client):
+        """Get the daemon of the client's host, ``None`` unless it's enabled for it"""
+        rails_runner_conf = conf.env.get('rails_runner', {})
+        if not rails_runner_conf.get('daemon', False) or client.is_pod or client.is_container:
+            return None
+        hostname = client._connect_kwargs['hostname']
+        with _rails_runner_daemons_lock:
+            if hostname not in _rails_runner_daemons:
+                # a client of its own, the one passed in may be closed by its owner
+                _rails_runner_daemons[hostname] = cls(
+                    client(), idle_timeout=rails_runner_conf.get('idle_timeout', 1800))
+            return _rails_runner_daemons[hostname]
+
+    def start(self):
+        """Start the daemon unless it's running, returns whether it's running"""
+        with self._lock:
+            if self.started:
+                return True
+            logger.info('Starting the rails runner daemon')
+            self.client.put_file(self.script.strpath, self.remote_script)
+            # Nobody holds the lock if there's no daemon, a socket left then is stale. If another
+            # test process started the daemon already, the new one exits right away.
+            self.client.run_command(
+                'cd /var/www/miq/vmdb; flock -n {lock} true && rm -f {sock}; '
+                'nohup flock -n {lock} bin/rails runner {script} {sock} {idle} '
+                '< /dev/null >> {log} 2>&1 &'.format(
+                    lock=self.lock_file, script=self.remote_script, sock=self.socket_path,
+                    idle=self.idle_timeout, log=self.log_file))
+            try:
+                # the socket only appears once the rails environment is loaded
+                wait_for(
+                    lambda: self.client.run_command('test -S {} && ! flock -n {} true'.format(
+                        self.socket_path, self.lock_file)).success,
+                    num_sec=self.boot_timeout, delay=5, message='rails runner daemon to boot')
+            except TimedOutError:
+                logger.error('The rails runner daemon did not start, see %s', self.log_file)
+                return False
+            self.started = True
+            return True
+
+    def run(self, command, timeout=RUNCMD_TIMEOUT, **kwargs):
+        """Run rails runner arguments through the daemon
+
+        Returns:
+            A :py:class:`SSHResult` instance, ``None`` if the daemon isn't available
+        """
+        # the daemon might have gone idle or the appliance rebooted, start it again once
+        for _ in range(2):
+            if not self.start():
+                return None
+            result = self.client.run_command(
+                'cd /var/www/miq/vmdb; ruby -e {client} {sock} {command}'.format(
+                    client=quote(_RAILS_RUNNER_CLIENT), sock=self.socket_path, command=command),
+                timeout=timeout, **kwargs)
+            if result.rc == 254 and RAILS_RUNNER_UNAVAILABLE in result.output:
+                with self._lock:
+                    self.started = False
+                continue
+            return result
+        return None
+
+    def stop(self):
+        """Stop the daemon of the host, for every test process using it
+
+        It may have been started by another test process, so it's stopped even if this one
+        didn't start it.
+        """
+        with self._lock:
+            self.client.run_command('pkill -f "rails runne[r] {}"'.format(self.remote_script))
+            self.started = False
+
+
 class SSHTail(SSHClient):
 
     def __init__(self, remote_filename, **connect_kwargs):
@@ -711,6 +1562,353 @@ class SSHTail(SSHClient):
         return list(self)
 
 
+class SSHLogFollower(SSHClient):
+    """Follows remote log files over one long running ``tail -F`` channel
+
+    Unlike :py:class:`SSHTail`, which polls the file over SFTP, the appliance pushes new lines
+    as soon as they're written. A background thread reads them from the channel into a queue.
+    Several files are followed over the same channel, every line is delivered together with
+    the name of the file it came from. If ``grep_pattern`` is given, lines are filtered with
+    ``grep -E`` on the appliance already, so the rest of the log isn't transferred at all.
+
+    Following starts at the end the files had when :py:meth:`start` was called, files rotated
+    or recreated later on are followed from their beginning.
+
+    Args:
+        remote_filenames: Path of the remote file or a list of them
+        grep_pattern: Extended regular expression (``grep -E``) lines have to match
+        connect_kwargs: Passed to :py:class:`SSHClient`
+
+    Usage:
+
+    .. code-block:: python
+
+        with SSHLogFollower('/var/www/miq/vmdb/log/evm.log', grep_pattern='MiqServer') as evm:
+            restart_evm()
+            filename, line = evm.wait_for_line('All workers have been started', timeout=600)
+    """
+    _READY = 'cfme-log-follower-ready'
+
+    def __init__(self, remote_filenames, grep_pattern=None, **connect_kwargs):
+        super(SSHLogFollower, self).__init__(stream_output=False, **connect_kwargs)
+        if isinstance(remote_filenames, basestring):
+            remote_filenames = [remote_filenames]
+        self._remote_filenames = list(remote_filenames)
+        self._grep_pattern = grep_pattern
+        self._channel = None
+        self._channel_client = None
+        self._reader = None
+        self._ready = threading.Event()
+        self._lines = queue.Queue()
+        # positions of the files up to which lines were consumed
+        self._positions = {}
+
+    @property
+    def following(self):
+        channel = self._channel
+        return channel is not None and not (channel.closed or channel.eof_received)
+
+    def _follow_command(self):
+        # The offsets are taken before the ready line is printed, so nothing written after
+        # start() returns is missed even if tail needs a moment to open the files. They're
+        # printed with the ready line, grep labels every line with the index of its file and
+        # the line's offset after it, together they give the position the line ends at.
+        commands = []
+        pipes = []
+        for index, filename in enumerate(self._remote_filenames):
+            commands.append('o{i}=$(stat -c %s {f} 2>/dev/null || echo 0)'.format(
+                i=index, f=quote(filename)))
+            pipes.append(
+                '(tail -F -c +$((o{i} + 1)) {f} 2>/dev/null'
+                ' | grep --line-buffered -b -H --label={i} -E {pattern})'.format(
+                    i=index, f=quote(filename), pattern=quote(self._grep_pattern or '')))
+        commands.append('echo {} {}'.format(self._READY, ' '.join(
+            '$o{}'.format(index) for index in range(len(self._remote_filenames)))))
+        commands.append(''.join('{} & '.format(pipe) for pipe in pipes) + 'wait')
+        return '; '.join(commands)
+
+    def _read_lines(self, channel):
+        # split the raw bytes, a character may be split between two chunks and the positions
+        # count the bytes of the lines
+        pending = b''
+        offsets = [0] * len(self._remote_filenames)
+        while True:
+            chunk = channel.recv(RUNCMD_CHUNK_SIZE)
+            if not chunk:
+                break
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                # the pty terminates lines with \r\n
+                line = line.rstrip(b'\r')
+                if line.startswith(self._READY.encode('ascii')):
+                    offsets = [int(offset) for offset in line.split()[1:]]
+                    self._positions = dict(zip(self._remote_filenames, offsets))
+                    self._ready.set()
+                    continue
+                index, sep, rest = line.partition(b':')
+                offset, sep2, text = rest.partition(b':')
+                if not sep or not sep2 or not index.isdigit() or not offset.isdigit():
+                    logger.debug('Unexpected line from the log follower: %r', line)
+                    continue
+                index = int(index)
+                end = offsets[index] + int(offset) + len(text) + 1
+                self._lines.put(
+                    (self._remote_filenames[index], text.decode('utf-8', 'replace'), end))
+        self._ready.set()
+
+    def start(self, timeout=60):
+        """Start following the files from their current end"""
+        if self.following:
+            return
+        self.connect()
+        self._ready.clear()
+        # the channel stays open, it gets a lease of its own to leave this one to run_command
+        self._channel_client = self()
+        self._channel = self._channel_client.open_session()
+        # with a pty the remote processes get a SIGHUP once the channel is closed
+        self._channel.get_pty()
+        self._channel.exec_command(self._follow_command())
+        self._reader = threading.Thread(
+            target=self._read_lines, args=(self._channel,), name='log-follower')
+        self._reader.daemon = True
+        self._reader.start()
+        if not self._ready.wait(timeout) or not self._reader.is_alive():
+            self.stop()
+            raise socket.timeout('Could not start following {}'.format(
+                ', '.join(self._remote_filenames)))
+        logger.debug('Following %s', ', '.join(self._remote_filenames))
+
+    #: Same as :py:meth:`start`, to be used in place of :py:class:`SSHTail`
+    set_initial_file_end = start
+
+    def stop(self):
+        """Stop following, lines that were already received can still be read"""
+        channel, self._channel = self._channel, None
+        if channel is not None:
+            with diaper:
+                channel.close()
+        if self._reader is not None:
+            self._reader.join(5)
+            self._reader = None
+        if self._channel_client is not None:
+            client, self._channel_client = self._channel_client, None
+            with diaper:
+                client.close()
+
+    def _iter_entries(self, timeout=0, idle_timeout=None, until=None):
+        deadline = time() + timeout
+        while until is None or not until():
+            wait = max(0, deadline - time())
+            if idle_timeout is not None:
+                wait = min(wait, idle_timeout)
+            try:
+                if wait and (self.following or not self._lines.empty()):
+                    filename, line, end = self._lines.get(timeout=wait)
+                else:
+                    filename, line, end = self._lines.get_nowait()
+            except queue.Empty:
+                return
+            self._positions[filename] = end
+            yield filename, line
+
+    def iter_lines(self, timeout=0, idle_timeout=None):
+        """Yield ``(filename, line)`` pairs as they arrive
+
+        Args:
+            timeout: Seconds to wait for new lines in total, ``0`` yields the received ones only.
+            idle_timeout: Stop once no line arrived for that many seconds, even before timeout.
+        """
+        return self._iter_entries(timeout, idle_timeout)
+
+    def remote_sizes(self):
+        """Current sizes of the followed files in bytes, ``0`` for missing ones"""
+        result = self.run_command('; '.join(
+            'stat -c %s {} 2>/dev/null || echo 0'.format(quote(filename))
+            for filename in self._remote_filenames))
+        return dict(zip(self._remote_filenames, (int(size) for size in result.output.split())))
+
+    def iter_lines_to_end(self, timeout=30):
+        """Yield the ``(filename, line)`` pairs written until now, then stop
+
+        The sizes of the files are taken first, the lines are yielded until the ones ending
+        there arrived, without waiting for the files to go quiet. Lines filtered out by
+        ``grep_pattern`` never arrive, if the last lines of a file don't match this waits for
+        the whole ``timeout``. After a file was rotated it may return before its last lines
+        arrived.
+
+        Args:
+            timeout: Seconds to wait for lines which are still on their way at most.
+        """
+        sizes = self.remote_sizes()
+        return self._iter_entries(timeout, until=lambda: all(
+            self._positions.get(filename, 0) >= size for filename, size in sizes.items()))
+
+    def __iter__(self):
+        for _, line in self.iter_lines():
+            yield line
+
+    def lines_as_list(self):
+        """Return the received lines as list"""
+        return list(self)
+
+    def wait_for_line(self, pattern, timeout=RUNCMD_TIMEOUT):
+        """Wait for a line that matches the regular expression ``pattern``
+
+        Lines received before the match are consumed.
+
+        Returns:
+            The ``(filename, line)`` pair of the matching line.
+
+        Raises:
+            :py:class:`cfme.utils.wait.TimedOutError` if no line matched within the timeout
+        """
+        regex = re.compile(pattern)
+        for filename, line in self.iter_lines(timeout=timeout):
+            if regex.search(line):
+                return filename, line
+        raise TimedOutError('No line matching {!r} in {} within {}s'.format(
+            pattern, ', '.join(self._remote_filenames), timeout))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+    def close(self):
+        self.stop()
+        super(SSHLogFollower, self).close()
+
+
+@attr.s
+class FanOutResult(object):
+    """Outcome of a :py:class:`SSHFanOut` operation on one target"""
+    target = attr.ib()
+    value = attr.ib(default=None, repr=False)
+    error = attr.ib(default=None)
+    duration = attr.ib(default=None)
+
+    @property
+    def success(self):
+        if self.error is not None:
+            return False
+        return self.value.success if isinstance(self.value, SSHResult) else True
+
+
+@attr.s
+class SSHFanOut(object):
+    """Runs the same operation against many appliances at once
+
+    Targets are appliances (anything with an ``ssh_client``) or :py:class:`SSHClient` instances.
+    At most :py:attr:`max_workers` targets are worked on at the same time, each in a daemon
+    thread. A target which takes longer than :py:attr:`timeout` seconds gets a
+    :py:class:`concurrent.futures.TimeoutError` as its result and its thread is left running in
+    the background, another thread takes over its slot. So one stuck host holds up neither the
+    targets waiting for a slot nor the end of the session.
+
+    Usage:
+
+        results = SSHFanOut(appliances).run_command('systemctl stop evmserverd')
+        failed = [result.target for result in results.values() if not result.success]
+
+    All methods return an :py:class:`OrderedDict` mapping every target to its
+    :py:class:`FanOutResult`, in the order of the targets.
+    """
+    targets = attr.ib(convert=list)
+    max_workers = attr.ib(default=8)
+    timeout = attr.ib(default=RUNCMD_TIMEOUT)
+
+    @staticmethod
+    def ssh_client(target):
+        return target if isinstance(target, SSHClient) else target.ssh_client
+
+    def map(self, func):
+        """Call ``func`` with each of the targets"""
+        results = OrderedDict((target, None) for target in self.targets)
+        if not self.targets:
+            return results
+        # partials and other callables have no __name__
+        func_name = getattr(func, '__name__', repr(func))
+        waiting = queue.Queue()
+        for target in results:
+            waiting.put(target)
+        finished = queue.Queue()
+        started = {}
+
+        def work():
+            while True:
+                try:
+                    target = waiting.get_nowait()
+                except queue.Empty:
+                    return
+                started[target] = time()
+                try:
+                    value, error = func(target), None
+                except Exception as e:
+                    value, error = None, e
+                finished.put((target, value, error, time() - started[target]))
+
+        def add_worker():
+            # daemon threads, the ones stuck on a host must not block the interpreter's exit
+            worker = threading.Thread(target=work, name='ssh-fan-out')
+            worker.daemon = True
+            worker.start()
+
+        for _ in range(min(self.max_workers, len(results))):
+            add_worker()
+        remaining = set(results)
+        while remaining:
+            try:
+                target, value, error, duration = finished.get(timeout=1)
+            except queue.Empty:
+                pass
+            else:
+                # results of targets that already timed out are dropped
+                if target in remaining:
+                    remaining.remove(target)
+                    if error is not None:
+                        logger.warning('%s failed on %r: %s', func_name, target, error)
+                    results[target] = FanOutResult(
+                        target, value=value, error=error, duration=duration)
+            for target in list(remaining):
+                if target in started and time() - started[target] > self.timeout:
+                    logger.warning('%s timed out on %r', func_name, target)
+                    results[target] = FanOutResult(
+                        target, error=futures.TimeoutError(), duration=self.timeout)
+                    remaining.remove(target)
+                    # the stuck thread keeps its target, the waiting ones get a new thread
+                    add_worker()
+        return results
+
+    def run_command(self, command, **kwargs):
+        """Run a command on all targets, see :py:meth:`SSHClient.run_command`"""
+        kwargs.setdefault('timeout', self.timeout)
+
+        def run_command(target):
+            return self.ssh_client(target).run_command(command, **kwargs)
+        return self.map(run_command)
+
+    def put_file(self, local_file, remote_file='.', **kwargs):
+        """Upload a file to all targets, see :py:meth:`SSHClient.put_file`"""
+        def put_file(target):
+            return self.ssh_client(target).put_file(local_file, remote_file, **kwargs)
+        return self.map(put_file)
+
+    def get_file(self, remote_file, local_path='', **kwargs):
+        """Download a file from all targets, see :py:meth:`SSHClient.get_file`
+
+        ``local_path`` is formatted with the ``hostname`` of each target, so the files
+        don't overwrite each other, e.g. ``log/{hostname}-evm.log``.
+        """
+        def get_file(target):
+            client = self.ssh_client(target)
+            hostname = getattr(target, 'hostname', None) or client._connect_kwargs['hostname']
+            return client.get_file(remote_file, local_path.format(hostname=hostname), **kwargs)
+        return self.map(get_file)
+
+
 def keygen():
     """Generate temporary ssh keypair for appliance SSH auth
 
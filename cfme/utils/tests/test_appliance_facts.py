@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from cfme.utils.appliance import facts
+from cfme.utils.appliance.facts import ApplianceFacts, fact_property
+from cfme.utils.version import Version
+
+
+class FakeResult(object):
+    failed = False
+
+    def __init__(self, output):
+        self.output = output
+
+
+class FakeSSHClient(object):
+    def __init__(self, appliance):
+        self.appliance = appliance
+
+    def run_command(self, command):
+        return FakeResult('{}\n{}'.format(self.appliance.guid_file, self.appliance.version_file))
+
+
+class FakeAppliance(object):
+    facts = ApplianceFacts.declare()
+
+    def __init__(self):
+        self.hostname = 'fake-appliance'
+        self.guid_file = 'abc'
+        self.version_file = '5.9.0.1'
+        self.ssh_client = FakeSSHClient(self)
+        self.lookups = 0
+
+    @fact_property
+    def version(self):
+        self.lookups += 1
+        return Version(self.version_file)
+
+
+@pytest.fixture
+def cache_dir(tmpdir, monkeypatch):
+    monkeypatch.setattr(facts, 'cache_path', tmpdir)
+    return tmpdir
+
+
+def test_facts_are_shared_between_instances(cache_dir):
+    first = FakeAppliance()
+    assert first.version == '5.9.0.1'
+    assert first.lookups == 1
+    second = FakeAppliance()
+    assert isinstance(second.version, Version)
+    assert second.version == '5.9.0.1'
+    assert second.lookups == 0
+
+
+def test_facts_are_dropped_when_the_appliance_changes(cache_dir):
+    assert FakeAppliance().version == '5.9.0.1'
+    redeployed = FakeAppliance()
+    redeployed.guid_file = 'def'
+    redeployed.version_file = '5.9.1.0'
+    redeployed.facts.validate()
+    assert redeployed.version == '5.9.1.0'
+    assert redeployed.lookups == 1
+
+
+def test_facts_invalidate(cache_dir):
+    appliance = FakeAppliance()
+    assert appliance.version == '5.9.0.1'
+    appliance.version_file = '5.9.1.0'
+    appliance.facts.invalidate()
+    assert appliance.version == '5.9.1.0'
+    assert appliance.lookups == 2
+
+
+def test_facts_of_another_appliance_are_not_used(cache_dir):
+    assert FakeAppliance().version == '5.9.0.1'
+    # another appliance got the hostname, nobody called validate()
+    redeployed = FakeAppliance()
+    redeployed.guid_file = 'def'
+    redeployed.version_file = '5.9.1.0'
+    assert redeployed.version == '5.9.1.0'
+    assert redeployed.lookups == 1
+
+
+def test_facts_are_not_cached_if_the_identity_is_unknown(cache_dir):
+    assert FakeAppliance().version == '5.9.0.1'
+    unreachable = FakeAppliance()
+    unreachable.ssh_client = None
+    unreachable.version_file = '5.9.1.0'
+    assert unreachable.version == '5.9.1.0'
+    assert unreachable.lookups == 1
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from cfme.utils.appliance.health import ApplianceHealth
+from cfme.utils.wait import TimedOutError
+
+
+class FakeHealth(ApplianceHealth):
+    """Components come up after the given number of seconds, every check takes a second"""
+    up_after = {'evm_service': 0, 'web_ui': 0, 'rest_api': 0, 'postgres': 0}
+
+    def _fake_check(self, name):
+        started = time.time()
+        time.sleep(1)
+        self.checked.append((started, time.time()))
+        return time.time() - self.started >= self.up_after[name], 'starting'
+
+    def check_evm_service(self):
+        return self._fake_check('evm_service')
+
+    def check_web_ui(self):
+        return self._fake_check('web_ui')
+
+    def check_rest_api(self):
+        return self._fake_check('rest_api')
+
+    def check_postgres(self):
+        raise IOError('connection refused')
+
+
+class FakeAppliance(object):
+    hostname = 'fake-appliance'
+
+
+# plugins keep a weak reference to their appliance
+appliance = FakeAppliance()
+
+
+@pytest.fixture
+def health():
+    health = FakeHealth(appliance)
+    health.started = time.time()
+    health.checked = []
+    return health
+
+
+def test_probe_checks_components_concurrently(health):
+    status = health.probe()
+    # every check started before any of them finished
+    assert max(start for start, _ in health.checked) < min(end for _, end in health.checked)
+    assert all(status[name].duration >= 1 for name in ('evm_service', 'web_ui', 'rest_api'))
+    assert status.up == ['evm_service', 'rest_api', 'web_ui']
+    assert status.failed == ['postgres']
+    assert 'connection refused' in status['postgres'].detail
+    assert not status.ready
+
+
+def test_wait_for_ready(health):
+    health.up_after = dict(health.up_after, web_ui=3)
+    statuses = []
+    status = health.wait_for_ready(
+        components=('evm_service', 'web_ui'), timeout=20, delay=1, callback=statuses.append)
+    assert status.ready
+    assert not statuses[0].ready
+
+
+def test_wait_for_ready_timeout(health):
+    with pytest.raises(TimedOutError):
+        health.wait_for_ready(timeout=2, delay=1)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from threading import Thread
+
+import pytest
+from sqlalchemy import create_engine
+
+from cfme.utils.db import Db
+
+
+@pytest.fixture
+def db():
+    db = Db(hostname='localhost', credentials={'username': 'user', 'password': 'pass'},
+            port=5432)
+    # the engine is a cached_property, sqlite stands in for postgres
+    db.engine = create_engine('sqlite://')
+    return db
+
+
+def test_db_session_per_thread(db):
+    sessions = []
+
+    def get_session():
+        session = db.session
+        sessions.append((session, session is db.session, session.execute('SELECT 1').scalar()))
+        db.remove_sessions()
+
+    thread = Thread(target=get_session)
+    thread.start()
+    thread.join()
+
+    [(thread_session, same_in_thread, result)] = sessions
+    assert same_in_thread and result == 1
+    assert db.session is db.session
+    assert db.session.execute('SELECT 1').scalar() == 1
+    assert thread_session is not db.session
+
+
+def sqlite_db(engine):
+    db = Db(hostname='localhost', credentials={'username': 'user', 'password': 'pass'},
+            port=5432)
+    db.engine = engine
+    return db
+
+
+def test_db_schema_cache(tmpdir, monkeypatch):
+    monkeypatch.setattr('cfme.utils.db.schema_cache_path', tmpdir.join('db_schema'))
+    engine = create_engine('sqlite:///{}'.format(tmpdir.join('vmdb.sqlite')))
+    engine.execute('CREATE TABLE schema_migrations (version VARCHAR PRIMARY KEY)')
+    engine.execute("INSERT INTO schema_migrations VALUES ('1')")
+    engine.execute('CREATE TABLE vms (id INTEGER PRIMARY KEY, name VARCHAR)')
+    engine.execute('CREATE TABLE hosts (id INTEGER PRIMARY KEY)')
+
+    saves = []
+    save_schema_cache = Db._save_schema_cache
+    monkeypatch.setattr(
+        Db, '_save_schema_cache', lambda db: saves.append(db) or save_schema_cache(db))
+    first = sqlite_db(engine)
+    assert sorted(table.__tablename__ for table in first.values()) == [
+        'hosts', 'schema_migrations', 'vms']
+    # the tables are reflected together and saved once
+    assert len(saves) == 1
+
+    # a second db gets the tables from the cache, even if the table changed since
+    engine.execute('ALTER TABLE vms ADD COLUMN vendor VARCHAR')
+    second = sqlite_db(engine)
+    assert 'vendor' not in second['vms'].__table__.columns
+    assert len(saves) == 1
+
+    # a new migration level doesn't use the tables cached for the old one
+    engine.execute("INSERT INTO schema_migrations VALUES ('2')")
+    third = sqlite_db(engine)
+    assert 'vendor' in third['vms'].__table__.columns
+    assert len(tmpdir.join('db_schema').listdir()) == 2
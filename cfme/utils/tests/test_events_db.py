@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from cfme.utils.events_db import DbEventListener, Event, EventAttr
+
+
+class FakeEventTool(object):
+    event_streams_attributes = [
+        ('id', int), ('event_type', str), ('target_type', str), ('target_id', int)]
+
+
+@pytest.fixture
+def listener():
+    listener = DbEventListener(appliance=None, push=False)
+    listener._tool = FakeEventTool()
+    return listener
+
+
+def got_event(listener, **attrs):
+    return Event(listener._tool, *[EventAttr(**{name: value}) for name, value in attrs.items()])
+
+
+def test_expected_events_index(listener):
+    vm_create = listener.new_event(event_type='vm_create', target_type='VmOrTemplate',
+                                   target_id=1)
+    any_vm_event = listener.new_event(target_type='VmOrTemplate')
+    any_start = listener.new_event(
+        {'event_type': 'start', 'cmp_func': lambda _, got: got.endswith('start')})
+    listener.listen_to(vm_create, any_vm_event, any_start)
+
+    listener.process_event(got_event(listener, id=1, event_type='vm_create',
+                                     target_type='VmOrTemplate', target_id=1))
+    listener.process_event(got_event(listener, id=2, event_type='vm_start',
+                                     target_type='VmOrTemplate', target_id=1))
+    listener.process_event(got_event(listener, id=3, event_type='host_start',
+                                     target_type='Host', target_id=1))
+
+    matched = {id(exp_event['event']): [evt.event_attrs['id'].value
+                                        for evt in exp_event['matched_events']]
+               for exp_event in listener.got_events}
+    assert matched[id(vm_create)] == [1]
+    assert matched[id(any_vm_event)] == [1, 2]
+    assert matched[id(any_start)] == [2, 3]
+
+
+def test_expected_events_index_reset(listener):
+    listener(event_type='vm_create', target_type='VmOrTemplate')
+    listener.reset_events()
+    listener.process_event(got_event(listener, id=1, event_type='vm_create',
+                                     target_type='VmOrTemplate'))
+    assert listener.got_events == []
@@ -0,0 +1,45 @@
+import logging
+from threading import Thread
+from time import sleep, time
+
+from cfme.utils.log import AsyncLogHandler
+
+
+class LoggingBackHandler(logging.Handler):
+    """Logs to the logger it's handling, once the async handler's queue is full"""
+    def __init__(self, logger, async_handler):
+        logging.Handler.__init__(self)
+        self.logger = logger
+        self.async_handler = async_handler
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+        if record.getMessage() == 'first':
+            deadline = time() + 5
+            while not self.async_handler._queue.full() and time() < deadline:
+                sleep(0.01)
+            # give the caller time to block on the full queue
+            sleep(0.1)
+            self.logger.warning('logged back')
+
+
+def test_async_log_handler_block_log_back():
+    logger = logging.getLogger('test_async_log_handler_block_log_back')
+    logger.propagate = False
+    async_handler = AsyncLogHandler(queue_size=1, overflow='block')
+    sub_handler = LoggingBackHandler(logger, async_handler)
+    async_handler.addHandler(sub_handler)
+    logger.addHandler(async_handler)
+    try:
+        caller = Thread(
+            target=lambda: [logger.warning(msg) for msg in ('first', 'second', 'third')])
+        caller.daemon = True
+        caller.start()
+        caller.join(10)
+        assert not caller.is_alive(), 'the caller is stuck on the full queue'
+        async_handler.flush()
+        assert sorted(sub_handler.messages) == ['first', 'logged back', 'second', 'third']
+    finally:
+        logger.removeHandler(async_handler)
+        async_handler.close()
@@ -0,0 +1,40 @@
+import json
+
+from cfme.utils.metrics import Metrics
+
+
+def test_metrics_nesting():
+    metrics = Metrics()
+    with metrics.timer('outer'):
+        with metrics.timer('inner'):
+            metrics.count('retries')
+        metrics.observe('items', 3)
+
+    @metrics.timer('recursive')
+    def recurse(n):
+        return recurse(n - 1) if n else n
+    recurse(1)
+
+    assert sorted(metrics.timers) == [
+        'outer', 'outer/inner', 'recursive', 'recursive/recursive']
+    assert metrics.counters == {'outer/inner/retries': 1}
+    assert metrics.histograms['outer/items'].max == 3
+
+
+def test_metrics_merge():
+    metrics = Metrics()
+    for seconds in (1, 2, 6):
+        metrics.record_time('step', seconds)
+    metrics.count('retries', 2)
+    # snapshots travel from the slaves to the master as json
+    snapshot = json.loads(json.dumps(metrics.snapshot()))
+
+    merged = Metrics()
+    merged.merge(snapshot)
+    merged.merge(snapshot)
+    (path, step), = merged.top_timers(1)
+    assert path == 'step'
+    assert (step.count, step.total, step.min, step.max) == (6, 18, 1, 6)
+    assert step.percentile(50) == 2
+    assert step.percentile(95) == 6
+    assert merged.counters['retries'] == 4
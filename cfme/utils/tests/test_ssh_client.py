@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
+import os
+
 import pytest
 from cfme.utils.appliance import DummyAppliance
+from cfme.utils.ssh import SSHClient
 pytestmark = [
     pytest.mark.nondestructive,
     pytest.mark.skip_selenium,
@@ -32,3 +35,62 @@ def test_scp_client_can_put_a_file(appliance, tmpdir):
     assert "content" in tmpfile.read()
     # Clean up the server
     appliance.ssh_client.run_command("rm -f /tmp/{}".format(tmpfile.basename))
+
+
+def test_ssh_clients_share_pooled_transport(appliance):
+    # A copy of the client leases the transport of the original one from the pool
+    client = appliance.ssh_client()
+    assert client.run_command('true').success
+    assert client.get_transport() is appliance.ssh_client.get_transport()
+    client.close()
+    assert appliance.ssh_client.run_command('true').success
+
+
+def test_ssh_client_run_commands(appliance):
+    first, failed, last = appliance.ssh_client.run_commands(
+        ['echo first', 'echo failed >&2; exit 3', 'printf last'])
+    assert first.success
+    assert first.output == 'first\n'
+    assert failed.rc == 3
+    assert 'failed' in failed
+    assert last.output == 'last'
+    assert last.duration >= 0
+
+
+@pytest.mark.parametrize('compress', [False, True], ids=['sftp', 'gzip'])
+def test_ssh_client_chunked_transfer(appliance, tmpdir, compress):
+    local_file = tmpdir.join('upload.bin')
+    local_file.write_binary(os.urandom(300000))
+    remote_file = '/tmp/{}'.format(local_file.basename)
+    ssh_client = appliance.ssh_client
+    uploaded = ssh_client.upload_file(
+        local_file.strpath, remote_file, chunk_size=65536, compress=compress)
+    assert uploaded.transferred == 300000
+    # the same file again is skipped
+    assert ssh_client.upload_file(local_file.strpath, remote_file).skipped
+    downloaded = ssh_client.download_file(
+        remote_file, tmpdir.join('download.bin').strpath, chunk_size=65536, compress=compress)
+    assert downloaded.transferred == 300000
+    assert tmpdir.join('download.bin').read_binary() == local_file.read_binary()
+    ssh_client.run_command('rm -f {}'.format(remote_file))
+
+
+class DirectoryGetFileClient(SSHClient):
+    """Downloads like the container and pod branches of get_file, into a local directory"""
+    def _can_transfer_chunked(self):
+        return False
+
+    def get_file(self, remote_file, local_path='', **kwargs):
+        assert os.path.isdir(local_path)
+        with open(os.path.join(local_path, os.path.basename(remote_file)), 'w') as f:
+            f.write('log line\n')
+
+
+@pytest.mark.parametrize('to_dir', [True, False], ids=['directory', 'file'])
+def test_ssh_client_download_fallback(tmpdir, to_dir):
+    ssh_client = DirectoryGetFileClient(hostname='localhost', username='user', password='pass')
+    local_path = tmpdir if to_dir else tmpdir.join('renamed.log')
+    downloaded = ssh_client.download_file('/var/www/miq/vmdb/log/evm.log', local_path.strpath)
+    local_file = tmpdir.join('evm.log') if to_dir else local_path
+    assert local_file.read() == 'log line\n'
+    assert downloaded.transferred == len('log line\n')
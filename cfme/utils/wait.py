@@ -1,7 +1,14 @@
 from wait_for import wait_for as wait_for_mod, wait_for_decorator as wait_for_decorator_mod
 from wait_for import RefreshTimer, TimedOutError  # NOQA
-from cfme.utils.log import logger
-from functools import partial
+from cfme.utils.log import logger, perflog
+from functools import partial, wraps
+
+
+@wraps(wait_for_mod)
+def wait_for(*args, **kwargs):
+    kwargs.setdefault('logger', logger)
+    with perflog.timer('wait_for'):
+        return wait_for_mod(*args, **kwargs)
+
 
-wait_for = partial(wait_for_mod, logger=logger)
 wait_for_decorator = partial(wait_for_decorator_mod, logger=logger)
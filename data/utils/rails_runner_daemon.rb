@@ -0,0 +1,64 @@
+# Long lived rails runner, started by cfme.utils.ssh.RailsRunnerDaemon
+#
+# Usage: bin/rails runner rails_runner_daemon.rb SOCKET_PATH IDLE_TIMEOUT
+#
+# Listens on a unix socket once the rails environment is loaded. Every connection sends a JSON
+# list like the arguments of bin/rails runner: code or a script path, followed by the script's
+# arguments. The code runs in a forked child, so it gets the booted environment without
+# leaking state into later requests. Its stdout and stderr go to the connection, followed by
+# the exit status after STATUS_MARKER. The daemon exits once it's idle for IDLE_TIMEOUT seconds.
+require 'json'
+require 'socket'
+
+STATUS_MARKER = "\0cfme-rails-runner-status:".freeze
+
+socket_path = ARGV.shift
+idle_timeout = Integer(ARGV.shift || 1800)
+
+File.unlink(socket_path) if File.exist?(socket_path)
+server = UNIXServer.new(socket_path)
+File.chmod(0600, socket_path)
+at_exit { File.unlink(socket_path) if File.exist?(socket_path) }
+ActiveRecord::Base.connection_pool.disconnect!
+
+def run_request(conn)
+  status = 0
+  begin
+    args = JSON.parse(conn.read)
+    code = args.shift.to_s
+    ARGV.replace(args)
+    ActiveRecord::Base.establish_connection
+    # settings may have been changed since the daemon started
+    Vmdb::Settings.reload! if defined?(Vmdb::Settings) && Vmdb::Settings.respond_to?(:reload!)
+    if File.exist?(code)
+      $0 = code
+      load code
+    else
+      eval(code, TOPLEVEL_BINDING, 'rails_runner_daemon')
+    end
+  rescue SystemExit => e
+    status = e.status
+  rescue Exception => e
+    $stderr.puts("#{e.class}: #{e.message}", e.backtrace)
+    status = 1
+  end
+  status
+end
+
+loop do
+  break unless IO.select([server], nil, nil, idle_timeout)
+  conn = server.accept
+  pid = fork do
+    $stdout.reopen(conn)
+    $stderr.reopen(conn)
+    status = run_request(conn)
+    $stdout.flush
+    $stderr.flush
+    conn.write("#{STATUS_MARKER}#{status}")
+    conn.close
+    # skip the at_exit hooks of the daemon
+    exit!(0)
+  end
+  conn.close
+  Process.detach(pid)
+end
@@ -18,27 +18,44 @@
 ``reuse_dir`` if this is False and Artifactor comes across a dir that has
 already been used, it will die
 
+Large ``filedump`` contents (screenshots, page sources...) are kept off the hook channel. If the
+artifactor server runs on this host, they are written straight into a staging directory inside
+the artifact dir and only their path and checksum are sent; the filedump plugin then moves the
+file into place. Otherwise they are streamed to the server in chunks ahead of the filedump hook.
+
 
 """
 import atexit
+import base64
+import hashlib
 import subprocess
+import tempfile
+import uuid
 from threading import RLock
 
 import diaper
 import os
 import pytest
+import six
+from py.path import local
 
 from artifactor import ArtifactorClient
 from cfme.utils.blockers import BZ, Blocker
 from cfme.utils.conf import env, credentials
-from cfme.utils.log import logger
+from cfme.utils.log import artifactor_handler, flush_logs, logger
 from cfme.utils.net import random_port, net_check
+from cfme.utils.path import log_path
 from cfme.utils.wait import wait_for
 from fixtures.pytest_store import write_line, store
 from cfme.markers.polarion import extract_polarion_ids
 
 UNDER_TEST = False  # set to true for artifactor using tests
 
+#: filedump contents larger than this are not sent inline with the hook
+FILEDUMP_INLINE_LIMIT = 64 * 1024
+#: size of the chunks large filedump contents are streamed to a remote artifactor in
+FILEDUMP_CHUNK_SIZE = 1024 * 1024
+
 
 # Create a list of all our passwords for use with the sanitize request later in this module
 # Filter out all Nones as it will mess the output up.
@@ -131,7 +148,6 @@ def pytest_configure(config):
         art_client.ready = True
     else:
         config._art_proc = None
-    from cfme.utils.log import artifactor_handler
     artifactor_handler.artifactor = art_client
     if store.slave_manager:
         artifactor_handler.slaveid = store.slaveid
@@ -143,15 +159,53 @@ def merkyl_setup(request, appliance):
     fire_art_hook(request.config, 'setup_merkyl', ip=appliance.hostname)
 
 
+def _offload_filedump(client, hook_args):
+    """Replaces large filedump contents with a staged file or a chunked transfer"""
+    contents = hook_args.get('contents')
+    if not contents or len(contents) < FILEDUMP_INLINE_LIMIT or hook_args.get('dont_write'):
+        return hook_args
+    if hook_args.get('contents_base64'):
+        data = base64.b64decode(contents)
+    elif isinstance(contents, six.text_type):
+        data = contents.encode('utf-8')
+    else:
+        data = contents
+    hook_args = dict(
+        hook_args, contents='', contents_base64=False, contents_sha1=hashlib.sha1(data).hexdigest())
+
+    art_config = env.get('artifactor', {})
+    if art_config.get('server_address') in ('127.0.0.1', 'localhost'):
+        # same filesystem, write the file into the artifact dir for the artifactor to move
+        staging_dir = local(art_config.get('artifact_dir', log_path.join('artifacts').strpath))
+        staging_dir = staging_dir.ensure('.staging', dir=True)
+        fd, staged_path = tempfile.mkstemp(dir=staging_dir.strpath)
+        with os.fdopen(fd, 'wb') as staged_file:
+            staged_file.write(data)
+        hook_args['contents_path'] = staged_path
+    else:
+        transfer_id = uuid.uuid4().hex
+        for offset in range(0, len(data), FILEDUMP_CHUNK_SIZE):
+            client.fire_hook(
+                'filedump_chunk', transfer_id=transfer_id,
+                chunk=base64.b64encode(data[offset:offset + FILEDUMP_CHUNK_SIZE]))
+        hook_args['contents_transfer'] = transfer_id
+    return hook_args
+
+
 def fire_art_hook(config, hook, **hook_args):
     client = getattr(config, '_art_client', None)
     if client is None:
         assert UNDER_TEST, 'missing artifactor is only valid for inprocess tests'
     else:
+        if hook == 'filedump' and client:
+            hook_args = _offload_filedump(client, hook_args)
         client.fire_hook(hook, **hook_args)
 
 
 def fire_art_test_hook(node, hook, **hook_args):
+    if hook in ('start_test', 'finish_test'):
+        # buffered log records belong to the test which is about to start or finish
+        flush_logs()
     name, location = get_test_idents(node)
     fire_art_hook(
         node.config, hook,
@@ -301,6 +355,7 @@ def shutdown(config):
         with lock:
             proc = config._art_proc
             if proc:
+                flush_logs()
                 if not store.slave_manager:
                     write_line('collecting artifacts')
                     fire_art_hook(config, 'finish_session')
@@ -70,6 +70,8 @@ def pytest_exception_interact(node, call, report):
     entry = call.excinfo.traceback.getcrashentry()
     logger().error(call.excinfo.getrepr(),
         extra={'source_file': entry.path, 'source_lineno': entry.lineno + 1})
+    # don't leave the failure sitting in the queue if the session dies next
+    log.flush_logs()
 
 
 def pytest_sessionfinish(session, exitstatus):
@@ -0,0 +1,45 @@
+"""Session metrics collected with :py:attr:`cfme.utils.log.perflog`
+
+Slaves hand their metrics to the master when they finish, the master (or a session without
+slaves) writes all of them to ``log/metrics.json`` and prints the timers with the highest total
+time in the terminal summary.
+"""
+import json
+
+import pytest
+
+from cfme.utils.log import perflog
+from cfme.utils.path import log_path
+from fixtures.pytest_store import store
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('cfme')
+    group.addoption('--metrics-top', action='store', type=int, default=15,
+        dest='metrics_top',
+        help='number of timers shown in the metrics summary, 0 to hide it')
+
+
+@pytest.mark.tryfirst
+def pytest_sessionfinish(session, exitstatus):
+    # tryfirst, so the slave manager hasn't told the master that it's shutting down yet
+    if store.slave_manager:
+        store.slave_manager.queue_event('metrics', metrics=perflog.metrics.snapshot())
+        return
+    with log_path.join('metrics.json').open('w') as f:
+        json.dump(perflog.metrics.snapshot(), f, indent=2, sort_keys=True)
+
+
+def pytest_terminal_summary(terminalreporter):
+    top = terminalreporter.config.getoption('metrics_top')
+    if store.slave_manager or not top:
+        return
+    timers = perflog.metrics.top_timers(top)
+    if not timers:
+        return
+    terminalreporter.write_sep('=', 'top {} timers'.format(len(timers)))
+    terminalreporter.write_line('{:>10} {:>7} {:>9} {:>9} {:>9}  {}'.format(
+        'total(s)', 'count', 'mean(s)', 'p95(s)', 'max(s)', 'name'))
+    for path, hist in timers:
+        terminalreporter.write_line('{:>10.1f} {:>7} {:>9.2f} {:>9.2f} {:>9.2f}  {}'.format(
+            hist.total, hist.count, hist.mean, hist.percentile(95), hist.max, path))
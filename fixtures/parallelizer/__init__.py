@@ -7,24 +7,62 @@ The Workflow
 - py.test config.option.appliances and the related --appliance cmdline flag are used to count
   the number of needed slaves
 - Slaves are started
-- Master runs collection, blocks until slaves report their collections
-- Slaves each run collection and submit them to the master, then block inside their runtest loop,
-  waiting for tests to run
-- Master diffs slave collections against its own; the test ids are verified to match
+- Master runs collection, writes it to a hash-verified collection manifest, and blocks until
+  slaves report their collections
+- Slaves with a valid manifest submit its hash to the master without collecting anything
+  (slaves without one run a full collection and submit all their test ids), then block inside
+  their runtest loop, waiting for tests to run
+- Master checks slave collections against its own; the test ids are verified to match
   across all nodes
+- Slaves collect a test module when the first of its tests is sent to them, and only send the
+  test ids collected from it if they don't match the manifest, for the master to diff
 - Master enters main runtest loop, uses a generator to build lists of test groups which are then
   sent to slaves, one group at a time
 - For each phase of each test, the slave serializes test reports, which are then unserialized on
   the master and handed to the normal pytest reporting hooks, which is able to deal with test
   reports arriving out of order
+- Test reports and messages are sent to the master in batches without waiting for a reply,
+  only requests for tests and the collection/shutdown handshakes block the slave
 - Before running the last test in a group, the slave will request more tests from the master
 
   - If more tests are received, they are run
   - If no tests are received, the slave will shut down after running its final test
 
+- Appliances can be added to a running session with :py:meth:`ParallelSession.add_appliance`,
+  a slave is started for each of them; :py:meth:`ParallelSession.retire_appliance` stops sending
+  tests to the slave of an appliance so it shuts down after its current tests
 - After all slaves are shut down, the master will do its end-of-session reporting as usual, and
   shut down
 
+Scheduling
+----------
+
+The master records the duration of every test phase reported by the slaves and stores the
+per-test totals in the pytest cache at the end of the session. On the next run, the test groups
+are ordered by their estimated runtime so that the longest groups are dispatched first, which
+keeps one slave from grinding through a long module after all the others have gone idle.
+Tests without any recorded history are estimated using the median known duration.
+
+Each slave preferably gets groups for the providers its appliance already has set up, see
+:py:meth:`ParallelSession.get`.
+
+Once there is nothing left to hand out, a slave asking for tests may take over the not yet
+started second half of another slave's tests, see :py:meth:`ParallelSession.steal_tests`. The
+master asks the other slave to revoke those tests, and hands them to the idle slave once that
+slave confirms which of them it hadn't started yet.
+
+Telemetry
+---------
+
+The master keeps a :py:class:`SlaveTimeline` of what every slave spends its time on: starting up
+and collecting, running tests, waiting for tests and having its providers cleaned up. At the end
+of the session it is written to ``log/slave_timeline.json`` in the Chrome trace event format,
+which can be loaded in ``chrome://tracing`` or Perfetto, and a utilization summary is printed in
+the terminal.
+
+Slaves also send the metrics they recorded with :py:attr:`cfme.utils.log.perflog` when they
+finish, the master merges them into its own (see :py:mod:`fixtures.metrics`).
+
 """
 from itertools import groupby
 
@@ -34,7 +72,7 @@ import json
 import os
 import signal
 import subprocess
-from collections import defaultdict, deque, namedtuple
+from collections import OrderedDict, defaultdict, deque, namedtuple
 from datetime import datetime
 from itertools import count
 
@@ -51,13 +89,16 @@ from fixtures import terminalreporter
 from fixtures.parallelizer import remote
 from fixtures.pytest_store import store
 from cfme.utils import at_exit, conf
-from cfme.utils.log import create_sublogger
-from cfme.utils.path import conf_path
+from cfme.utils.log import create_sublogger, perflog
+from cfme.utils.path import conf_path, log_path
+from cfme.utils.pytest_shortcuts import extract_fixtures_values
 
 # Initialize slaveid to None, indicating this as the master process
 # slaves will set this to a unique string when they're initialized
 conf.runtime['env']['slaveid'] = None
 
+DURATIONS_CACHE_KEY = 'miq-parallelizer/durations'
+
 if not conf.runtime['env'].get('ts'):
     ts = str(time())
     conf.runtime['env']['ts'] = ts
@@ -108,8 +149,16 @@ class SlaveDetail(object):
     id = attr.ib(default=attr.Factory(
         lambda: next(SlaveDetail.slaveid_generator)))
     forbid_restart = attr.ib(default=False, init=False)
+    #: a retiring slave gets no new tests and shuts down once its current tests are done
+    retiring = attr.ib(default=False, init=False)
     tests = attr.ib(default=attr.Factory(set), repr=False)
+    #: tests sent to the slave, for which no logstart was received yet, in order
+    unstarted = attr.ib(default=attr.Factory(OrderedDict), repr=False)
     process = attr.ib(default=None, repr=False)
+    #: sequence number of the last message received from the current slave process
+    last_seq = attr.ib(default=None, init=False, repr=False)
+    #: when the current slave process was started
+    started = attr.ib(default=None, init=False, repr=False)
 
     provider_allocation = attr.ib(default=attr.Factory(list), repr=False)
 
@@ -117,6 +166,8 @@ class SlaveDetail(object):
         if self.forbid_restart:
             return
         devnull = open(os.devnull, 'w')
+        self.last_seq = None
+        self.started = time()
         # worker output redirected to null; useful info comes via messages and logs
         self.process = subprocess.Popen(
             ['python', remote.__file__, self.id, self.appliance.as_json, conf.runtime['env']['ts']],
@@ -130,6 +181,14 @@ class SlaveDetail(object):
 
 
 class ParallelSession(object):
+    #: how many providers a slave's appliance may have set up before it has to be cleansed
+    appliance_num_limit = 1
+    #: minimum number of tests worth stealing from another slave
+    steal_min_tests = 2
+    #: minimum estimated duration in seconds of the tests stolen from another slave,
+    #: so stealing pays for setting up the module scoped fixtures again
+    steal_min_duration = 300
+
     def __init__(self, config, appliances):
         self.config = config
         self.session = None
@@ -145,20 +204,40 @@ class ParallelSession(object):
         self.slaves = {}
         self.test_groups = self._test_item_generator()
 
-        self._pool = []
+        # provider key (None for tests without a provider) -> deque of (estimate, test group),
+        # built on the first dispatch
+        self._pool = None
+        # provider key -> estimated duration of its groups still in the pool
+        self._pool_remaining = defaultdict(float)
+        # nodeid -> key of the provider the test is parametrized with
+        self._test_providers = {}
         from cfme.utils.conf import cfme_data
         self.provs = sorted(set(cfme_data['management_systems'].keys()),
                             key=len, reverse=True)
         self.used_prov = set()
 
+        # test durations from previous sessions, used to send the longest groups first
+        self.durations = config.cache.get(DURATIONS_CACHE_KEY, {})
+        self.session_durations = defaultdict(float)
+        self._default_duration = _median(self.durations.values())
+
+        self.timeline = SlaveTimeline()
+        # slaveid of a slave asked to revoke tests -> (slave waiting for them, its process, tests)
+        self._steals = {}
+
         self.failed_slave_test_groups = deque()
         self.slave_spawn_count = 0
         self.appliances = appliances
+        # appliances handed over by other threads (e.g. sprout), picked up by the slave audit
+        self.pending_appliances = deque()
+        # hostnames of appliances whose slaves are to be retired, also handed over by other threads
+        self.retiring_appliances = deque()
 
         # set up the ipc socket
 
-        zmq_endpoint = 'ipc://{}'.format(
-            config.cache.makedir('parallelize').join(str(os.getpid())))
+        parallelize_dir = config.cache.makedir('parallelize')
+        zmq_endpoint = 'ipc://{}'.format(parallelize_dir.join(str(os.getpid())))
+        self.collection_manifest = parallelize_dir.join('{}-collection.json'.format(os.getpid()))
         ctx = zmq.Context.instance()
         self.sock = ctx.socket(zmq.ROUTER)
         self.sock.bind(zmq_endpoint)
@@ -175,6 +254,7 @@ class ParallelSession(object):
                 use_sprout=False,   # Slaves don't use sprout
             ),
             'zmq_endpoint': zmq_endpoint,
+            'collection_manifest': str(self.collection_manifest),
         }
         if hasattr(self, "slave_appliances_data"):
             conf.runtime['slave_config']["appliance_data"] = self.slave_appliances_data
@@ -188,10 +268,56 @@ class ParallelSession(object):
             self.print_message("using appliance {}".format(self.slaves[slave].appliance.url),
                 slave, green=True)
 
+    def add_appliance(self, appliance):
+        """Add an appliance to the running session, a slave will be started for it
+
+        This is safe to call from other threads, the slave is started by the next slave audit.
+
+        """
+        self.pending_appliances.append(appliance)
+
+    def retire_appliance(self, hostname):
+        """Retire the slave of an appliance, e.g. when it's taken away from the session
+
+        This is safe to call from other threads, the slave is retired by the next slave audit.
+
+        """
+        self.retiring_appliances.append(hostname)
+
+    def retire_slave(self, slaveid):
+        """Stop sending tests to a slave, it will shut down after finishing its current tests"""
+        slave = self.slaves[slaveid]
+        slave.retiring = True
+        self.print_message('retiring {}'.format(slave.id), slave, yellow=True)
+
+    def _retire_slaves(self):
+        while self.retiring_appliances:
+            hostname = self.retiring_appliances.popleft()
+            for slave in list(self.slaves.values()):
+                if slave.appliance.hostname == hostname and not slave.retiring:
+                    self.retire_slave(slave.id)
+
+    def _add_pending_slaves(self):
+        while self.pending_appliances:
+            appliance = self.pending_appliances.popleft()
+            if self.collection and not self.failed_slave_test_groups and \
+                    self.sent_tests >= len(self.collection):
+                # every test has already been sent, a new slave would only collect and exit
+                self.print_message(
+                    'all tests sent, not using appliance {}'.format(appliance.url), yellow=True)
+                self.config.hook.pytest_miq_node_shutdown(
+                    config=self.config, nodeinfo=appliance.url)
+                continue
+            slave = SlaveDetail(appliance=appliance)
+            self.appliances.append(appliance)
+            self.slaves[slave.id] = slave
+            self.print_message("using appliance {}".format(appliance.url), slave, green=True)
+            slave.start()
+
     def _slave_audit(self):
-        # XXX: There is currently no mechanism to add or remove slave_urls, short of
-        #      firing up the debugger and doing it manually. This is making room for
-        #      planned future abilities to dynamically add and remove slaves via automation
+        # start slaves for appliances added during the session, retire the ones taken away
+        self._add_pending_slaves()
+        self._retire_slaves()
 
         # check for unexpected slave shutdowns and redistribute tests
         for slave in self.slaves.values():
@@ -203,6 +329,8 @@ class ParallelSession(object):
                 else:
                     msg = '{} terminated unexpectedly with status {}, respawning'.format(
                         slave.id, returncode)
+                self.timeline.instant(slave.id, 'respawn', returncode=returncode)
+                slave.unstarted.clear()
                 if slave.tests:
                     failed_tests, slave.tests = slave.tests, set()
                     num_failed_tests = len(failed_tests)
@@ -210,6 +338,8 @@ class ParallelSession(object):
                     msg += ' and redistributing {} tests'.format(num_failed_tests)
                     self.failed_slave_test_groups.append(failed_tests)
                 self.print_message(msg, purple=True)
+                # a slave waiting to steal from this one gets the redistributed tests instead
+                self._hand_over_stolen(slave, [])
 
         # If a slave was terminated for any reason, kill that slave
         # the terminated flag implies the appliance has died :(
@@ -240,6 +370,7 @@ class ParallelSession(object):
 
     def recv(self):
         # poll the zmq socket, populate the recv queue deque with responses
+        # slaves send test reports and messages in batches, without waiting for an ack
 
         events = zmq.zmq_poll([(self.sock, zmq.POLLIN)], 50)
         if not events:
@@ -247,11 +378,23 @@ class ParallelSession(object):
         slaveid, _, event_json = self.sock.recv_multipart(flags=zmq.NOBLOCK)
         event_data = json.loads(event_json)
         event_name = event_data.pop('_event_name')
+        pid = event_data.pop('_pid', None)
+        seq = event_data.pop('_seq', None)
         if slaveid not in self.slaves:
             self.log.error("message from terminated worker %s %s %s",
                            slaveid, event_name, event_data)
             return None, None, None
-        return self.slaves[slaveid], event_data, event_name
+        slave = self.slaves[slaveid]
+        if slave.process is None or slave.process.pid != pid:
+            # queued up by a slave process that has since died and been replaced,
+            # its tests have already been redistributed by the slave audit
+            self.log.warning("message from previous %s process %s %s", slaveid, pid, event_name)
+            return None, None, None
+        if slave.last_seq is not None and seq != slave.last_seq + 1:
+            self.log.error("%s messages out of sequence, expected %s but got %s",
+                           slaveid, slave.last_seq + 1, seq)
+        slave.last_seq = seq
+        return slave, event_data, event_name
 
     def print_message(self, message, prefix='master', **markup):
         """Print a message from a node to the py.test console
@@ -342,12 +485,16 @@ class ParallelSession(object):
 
     def send_tests(self, slave):
         """Send a slave a group of tests"""
-        try:
-            tests = list(self.failed_slave_test_groups.popleft())
-        except IndexError:
-            tests = self.get(slave)
+        if slave.retiring:
+            tests = []
+        else:
+            try:
+                tests = list(self.failed_slave_test_groups.popleft())
+            except IndexError:
+                tests = self.get(slave)
         self.send(slave, tests)
         slave.tests.update(tests)
+        slave.unstarted.update((test, None) for test in tests)
         collect_len = len(self.collection)
         tests_len = len(tests)
         self.sent_tests += tests_len
@@ -371,7 +518,7 @@ class ParallelSession(object):
         # If reporter() gave us a fake terminal reporter in __init__, the real
         # terminal reporter is registered by now
         self.terminal = store.terminalreporter
-        self.trdist = TerminalDistReporter(self.config, self.terminal)
+        self.trdist = TerminalDistReporter(self.config, self.terminal, self.timeline)
         self.config.pluginmanager.register(self.trdist, "terminaldistreporter")
         self.session = session
 
@@ -388,6 +535,13 @@ class ParallelSession(object):
         """
         # Build master collection for slave diffing and distribution
         self.collection = [item.nodeid for item in self.session.items]
+        for item in self.session.items:
+            provider = extract_fixtures_values(item).get('provider')
+            if getattr(provider, 'key', None):
+                self._test_providers[item.nodeid] = provider.key
+        self.collection_hash = remote.collection_hash(self.collection)
+        remote.write_collection_manifest(
+            self.collection_manifest, self.config.rootdir, self.collection)
 
         # Fire up the workers after master collection is complete
         # master and the first slave share an appliance, this is a workaround to prevent a slave
@@ -415,53 +569,11 @@ class ParallelSession(object):
                     break
 
                 slave, event_data, event_name = self.recv()
-                if event_name == 'message':
-                    message = event_data.pop('message')
-                    markup = event_data.pop('markup')
-                    # messages are special, handle them immediately
-                    self.print_message(message, slave, **markup)
-                    self.ack(slave, event_name)
-                elif event_name == 'collectionfinish':
-                    slave_collection = event_data['node_ids']
-                    # compare slave collection to the master, all test ids must be the same
-                    self.log.debug('diffing {} collection'.format(slave.id))
-                    diff_err = report_collection_diff(
-                        slave.id, self.collection, slave_collection)
-                    if diff_err:
-                        self.print_message(
-                            'collection differs, respawning', slave.id,
-                            purple=True)
-                        self.print_message(diff_err, purple=True)
-                        self.log.error('{}'.format(diff_err))
-                        self.kill(slave)
-                        slave.start()
-                    else:
-                        self.ack(slave, event_name)
-                elif event_name == 'need_tests':
-                    self.send_tests(slave)
-                    self.log.info('starting master test distribution')
-                elif event_name == 'runtest_logstart':
-                    self.ack(slave, event_name)
-                    self.trdist.runtest_logstart(
-                        slave.id,
-                        event_data['nodeid'],
-                        event_data['location'])
-                elif event_name == 'runtest_logreport':
-                    self.ack(slave, event_name)
-                    report = unserialize_report(event_data['report'])
-                    if report.when in ('call', 'teardown'):
-                        slave.tests.discard(report.nodeid)
-                    self.trdist.runtest_logreport(slave.id, report)
-                elif event_name == 'internalerror':
-                    self.ack(slave, event_name)
-                    self.print_message(event_data['message'], slave, purple=True)
-                    self.kill(slave)
-                elif event_name == 'shutdown':
-                    self.config.hook.pytest_miq_node_shutdown(
-                        config=self.config, nodeinfo=slave.appliance.url)
-                    self.ack(slave, event_name)
-                    del self.slaves[slave.id]
-                    self.monitor_shutdown(slave)
+                if event_name == 'batch':
+                    for event in event_data['events']:
+                        self.handle_event(slave, event.pop('_event_name'), event)
+                elif event_name is not None:
+                    self.handle_event(slave, event_name, event_data)
 
                 # total slave spawn count * 3, to allow for each slave's initial spawn
                 # and then each slave (on average) can fail two times
@@ -481,6 +593,174 @@ class ParallelSession(object):
         # Suppress other runtestloop calls
         return True
 
+    def handle_event(self, slave, event_name, event_data):
+        """Handle a single event sent by a slave
+
+        Only the events a slave is waiting on (``collectionfinish``, ``need_tests`` and
+        ``shutdown``) are answered, everything else arrives in batches and isn't acknowledged.
+
+        """
+        if event_name == 'message':
+            message = event_data.pop('message')
+            markup = event_data.pop('markup')
+            self.print_message(message, slave, **markup)
+        elif event_name == 'phase':
+            self.timeline.phase(slave.id, **event_data)
+        elif event_name == 'metrics':
+            perflog.metrics.merge(event_data['metrics'])
+        elif event_name == 'collectionfinish':
+            modules = event_data.get('modules')
+            if modules is None:
+                self.timeline.phase(slave.id, 'startup', slave.started)
+            slave_collection = event_data.get('node_ids')
+            if modules is not None:
+                # the tests the slave collected from these modules didn't match the manifest
+                self.log.debug('diffing {} collection of {}'.format(slave.id, ', '.join(modules)))
+                diff_err = report_collection_diff(
+                    slave.id,
+                    [nodeid for nodeid in self.collection if nodeid.split('::')[0] in modules],
+                    slave_collection)
+            elif slave_collection is None:
+                # the slave collects from the manifest, only the manifest's hash was sent
+                if event_data['node_ids_hash'] == self.collection_hash:
+                    diff_err = None
+                else:
+                    diff_err = '{} collection does not match the manifest\n'.format(slave.id)
+            else:
+                # compare slave collection to the master, all test ids must be the same
+                self.log.debug('diffing {} collection'.format(slave.id))
+                diff_err = report_collection_diff(
+                    slave.id, self.collection, slave_collection)
+            if diff_err:
+                self.print_message(
+                    'collection differs, respawning', slave.id,
+                    purple=True)
+                self.print_message(diff_err, purple=True)
+                self.log.error('{}'.format(diff_err))
+                self.kill(slave)
+                slave.start()
+            else:
+                self.ack(slave, event_name)
+        elif event_name == 'need_tests':
+            if not self.steal_tests(slave):
+                self.send_tests(slave)
+            self.log.info('starting master test distribution')
+        elif event_name == 'revoked':
+            self._hand_over_stolen(slave, event_data['node_ids'])
+        elif event_name == 'runtest_logstart':
+            slave.unstarted.pop(event_data['nodeid'], None)
+            self.trdist.runtest_logstart(
+                slave.id,
+                event_data['nodeid'],
+                event_data['location'])
+        elif event_name == 'runtest_logreport':
+            report = unserialize_report(event_data['report'])
+            if report.when in ('call', 'teardown'):
+                slave.tests.discard(report.nodeid)
+            self.session_durations[report.nodeid] += getattr(report, 'duration', 0)
+            self.trdist.runtest_logreport(slave.id, report)
+        elif event_name == 'internalerror':
+            self.print_message(event_data['message'], slave, purple=True)
+            self.kill(slave)
+        elif event_name == 'shutdown':
+            self.timeline.instant(slave.id, 'shutdown')
+            self._hand_over_stolen(slave, [])
+            self.config.hook.pytest_miq_node_shutdown(
+                config=self.config, nodeinfo=slave.appliance.url)
+            self.ack(slave, event_name)
+            del self.slaves[slave.id]
+            self.monitor_shutdown(slave)
+
+    def steal_tests(self, thief, exclude=()):
+        """Ask another slave to give up the second half of the tests it hasn't started yet
+
+        Tests are only stolen when there's nothing else left to send, from the slave with the
+        most estimated remaining work, if the thief won't need another provider set up for them
+        and their estimated duration is at least :py:attr:`steal_min_duration`. Slaves in
+        ``exclude`` aren't asked.
+
+        Returns:
+            ``True`` if a slave was asked to revoke tests, the thief gets them once it answers
+        """
+        if thief.retiring or self.failed_slave_test_groups or self._pool is None or self._pool:
+            return False
+        candidates = []
+        for victim in self.slaves.values():
+            if victim is thief or victim in exclude or victim.id in self._steals or \
+                    victim.process is None:
+                continue
+            unstarted = list(victim.unstarted)
+            tail = unstarted[len(unstarted) // 2:]
+            if len(tail) < self.steal_min_tests:
+                continue
+            provs = set()
+            for test in tail:
+                provs.update(self._providers_of_test(test))
+            new_provs = provs - set(thief.provider_allocation)
+            if new_provs and (
+                    len(thief.provider_allocation) + len(new_provs) > self.appliance_num_limit):
+                continue
+            estimate = self.estimate_duration(tail)
+            if estimate < self.steal_min_duration:
+                continue
+            candidates.append((estimate, victim, tail))
+        if not candidates:
+            return False
+        estimate, victim, tail = max(candidates, key=lambda candidate: candidate[0])
+        self._steals[victim.id] = (thief, thief.process, tail)
+        self.send(victim, {'revoke': tail})
+        self.print_message('{} asked to hand over {} tests ({:.0f}s) to {}'.format(
+            victim.id, len(tail), estimate, thief.id))
+        return True
+
+    def _hand_over_stolen(self, victim, node_ids):
+        # give the tests revoked by the victim to the slave waiting for them
+        try:
+            thief, thief_process, tail = self._steals.pop(victim.id)
+        except KeyError:
+            return
+        # the victim kept the requested tests it had started already
+        for test in tail:
+            victim.unstarted.pop(test, None)
+        for test in node_ids:
+            victim.tests.discard(test)
+        if thief.id not in self.slaves or thief.process is not thief_process:
+            # the thief has gone away in the meantime, its replacement will ask for tests
+            if node_ids:
+                self.sent_tests -= len(node_ids)
+                self.failed_slave_test_groups.append(node_ids)
+            return
+        if not node_ids:
+            # the victim had already started them, or is gone, try the next one before giving up
+            if not self.steal_tests(thief, exclude=(victim,)):
+                self.send_tests(thief)
+            return
+        self.send(thief, node_ids)
+        thief.tests.update(node_ids)
+        thief.unstarted.update((test, None) for test in node_ids)
+        for test in node_ids:
+            for prov in self._providers_of_test(test):
+                if prov not in thief.provider_allocation:
+                    thief.provider_allocation.append(prov)
+        self.print_message('{} took over {} tests from {}'.format(
+            thief.id, len(node_ids), victim.id))
+
+    def pytest_sessionfinish(self):
+        """Write out the slave timeline, and store the durations recorded in this session"""
+        self.timeline.export(log_path.join('slave_timeline.json'))
+        # the slaves are done, no respawned slave needs the manifest any more
+        self.collection_manifest.check() and self.collection_manifest.remove()
+        if not self.session_durations:
+            return
+        durations = dict(self.durations)
+        durations.update(self.session_durations)
+        self.config.cache.set(DURATIONS_CACHE_KEY, durations)
+        self.log.info('stored durations of {} tests'.format(len(self.session_durations)))
+
+    def estimate_duration(self, test_group):
+        """Estimate the runtime of a test group, based on durations from previous sessions"""
+        return sum(self.durations.get(test, self._default_duration) for test in test_group)
+
     def _test_item_generator(self):
         for tests in self._modscope_item_generator():
             yield tests
@@ -519,69 +799,162 @@ class ParallelSession(object):
                 self.log.info('sent tests with param {} {!r}'.format(id, tests))
                 yield tests
 
+    def _providers_of_test(self, nodeid):
+        try:
+            return [self._test_providers[nodeid]]
+        except KeyError:
+            # the provider isn't a fixture parameter, look for a provider key in the id instead
+            if '[' not in nodeid:
+                return []
+            return [prov for prov in self.provs if prov in nodeid]
+
+    def _build_pool(self):
+        self._pool = OrderedDict()
+        estimated_groups = [
+            (self.estimate_duration(test_group), test_group) for test_group in self.test_groups]
+        # longest groups first; tests without a recorded duration count with the median of the
+        # recorded ones, only without any history all estimates are 0 and the stable sort
+        # keeps the collection order
+        estimated_groups.sort(key=lambda estimated_group: estimated_group[0], reverse=True)
+        for estimate, test_group in estimated_groups:
+            provs = set()
+            for test in test_group:
+                provs.update(self._providers_of_test(test))
+            prov = min(provs) if provs else None
+            self._pool.setdefault(prov, deque()).append((estimate, test_group))
+            self._pool_remaining[prov] += estimate
+        self.used_prov = set(prov for prov in self._pool if prov is not None)
+
+    def _take_group(self, slave, prov):
+        estimate, test_group = self._pool[prov].popleft()
+        if not self._pool[prov]:
+            del self._pool[prov]
+        self._pool_remaining[prov] -= estimate
+        if prov is not None and prov not in slave.provider_allocation:
+            slave.provider_allocation.append(prov)
+        return test_group
+
     def get(self, slave):
+        """Get the next group of tests for a slave
 
-        def provs_of_tests(test_group):
-            found = set()
-            for test in test_group:
-                found.update(pv for pv in self.provs
-                             if '[' in test and pv in test)
-            return sorted(found)
+        Groups are kept in a pool indexed by the provider they use, so picking a group costs the
+        same no matter how many tests were collected. In order of preference, a slave gets:
 
-        if not self._pool:
-            for test_group in self.test_groups:
-                self._pool.append(test_group)
-                self.used_prov.update(provs_of_tests(test_group))
-            if self.used_prov:
-                self.ratio = float(len(self.slaves)) / len(self.used_prov)
-            else:
-                self.ratio = 0.0
+        - the longest group for a provider it already has set up
+        - the longest group that needs no provider, or a provider it has room for
+        - the group of the provider with the most remaining work, preferably one no other slave
+          is using, after removing all providers from its appliance
+
+        """
+        if self._pool is None:
+            self._build_pool()
         if not self._pool:
             return []
-        appliance_num_limit = 1
-        for idx, test_group in enumerate(self._pool):
-            provs = provs_of_tests(test_group)
-            if provs:
-                prov = provs[0]
-                if prov in slave.provider_allocation:
-                    # provider is already with the slave, so just return the tests
-                    self._pool.remove(test_group)
-                    return test_group
-                else:
-                    if len(slave.provider_allocation) >= appliance_num_limit:
-                        continue
-                    else:
-                        # Adding provider to slave since there are not too many
-                        slave.provider_allocation.append(prov)
-                        self._pool.remove(test_group)
-                        return test_group
-            else:
-                # No providers - ie, not a provider parametrized test
-                # or no params, so not parametrized at all
-                self._pool.remove(test_group)
-                return test_group
-
-        # Here means no tests were able to be sent
-        for test_group in self._pool:
-
-            provs = provs_of_tests(test_group)
-            if provs:
-                prov = provs[0]
-                # Already too many slaves with provider
-                app = slave.appliance
-                self.print_message(
-                    'cleansing appliance', slave, purple=True)
-                try:
-                    app.delete_all_providers()
-                except Exception as e:
-                    self.print_message(
-                        'cloud not cleanse', slave, red=True)
-                    self.print_message('error:', e, red=True)
-            slave.provider_allocation = [prov]
-            self._pool.remove(test_group)
-            return test_group
-        assert not self._pool, self._pool
-        return []
+
+        def head_estimate(prov):
+            return self._pool[prov][0][0]
+
+        candidates = [prov for prov in slave.provider_allocation if prov in self._pool]
+        if not candidates:
+            has_room = len(slave.provider_allocation) < self.appliance_num_limit
+            candidates = [prov for prov in self._pool if prov is None or has_room]
+        if candidates:
+            return self._take_group(slave, max(candidates, key=head_estimate))
+
+        # Here means every remaining group needs a provider the slave doesn't have
+        def switch_cost(prov):
+            used_by = sum(prov in other.provider_allocation for other in self.slaves.values())
+            return used_by, -self._pool_remaining[prov]
+
+        prov = min(self._pool, key=switch_cost)
+        app = slave.appliance
+        self.print_message(
+            'cleansing appliance', slave, purple=True)
+        cleanse_started = time()
+        try:
+            app.delete_all_providers()
+        except Exception as e:
+            self.print_message(
+                'cloud not cleanse', slave, red=True)
+            self.print_message('error: {}'.format(e), slave, red=True)
+        self.timeline.phase(slave.id, 'provider cleanup', cleanse_started)
+        slave.provider_allocation = []
+        return self._take_group(slave, prov)
+
+
+class SlaveTimeline(object):
+    """Timestamped phases of every slave in a parallel session
+
+    Phases are stored as Chrome trace events, with one thread per slave. Times are
+    ``time.time()`` timestamps, the master and its slaves share a clock.
+
+    """
+    def __init__(self):
+        self.started = time()
+        self.events = []
+        self.slave_tids = {}
+        #: slaveid -> phase name -> total seconds spent in that phase
+        self.totals = defaultdict(lambda: defaultdict(float))
+        #: slaveid -> [start of the first phase, end of the last phase]
+        self.spans = {}
+
+    def _tid(self, slaveid):
+        return self.slave_tids.setdefault(slaveid, len(self.slave_tids) + 1)
+
+    def _us(self, timestamp):
+        return int((timestamp - self.started) * 1e6)
+
+    def phase(self, slaveid, name, start, end=None, **args):
+        """Record a phase of a slave, which ends now unless ``end`` is given"""
+        if end is None:
+            end = time()
+        self.events.append({
+            'name': name, 'ph': 'X', 'pid': 0, 'tid': self._tid(slaveid),
+            'ts': self._us(start), 'dur': self._us(end) - self._us(start), 'args': args})
+        self.totals[slaveid][name] += end - start
+        span = self.spans.setdefault(slaveid, [start, end])
+        span[0], span[1] = min(span[0], start), max(span[1], end)
+
+    def instant(self, slaveid, name, **args):
+        """Record something that happened to a slave, e.g. a respawn"""
+        self.events.append({
+            'name': name, 'ph': 'i', 's': 't', 'pid': 0, 'tid': self._tid(slaveid),
+            'ts': self._us(time()), 'args': args})
+
+    def utilization(self):
+        """Get the fraction of time every slave spent in each phase
+
+        Time not covered by any phase is reported as ``other``.
+
+        """
+        utilization = {}
+        for slaveid, (start, end) in self.spans.items():
+            total = end - start
+            if total <= 0:
+                continue
+            phases = {name: spent / total for name, spent in self.totals[slaveid].items()}
+            phases['other'] = max(0., 1 - sum(phases.values()))
+            utilization[slaveid] = phases
+        return utilization
+
+    def export(self, path):
+        """Write the timeline as a Chrome trace/Perfetto JSON file"""
+        metadata = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': tid, 'args': {'name': slaveid}}
+            for slaveid, tid in self.slave_tids.items()]
+        with path.open('w') as trace_file:
+            json.dump({'traceEvents': metadata + self.events, 'displayTimeUnit': 'ms'},
+                      trace_file)
+
+
+def _median(values):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.
 
 
 def report_collection_diff(slaveid, from_collection, to_collection):
@@ -625,11 +998,25 @@ class TerminalDistReporter(object):
     slave ID. These hooks are called in :py:class:`ParallelSession`'s runtestloop hook.
 
     """
-    def __init__(self, config, terminal):
+    def __init__(self, config, terminal, timeline=None):
         self.config = config
         self.tr = terminal
+        self.timeline = timeline
         self.outcomes = {}
 
+    def pytest_terminal_summary(self):
+        if self.timeline is None:
+            return
+        utilization = self.timeline.utilization()
+        if not utilization:
+            return
+        self.tr.write_sep('=', 'slave utilization')
+        for slaveid in sorted(utilization):
+            phases = sorted(utilization[slaveid].items(), key=lambda phase: phase[1],
+                            reverse=True)
+            self.tr.write_line('({}) {}'.format(slaveid, ', '.join(
+                '{:.1f}% {}'.format(fraction * 100, name) for name, fraction in phases)))
+
     def runtest_logstart(self, slaveid, nodeid, location):
         test = self.tr._locationline(nodeid, *location)
         prefix = '({}) {}'.format(slaveid, test)
@@ -1,6 +1,13 @@
+import hashlib
 import json
+import os
 import signal
+from collections import OrderedDict, deque
+from itertools import count
+from time import time
 
+import pytest
+import six
 import zmq
 from py.path import local
 
@@ -13,11 +20,30 @@ SLAVEID = None
 
 
 class SlaveManager(object):
-    """SlaveManager which coordinates with the master process for parallel testing"""
-    def __init__(self, config, slaveid, appliance_config, zmq_endpoint):
+    """SlaveManager which coordinates with the master process for parallel testing
+
+    Events that don't need an answer from the master (test reports, messages) are queued and
+    sent to the master in batches without waiting for a reply, so the slave never stalls on the
+    master while running tests. The queue is flushed when a test starts and when it ends, when
+    it grows larger than :py:attr:`batch_size`, when an event is queued after the oldest one
+    waited :py:attr:`batch_interval` seconds, and before every event that does need a reply.
+    There's no timer, the socket must only be used by the thread running the tests.
+
+    With a collection manifest from the master, nothing is collected at startup. A test module
+    is collected once the first of its tests arrives, so a slave only imports and generates the
+    modules it runs tests from.
+
+    """
+    #: Maximum number of events queued before they are sent to the master
+    batch_size = 50
+    #: Age in seconds of the oldest queued event after which queueing another one sends them all
+    batch_interval = 2
+
+    def __init__(self, config, slaveid, appliance_config, zmq_endpoint, manifest=None):
         self.config = config
         self.session = None
         self.collection = None
+        self.manifest = manifest
         self.slaveid = conf.runtime['env']['slaveid'] = slaveid
         self.appliance_config = conf.runtime['env']['appliances'][0] = appliance_config
         self.log = cfme.utils.log.logger
@@ -25,20 +51,66 @@ class SlaveManager(object):
         # Override the logger in utils.log
 
         ctx = zmq.Context.instance()
-        self.sock = ctx.socket(zmq.REQ)
-        self.sock.set_hwm(1)
+        self.sock = ctx.socket(zmq.DEALER)
         self.sock.setsockopt_string(zmq.IDENTITY, u'{}'.format(self.slaveid))
         self.sock.connect(zmq_endpoint)
 
         self.messages = {}
+        # the master uses the pid to drop messages from a previous incarnation of this slave,
+        # and the sequence number to detect lost messages
+        self._pid = os.getpid()
+        self._seq = count()
+        self._queued_events = []
+        self._queued_since = None
+        self._test_started = None
+        # test modules collected so far, when collecting from the manifest
+        self._collected_modules = set()
+        # tests received from the master which haven't been started yet
+        self._pending = deque()
 
         self.quit_signaled = False
 
-    def send_event(self, name, **kwargs):
+    def _send(self, name, **kwargs):
         kwargs['_event_name'] = name
+        kwargs['_pid'] = self._pid
+        kwargs['_seq'] = next(self._seq)
         self.log.trace("sending {} {!r}".format(name, kwargs))
-        self.sock.send_json(kwargs)
-        recv = self.sock.recv_json()
+        # the empty frame is the envelope delimiter expected by the master's ROUTER socket
+        self.sock.send_multipart([b'', json.dumps(kwargs)])
+
+    def queue_event(self, name, **kwargs):
+        """Queue an event for the master, which doesn't need a reply"""
+        kwargs['_event_name'] = name
+        self._queued_events.append(kwargs)
+        if self._queued_since is None:
+            self._queued_since = time()
+        if (len(self._queued_events) >= self.batch_size or
+                time() - self._queued_since >= self.batch_interval):
+            self.flush_events()
+
+    def flush_events(self):
+        """Send all queued events to the master in one batch"""
+        if not self._queued_events:
+            return
+        events, self._queued_events = self._queued_events, []
+        self._queued_since = None
+        self._send('batch', events=events)
+
+    def send_event(self, name, **kwargs):
+        """Send an event to the master and wait for its reply
+
+        Queued events are flushed first, so the master always handles them before this one.
+
+        """
+        self.flush_events()
+        self._send(name, **kwargs)
+        while True:
+            recv = json.loads(self.sock.recv_multipart()[-1])
+            if isinstance(recv, dict) and 'revoke' in recv:
+                # the master may ask for tests back at any time
+                self.revoke(recv['revoke'])
+            else:
+                break
         if recv == 'die':
             self.log.info('Slave instructed to die by master; shutting down')
             raise SystemExit()
@@ -47,21 +119,113 @@ class SlaveManager(object):
             if recv != 'ack':
                 return recv
 
+    def revoke(self, node_ids):
+        """Give tests that haven't been started yet back to the master
+
+        The master is told which of ``node_ids`` were revoked, it hands them to another slave.
+
+        """
+        node_ids = set(node_ids)
+        revoked = [nodeid for nodeid in self._pending if nodeid in node_ids]
+        self._pending = deque(nodeid for nodeid in self._pending if nodeid not in node_ids)
+        self.log.info('revoked {} tests'.format(len(revoked)))
+        self.queue_event('revoked', node_ids=revoked)
+        self.flush_events()
+
+    def _check_revocations(self):
+        # handle any revoke requests the master has sent since the last test
+        while self.sock.poll(0):
+            recv = json.loads(self.sock.recv_multipart()[-1])
+            if isinstance(recv, dict) and 'revoke' in recv:
+                self.revoke(recv['revoke'])
+            elif recv == 'die':
+                self.log.info('Slave instructed to die by master; shutting down')
+                raise SystemExit()
+            else:
+                self.log.warning('unexpected message from master: {!r}'.format(recv))
+
     def message(self, message, **kwargs):
         """Send a message to the master, which should get printed to the console"""
-        self.send_event('message', message=message, markup=kwargs)  # message!
+        self.queue_event('message', message=message, markup=kwargs)  # message!
+        # messages are meant to be seen right away
+        self.flush_events()
+
+    @pytest.mark.tryfirst
+    def pytest_collection(self, session):
+        """pytest collection hook
+
+        - Skips the collection if there's a collection manifest, the modules of the tests are
+          collected once the master sends them, see :py:meth:`_collect_modules`
+
+        """
+        if self.manifest is None:
+            return None
+        session.items = []
+        self.config.hook.pytest_collection_finish(session=session)
+        return True
+
+    @pytest.mark.trylast
+    def pytest_collection_modifyitems(self, session, config, items):
+        """pytest collection hook
+
+        - Deselects the tests which are not in the master's collection manifest
+
+        """
+        if self.manifest is None:
+            return
+        node_ids = set(self.manifest['node_ids'])
+        deselected = [item for item in items if item.nodeid not in node_ids]
+        if deselected:
+            items[:] = [item for item in items if item.nodeid in node_ids]
+            config.hook.pytest_deselected(items=deselected)
 
     def pytest_collection_finish(self, session):
         """pytest collection hook
 
-        - Sends collected tests to the master for comparison
+        - Sends collected tests to the master for comparison, only the hash of the collection
+          manifest is sent if the tests are collected from it
 
         """
         self.log.debug('collection finished')
         self.session = session
         self.collection = {item.nodeid: item for item in session.items}
         terminalreporter.disable()
-        self.send_event("collectionfinish", node_ids=self.collection.keys())
+        if self.manifest is not None:
+            self.send_event("collectionfinish", node_ids_hash=self.manifest['hash'])
+        else:
+            self.send_event("collectionfinish", node_ids=self.collection.keys())
+
+    def _collect_modules(self, node_ids):
+        """Collect the modules of tests sent by the master, which weren't collected yet
+
+        The tests collected from them are checked against the manifest. If they differ, they
+        are sent to the master, which diffs them and replaces this slave.
+
+        """
+        modules = [
+            module for module in OrderedDict.fromkeys(_module_of(nodeid) for nodeid in node_ids)
+            if module not in self._collected_modules]
+        if not modules:
+            return
+        started = time()
+        session = self.session
+        collected_items = session.items
+        # perform_collect would fire pytest_collection_finish again, for every module
+        items = session._perform_collect(
+            [str(self.config.rootdir.join(module)) for module in modules], True)
+        self.config.hook.pytest_collection_modifyitems(
+            session=session, config=self.config, items=items)
+        session.items = collected_items + items
+        session.testscollected = len(session.items)
+        self.collection.update((item.nodeid, item) for item in items)
+        self._collected_modules.update(modules)
+        self.queue_event('phase', name='collection', start=started, end=time())
+
+        node_ids = [item.nodeid for item in items]
+        expected_node_ids = [
+            nodeid for nodeid in self.manifest['node_ids'] if _module_of(nodeid) in modules]
+        if collection_hash(node_ids) != collection_hash(expected_node_ids):
+            self.send_event("collectionfinish", modules=modules, node_ids=node_ids)
 
     def pytest_runtest_logstart(self, nodeid, location):
         """pytest runtest logstart hook
@@ -69,7 +233,10 @@ class SlaveManager(object):
         - sends logstart notice to the master
 
         """
-        self.send_event("runtest_logstart", nodeid=nodeid, location=location)
+        self._test_started = time()
+        self.queue_event("runtest_logstart", nodeid=nodeid, location=location)
+        # the master shows the running test, it'd lag a whole test behind otherwise
+        self.flush_events()
 
     def pytest_runtest_logreport(self, report):
         """pytest runtest logreport hook
@@ -77,8 +244,12 @@ class SlaveManager(object):
         - sends serialized log reports to the master
 
         """
-        self.send_event("runtest_logreport", report=serialize_report(report))
+        self.queue_event("runtest_logreport", report=serialize_report(report))
         if report.when == 'teardown':
+            self.queue_event('phase', name='test', start=self._test_started, nodeid=report.nodeid,
+                             end=time())
+            # test boundary, let the master know how this test went
+            self.flush_events()
             path, lineno, domaininfo = report.location
             test_status = _test_status(_format_nodeid(report.nodeid, False))
             if test_status == "failed":
@@ -112,7 +283,8 @@ class SlaveManager(object):
         self.log.error(msg)
         # Only send the last line (exc type/message) to keep the pytest log clean
         short_tb = 'INTERNALERROR> {}'.format(msg.strip().splitlines()[-1])
-        self.send_event("internalerror", message=short_tb)
+        self.queue_event("internalerror", message=short_tb)
+        self.flush_events()
 
     def pytest_runtestloop(self, session):
         """pytest runtest loop
@@ -154,12 +326,68 @@ class SlaveManager(object):
 
     def _iter_nodes(self):
         while True:
-            node_ids = self.send_event('need_tests')
-            if not node_ids:
-                break
-            for nodeid in node_ids:
-                # TODO: take non-unique node ids into account
-                yield self.collection[nodeid]
+            self._check_revocations()
+            if not self._pending:
+                waiting_started = time()
+                node_ids = self.send_event('need_tests')
+                self.queue_event(
+                    'phase', name='waiting for tests', start=waiting_started, end=time())
+                if not node_ids:
+                    break
+                if self.manifest is not None:
+                    self._collect_modules(node_ids)
+                self._pending.extend(node_ids)
+            # TODO: take non-unique node ids into account
+            yield self.collection[self._pending.popleft()]
+
+
+def _module_of(nodeid):
+    return nodeid.split('::')[0]
+
+
+def collection_hash(node_ids):
+    """Get a hash of a collection, which doesn't depend on the order of the node ids"""
+    digest = hashlib.sha1()
+    for nodeid in sorted(node_ids):
+        if isinstance(nodeid, six.text_type):
+            nodeid = nodeid.encode('utf-8')
+        digest.update(nodeid)
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def write_collection_manifest(path, rootdir, node_ids):
+    """Write the master's collection to ``path``, for the slaves to collect from
+
+    Besides the node ids, the manifest holds the paths of the test modules and a hash of the
+    node ids to verify the manifest with.
+
+    """
+    paths = []
+    for module in OrderedDict.fromkeys(_module_of(nodeid) for nodeid in node_ids):
+        paths.append(str(rootdir.join(module)))
+    manifest = {
+        'hash': collection_hash(node_ids),
+        'node_ids': list(node_ids),
+        'paths': paths,
+    }
+    with open(str(path), 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+
+
+def read_collection_manifest(path):
+    """Read a collection manifest written by :py:func:`write_collection_manifest`
+
+    Returns ``None`` if the manifest doesn't exist or doesn't match its hash.
+
+    """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    if collection_hash(manifest['node_ids']) != manifest['hash']:
+        return None
+    return manifest
 
 
 def serialize_report(rep):
@@ -237,6 +465,13 @@ if __name__ == '__main__':
 
     slave_args = conf.slave_config.pop('args')
     slave_options = conf.slave_config.pop('options')
+    manifest = read_collection_manifest(conf.slave_config.get('collection_manifest'))
+    if manifest is not None:
+        # Nothing is collected up front, but the conftests of the test modules are loaded
+        # from the arguments, the modules are collected as their tests arrive
+        slave_args = manifest['paths']
+    else:
+        slave_log.warning('No valid collection manifest, running a full collection')
     ip_address = appliance.hostname
     appliance_data = conf.slave_config.get("appliance_data", {})
     if ip_address in appliance_data:
@@ -245,7 +480,7 @@ if __name__ == '__main__':
         conf.runtime["cfme_data"]["basic_info"]["appliances_provider"] = provider_name
     config = _init_config(slave_options, slave_args)
     slave_manager = SlaveManager(config, args.slaveid, appliance_config,
-        conf.slave_config['zmq_endpoint'])
+        conf.slave_config['zmq_endpoint'], manifest)
     config.pluginmanager.register(slave_manager, 'slave_manager')
     config.hook.pytest_cmdline_main(config=config)
     signal.signal(signal.SIGQUIT, slave_manager.handle_quit)
@@ -2,6 +2,7 @@ import pytest
 
 import diaper
 from fixtures.pytest_store import store
+from cfme.utils import conf
 from cfme.utils.log import logger
 from cfme.utils import ssh
 
@@ -9,6 +10,17 @@ from cfme.utils import ssh
 @pytest.mark.hookwrapper
 def pytest_sessionfinish(session, exitstatus):
     """Loop through the appliance stack and close ssh connections"""
+    # the slaves share the rails runner daemons they started, the master stops them
+    rails_runner_daemon = conf.env.get('rails_runner', {}).get('daemon', False)
+    if rails_runner_daemon and store.parallelizer_role == 'master':
+        holder = session.config.pluginmanager.get_plugin('appliance-holder')
+        for appliance in getattr(holder, 'appliances', []):
+            with diaper:
+                ssh.RailsRunnerDaemon.from_conf(appliance.ssh_client)
+    if store.parallelizer_role != 'slave':
+        for daemon in list(ssh._rails_runner_daemons.values()):
+            with diaper:
+                daemon.stop()
 
     for ssh_client in store.ssh_clients_to_close:
         logger.debug('Closing ssh connection on %r', ssh_client)
@@ -21,4 +33,5 @@ def pytest_sessionfinish(session, exitstatus):
     for session in ssh._client_session:
         with diaper:
             session.close()
+    ssh.transport_pool.close()
     yield
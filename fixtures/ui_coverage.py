@@ -229,7 +229,7 @@ class CoverageManager(object):
         ssh_client = self.collection_appliance.ssh_client
         ssh_client.run_command('cd /var/www/miq/vmdb/;'
             'tar czf /tmp/ui-coverage-raw.tgz coverage/')
-        ssh_client.get_file('/tmp/ui-coverage-raw.tgz', coverage_results_archive.strpath)
+        ssh_client.download_file('/tmp/ui-coverage-raw.tgz', coverage_results_archive.strpath)
 
     def _upload_coverage_merger(self):
         ssh_client = self.collection_appliance.ssh_client
@@ -247,7 +247,7 @@ class CoverageManager(object):
         ssh_client = self.collection_appliance.ssh_client
         ssh_client.run_command('cd /var/www/miq/vmdb/coverage;'
             'tar czf /tmp/ui-coverage-results.tgz merged/')
-        ssh_client.get_file('/tmp/ui-coverage-results.tgz', coverage_results_archive.strpath)
+        ssh_client.download_file('/tmp/ui-coverage-results.tgz', coverage_results_archive.strpath)
         subprocess.Popen(['/usr/bin/env', 'tar', '-xaf', coverage_results_archive.strpath,
             '-C', coverage_output_dir.strpath]).wait()
 
@@ -300,7 +300,7 @@ def pull_merged_coverage_data(ssh, coverage_dir):
         cmd='cd {}; tar cfz /tmp/merged.tgz merged'.format(coverage_dir),
         error_msg='Could not archive results!')
     logger.info('Grabbing the generated HTML')
-    ssh.get_file('/tmp/merged.tgz', log_path.strpath)
+    ssh.download_file('/tmp/merged.tgz', log_path.strpath)
     logger.info('Locally decompressing the generated HTML')
     subprocess.check_call(
         ['tar', 'xf', log_path.join('merged.tgz').strpath, '-C', log_path.strpath])